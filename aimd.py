@@ -0,0 +1,174 @@
+"""
+AIMD 自适应并发控制：服务器响应正常时并发数加性增长，
+遇到 429 / 503、超时或 Cloudflare "Just a moment" 验证页时乘性减半并暂停一段时间。
+
+用法：
+    with controller.slot() as slot:
+        resp = session.get(url)
+        slot.report(classify_response(resp))
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+
+import metrics
+
+OK = "ok"
+THROTTLE = "throttle"
+ERROR = "error"  # 普通错误（404 等），不影响并发数
+
+THROTTLE_STATUS = {429, 503}
+CHALLENGE_MARKERS = ("Just a moment", "Checking your browser")
+CHALLENGE_MARKER_BYTES = tuple(marker.encode("ascii") for marker in CHALLENGE_MARKERS)
+CHALLENGE_SCAN_BYTES = 16 * 1024  # 验证页的标记在页面开头，只检查这么多字节
+
+
+def is_challenge_text(text: str) -> bool:
+    """页面内容是否为 Cloudflare 验证页"""
+    return any(marker in text for marker in CHALLENGE_MARKERS)
+
+
+def is_challenge_content(content: bytes) -> bool:
+    """响应体开头是否有验证页标记（直接比较原始字节，不解码整页）"""
+    head = content[:CHALLENGE_SCAN_BYTES]
+    return any(marker in head for marker in CHALLENGE_MARKER_BYTES)
+
+
+def classify_response(response, check_body: bool = True) -> str | None:
+    """
+    根据响应判断服务器状态。
+
+    Args:
+        response: requests 响应
+        check_body: 是否检查 HTML 内容中的验证页标记（流式下载时应为 False，避免读取响应体）
+
+    Returns:
+        OK / THROTTLE / ERROR；来自本地缓存的响应返回 None（不反映服务器状态）
+    """
+    if getattr(response, "from_cache", False):
+        return None
+    status = response.status_code
+    if status in THROTTLE_STATUS or response.headers.get("cf-mitigated") == "challenge":
+        return THROTTLE
+    if status >= 400:
+        return ERROR
+    if check_body and "text/html" in response.headers.get("Content-Type", ""):
+        if is_challenge_content(response.content):
+            return THROTTLE
+    return OK
+
+
+def classify_exception(error: BaseException) -> str:
+    """超时视为服务器过载，其他异常视为普通错误"""
+    if isinstance(error, TimeoutError) or "Timeout" in type(error).__name__:
+        return THROTTLE
+    return ERROR
+
+
+class Slot:
+    """一次请求占用的并发名额，请求结束前通过 report() 报告结果"""
+
+    def __init__(self):
+        self.outcome = None
+
+    def report(self, outcome: str | None):
+        self.outcome = outcome
+
+
+class AimdController:
+    """线程安全的 AIMD 并发限制器"""
+
+    def __init__(
+        self,
+        initial: float = 2,
+        minimum: float = 1,
+        maximum: float = 16,
+        increase: float = 1,
+        decrease: float = 0.5,
+        base_backoff: float = 1.0,
+        max_backoff: float = 60.0,
+    ):
+        """
+        Args:
+            initial: 初始并发数
+            minimum: 最小并发数
+            maximum: 最大并发数
+            increase: 每个成功窗口（约等于当前并发数个成功请求）增加的并发数
+            decrease: 被限流时并发数乘以的系数
+            base_backoff: 首次被限流后的暂停时间（秒），连续被限流时翻倍
+            max_backoff: 暂停时间上限（秒）
+        """
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.increase = increase
+        self.decrease = decrease
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+
+        self.in_flight = 0
+        self._successes = 0
+        self._throttles = 0  # 连续被限流次数
+        self._paused_until = 0.0
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+
+    def retry_delay(self) -> float:
+        """重试前应等待的时间：正常时为 0，连续被限流时指数增长"""
+        with self._cond:
+            if self._throttles == 0:
+                return 0.0
+            return min(self.max_backoff, self.base_backoff * 2 ** (self._throttles - 1))
+
+    def acquire(self):
+        start = time.time()
+        with self._cond:
+            while True:
+                wait = self._paused_until - time.time()
+                if wait > 0:
+                    self._cond.wait(wait)
+                elif self.in_flight >= max(self.minimum, int(self.limit)):
+                    self._cond.wait()
+                else:
+                    break
+            self.in_flight += 1
+        # 退避暂停和等待并发名额的时间都算作等待，而不是 I/O
+        metrics.record_wait(time.time() - start, reason="throttle_backoff")
+
+    def release(self, outcome: str | None):
+        with self._cond:
+            self.in_flight -= 1
+            now = time.time()
+            if outcome == OK:
+                self._throttles = 0
+                self._successes += 1
+                if self._successes >= int(self.limit):
+                    self._successes = 0
+                    self.limit = min(self.maximum, self.limit + self.increase)
+            elif outcome == THROTTLE:
+                self._successes = 0
+                # 同一批在途请求同时失败时只算一次
+                if now - self._last_decrease > self.base_backoff:
+                    self._last_decrease = now
+                    self._throttles += 1
+                    self.limit = max(self.minimum, self.limit * self.decrease)
+                    print(f"🐢 服务器限流，并发数降为 {int(self.limit)}")
+                backoff = min(self.max_backoff, self.base_backoff * 2 ** (self._throttles - 1))
+                self._paused_until = max(self._paused_until, now + backoff)
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self):
+        """占用一个并发名额，退出时根据报告的结果调整并发数"""
+        slot = Slot()
+        self.acquire()
+        try:
+            yield slot
+        except BaseException as e:
+            # 抛出异常前已经报告过结果时（例如遇到验证页先报告 THROTTLE 再抛出 ChallengeError）以报告为准
+            if slot.outcome is None:
+                slot.outcome = classify_exception(e)
+            raise
+        finally:
+            self.release(slot.outcome)
@@ -0,0 +1,126 @@
+"""
+提取方式的微基准：在保存的页面上比较“整页解码后 re.search”与 stream_extract 的字节级流式查找，
+报告每页读取的字节数和 CPU 时间。
+
+把浏览器中“另存为”的详情页 / 列表页放到 SAMPLE_DIRECTORY（文件名含 detail / listing 以区分）；
+目录不存在时使用按真实页面结构生成的样本。
+
+用法：
+    python bench_extract.py
+"""
+
+import glob
+import os
+import re
+import time
+
+import stream_extract
+
+SAMPLE_DIRECTORY = "bench_pages"
+ITERATIONS = 200  # 每个样本重复的次数
+SYNTHETIC_SIZE = 150 * 1024  # 生成样本的大小（字节），与真实详情页相近
+LINK_POSITION = 0.2  # 生成的详情页中原图链接出现的位置（占全文的比例）
+
+# 与 new_crawler 原来的做法相同：先解码整页再在 str 上查找
+TEXT_DOWNLOAD_URL = re.compile(r'https://api\.anime-pictures\.net/pictures/download_image/[^\"]+')
+TEXT_POST_ID = re.compile(r'href=["\'](?:\.?/)?posts/(\d+)')
+
+
+def synthetic_detail_page(size: int = SYNTHETIC_SIZE, position: float = LINK_POSITION) -> bytes:
+    link = b'<a href="https://api.anime-pictures.net/pictures/download_image/885356-2280x3980-blue+archive.jpg">'
+    filler = b'<div class="tag"><a href="/posts?search_tag=x&lang=zh-cn">\xe6\xa0\x87\xe7\xad\xbe</a></div>\n'
+    head = filler * int(size * position / len(filler))
+    tail = filler * int(size * (1 - position) / len(filler))
+    return b"<html><body>" + head + link + tail + b"</body></html>"
+
+
+def synthetic_listing_page(posts: int = 80) -> bytes:
+    items = b"".join(
+        b'<a href="/posts/%d?lang=zh-cn"><picture><img src="/thumb/%d.jpg" alt="\xe5\x9b\xbe"></picture></a>\n'
+        % (900000 - i, 900000 - i) for i in range(posts)
+    )
+    return b"<html><body><div id=\"svelte\">" + items + b"</div>" + b"<script>/* data */</script>" * 2000 + b"</body></html>"
+
+
+def load_samples() -> list[tuple[str, str, bytes]]:
+    """返回 (名称, 类型, 内容) 列表"""
+    samples = []
+    for path in sorted(glob.glob(os.path.join(SAMPLE_DIRECTORY, "*.htm*"))):
+        kind = "listing" if "listing" in os.path.basename(path) else "detail"
+        with open(path, 'rb') as f:
+            samples.append((os.path.basename(path), kind, f.read()))
+    if not samples:
+        samples = [
+            ("synthetic-detail", "detail", synthetic_detail_page()),
+            ("synthetic-listing", "listing", synthetic_listing_page()),
+        ]
+    return samples
+
+
+def chunked(data: bytes, size: int = stream_extract.CHUNK_SIZE):
+    for i in range(0, len(data), size):
+        yield data[i:i + size]
+
+
+def cpu_time(func, iterations: int = ITERATIONS) -> float:
+    """平均每次调用的 CPU 时间（微秒）"""
+    start = time.process_time()
+    for _ in range(iterations):
+        func()
+    return (time.process_time() - start) / iterations * 1e6
+
+
+def bench_detail(data: bytes) -> dict:
+    consumed = [0]
+
+    def counting_chunks():
+        for chunk in chunked(data):
+            consumed[0] += len(chunk)
+            yield chunk
+
+    def full():
+        return TEXT_DOWNLOAD_URL.search(data.decode("utf-8", errors="replace"))
+
+    def streamed():
+        consumed[0] = 0
+        return stream_extract.find_first(counting_chunks(), stream_extract.DOWNLOAD_URL_BYTES)
+
+    expected = full()
+    found = streamed()
+    assert (expected is None) == (found is None), "两种方式的结果不一致"
+    return {
+        "bytes_full": len(data),
+        "bytes_stream": consumed[0],
+        "cpu_full_us": cpu_time(full),
+        "cpu_stream_us": cpu_time(streamed),
+    }
+
+
+def bench_listing(data: bytes) -> dict:
+    def full():
+        return list(map(int, TEXT_POST_ID.findall(data.decode("utf-8", errors="replace"))))
+
+    def by_bytes():
+        return stream_extract.extract_post_ids(data)
+
+    assert full() == by_bytes(), "两种方式的结果不一致"
+    # 列表页需要全部 ID，读取的字节数不变，只比较 CPU
+    return {
+        "bytes_full": len(data),
+        "bytes_stream": len(data),
+        "cpu_full_us": cpu_time(full),
+        "cpu_stream_us": cpu_time(by_bytes),
+    }
+
+
+def main():
+    print(f"{'样本':<28}{'读取(整页)':>12}{'读取(流式)':>12}{'CPU 整页(us)':>14}{'CPU 流式(us)':>14}")
+    print("-" * 80)
+    for name, kind, data in load_samples():
+        r = bench_detail(data) if kind == "detail" else bench_listing(data)
+        print(f"{name:<28}{r['bytes_full']:>12}{r['bytes_stream']:>12}"
+              f"{r['cpu_full_us']:>14.1f}{r['cpu_stream_us']:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
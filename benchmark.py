@@ -0,0 +1,155 @@
+"""
+端到端吞吐量基准测试：在本地替身服务器（mock_server.py）上运行真实的爬取和下载代码，
+报告 pages/s、posts/s、MB/s 以及请求延迟的 p50 / p99。不访问外网，可在 CI 上运行。
+
+场景：
+- crawl-detail：new_crawler 逐个访问详情页解析下载链接；
+- crawl-bulk：new_crawler 通过 bulk_resolver 批量解析；
+- download：my_operator_v2 的 http 模式下载循环（HttpDownloadPool）；
+- download-throttled：同上，但服务器随机返回 429 和验证页。
+
+用法：
+    python benchmark.py
+"""
+
+import contextlib
+import io
+import json
+import os
+import re
+import shutil
+import tempfile
+import time
+
+import http_downloader
+import new_crawler
+from aimd import AimdController
+from clearance import ClearanceManager
+from http_downloader import HttpDownloadPool
+from mock_server import LocalSession, MockConfig, MockServer
+from session_pool import SessionPool
+
+BENCH_PAGES = 5  # 每个爬取场景处理的列表页数
+BENCH_CONFIG = MockConfig(posts_per_page=40, image_size=200 * 1024, page_latency=0.02, image_latency=0.02)
+THROTTLED_CONFIG = MockConfig(posts_per_page=40, image_size=200 * 1024, page_latency=0.02, image_latency=0.02,
+                              throttle_rate=0.05, challenge_rate=0.02)
+DOWNLOAD_WORKERS = 8  # 下载场景的线程数
+QUIET = True  # 屏蔽被测代码的逐条输出，只打印结果
+RESULT_FILENAME = "benchmark_results.json"  # 结果写入的文件，便于 CI 比较前后两次运行
+
+LISTING_TEMPLATE = "https://anime-pictures.net/posts?page={page}&lang=zh-cn"
+EMPTY_CLEARANCE = {"cookies": [], "headers": {}}
+
+
+def percentile(values: list[float], p: float) -> float:
+    """最近秩法计算百分位数，values 为空时返回 0"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(p / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def summarize(name: str, elapsed: float, latencies: list[float], pages: int = 0, posts: int = 0,
+              nbytes: int = 0, requests: dict | None = None) -> dict:
+    return {
+        "scenario": name,
+        "seconds": round(elapsed, 3),
+        "pages_per_s": round(pages / elapsed, 2) if pages else None,
+        "posts_per_s": round(posts / elapsed, 2) if posts else None,
+        "mb_per_s": round(nbytes / elapsed / 1024 / 1024, 2) if nbytes else None,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+        "requests": requests or {},
+    }
+
+
+def _quiet():
+    return contextlib.redirect_stdout(io.StringIO()) if QUIET else contextlib.nullcontext()
+
+
+def bench_crawl(name: str, config: MockConfig, pages: int, bulk: bool) -> tuple[dict, list[str]]:
+    """在替身服务器上运行 new_crawler 的列表页 + 链接解析流程"""
+    with MockServer(config) as server:
+        latencies = []
+        saved = (new_crawler.scraper_pool, new_crawler.http_cache, new_crawler.USE_BULK_RESOLVER,
+                 new_crawler.request_controller)
+        new_crawler.scraper_pool = SessionPool(lambda: LocalSession(server.base_url, latencies),
+                                               new_crawler.DETAIL_CONCURRENCY)
+        new_crawler.http_cache = None  # 测的是网络路径，不走磁盘缓存
+        new_crawler.USE_BULK_RESOLVER = bulk
+        new_crawler.request_controller = AimdController(initial=2, maximum=new_crawler.DETAIL_CONCURRENCY)
+        urls = []
+        try:
+            start = time.perf_counter()
+            with _quiet():
+                for page in range(1, pages + 1):
+                    urls.extend(new_crawler.get_download_url_for_page(LISTING_TEMPLATE.format(page=page)))
+            elapsed = time.perf_counter() - start
+        finally:
+            (new_crawler.scraper_pool, new_crawler.http_cache, new_crawler.USE_BULK_RESOLVER,
+             new_crawler.request_controller) = saved
+        result = summarize(name, elapsed, latencies, pages=pages, posts=len(urls),
+                           requests=dict(server.site.counts))
+    return result, urls
+
+
+def bench_download(name: str, config: MockConfig, urls: list[str], workers: int = DOWNLOAD_WORKERS) -> dict:
+    """在替身服务器上运行 HttpDownloadPool 下载所有图片"""
+    download_dir = tempfile.mkdtemp(prefix="bench_")
+    latencies = []
+    with MockServer(config) as server:
+        saved = http_downloader.build_session
+        http_downloader.build_session = lambda clearance, pool_size=1: LocalSession(server.base_url, latencies)
+        try:
+            pool = HttpDownloadPool(
+                ClearanceManager(lambda: EMPTY_CLEARANCE, EMPTY_CLEARANCE),
+                download_dir,
+                workers=workers,
+                controller=AimdController(initial=2, maximum=workers, base_backoff=0.1, max_backoff=2),
+            )
+            items = [(url, re.search(r'download_image/(\d+)', url).group(1)) for url in urls]
+            start = time.perf_counter()
+            with _quiet():
+                success, failed = pool.download_all(items)
+            elapsed = time.perf_counter() - start
+        finally:
+            http_downloader.build_session = saved
+        nbytes = sum(entry.stat().st_size for entry in os.scandir(download_dir) if entry.is_file())
+        counts = dict(server.site.counts, success=success, failed=failed)
+        result = summarize(name, elapsed, latencies, posts=success, nbytes=nbytes, requests=counts)
+    shutil.rmtree(download_dir, ignore_errors=True)
+    return result
+
+
+def print_results(results: list[dict]):
+    print(f"\n{'='*96}")
+    print(f"{'场景':<20}{'耗时(s)':>10}{'pages/s':>10}{'posts/s':>10}{'MB/s':>10}{'p50(ms)':>10}{'p99(ms)':>10}  请求数")
+    print(f"{'-'*96}")
+    for r in results:
+        cells = [r["seconds"], r["pages_per_s"], r["posts_per_s"], r["mb_per_s"], r["p50_ms"], r["p99_ms"]]
+        row = "".join(f"{'-' if c is None else c:>10}" for c in cells)
+        print(f"{r['scenario']:<20}{row}  {r['requests']}")
+    print(f"{'='*96}")
+
+
+def main():
+    print(f"🧪 基准测试：{BENCH_PAGES} 页 × {BENCH_CONFIG.posts_per_page} 个帖子，"
+          f"图片 {BENCH_CONFIG.image_size // 1024} KB，下载线程 {DOWNLOAD_WORKERS}")
+    results = []
+
+    result, urls = bench_crawl("crawl-detail", BENCH_CONFIG, BENCH_PAGES, bulk=False)
+    results.append(result)
+    result, urls = bench_crawl("crawl-bulk", BENCH_CONFIG, BENCH_PAGES, bulk=True)
+    results.append(result)
+    results.append(bench_download("download", BENCH_CONFIG, urls))
+    results.append(bench_download("download-throttled", THROTTLED_CONFIG, urls))
+
+    print_results(results)
+    with open(RESULT_FILENAME, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f"📝 结果已保存到 {RESULT_FILENAME}")
+
+
+if __name__ == "__main__":
+    main()
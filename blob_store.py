@@ -0,0 +1,271 @@
+"""
+按内容寻址的图片存储：同一张图被重新上传成不同帖子时只保存一份。
+
+- 下载时边写边计算 SHA-256，完成后把文件登记到 .blobs/<前两位>/<摘要><扩展名>，
+  帖子文件名只是指向同一份数据的硬链接（不支持硬链接的文件系统上直接把帖子文件当作数据本身登记）；
+- 摘要、大小、ETag 和帖子 ID 的对应关系保存在 blobs.db（SQLite WAL，可多进程共享）；
+- 下载前先看响应头：服务器给出的 SHA-256 校验头或强 ETag 与已知数据一致时不再传输正文；
+  只有大小相同时再比较第一块内容，一致则视为重复并断开连接。
+
+默认关闭（BLOB_STORE = False）。已有的下载目录可以离线去重：
+    python blob_store.py [下载目录]
+"""
+
+import base64
+import hashlib
+import os
+import shutil
+import sqlite3
+import sys
+import threading
+
+from download_watcher import post_id_from_filename
+import storage_layout
+
+BLOB_STORE = False  # HTTP 下载时是否按内容去重
+BLOB_DIRECTORY = ".blobs"  # 位于下载目录下
+BLOB_INDEX_FILENAME = "blobs.db"
+PREFIX_CHECK = True  # 只有大小相同时，是否读取第一块与已知数据比较来判断重复
+PREFIX_CANDIDATES = 4  # 大小相同的已知数据最多比较几个
+HASH_CHUNK_SIZE = 1024 * 1024  # 对已有文件计算摘要时每次读取的字节数
+DEDUP_DIRECTORY = r"D:\VsCodeProjects\Dataset\2Dimages"  # 未指定参数时去重的目录
+
+
+def new_hasher():
+    return hashlib.sha256()
+
+
+def hash_file(path: str, hasher=None):
+    """把文件内容送入 hasher（默认新建），返回 hasher"""
+    hasher = hasher or new_hasher()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            hasher.update(block)
+    return hasher
+
+
+def advertised_digest(headers) -> str | None:
+    """响应头中服务器给出的 SHA-256（十六进制），没有时返回 None"""
+    value = headers.get('X-Checksum-Sha256')
+    if value:
+        return value.strip().lower()
+    # RFC 3230 Digest: sha-256=<base64> / RFC 9530 Repr-Digest: sha-256=:<base64>:
+    for name in ('Repr-Digest', 'Digest'):
+        for part in headers.get(name, '').split(','):
+            algorithm, _, encoded = part.strip().partition('=')
+            if algorithm.lower() == 'sha-256' and encoded:
+                try:
+                    return base64.b64decode(encoded.strip(':')).hex()
+                except ValueError:
+                    continue
+    return None
+
+
+def strong_etag(headers) -> str | None:
+    """强 ETag（弱 ETag 不保证字节一致，不能用来去重）"""
+    etag = headers.get('ETag')
+    if etag and not etag.startswith('W/'):
+        return etag
+    return None
+
+
+def _link(source: str, target: str):
+    """让 target 指向 source 的数据：优先硬链接，不支持时复制"""
+    temp_path = target + ".link"
+    if os.path.exists(temp_path):
+        os.remove(temp_path)
+    try:
+        os.link(source, temp_path)
+    except OSError:
+        shutil.copyfile(source, temp_path)
+    os.replace(temp_path, target)
+
+
+class BlobStore:
+    """内容摘要 -> 数据文件、帖子 ID -> 内容摘要 的持久化索引"""
+
+    def __init__(self, download_dir: str):
+        """
+        Args:
+            download_dir: 下载目录，数据文件和索引都保存在其中
+        """
+        self.download_dir = download_dir
+        self.blob_dir = os.path.join(download_dir, BLOB_DIRECTORY)
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(
+            os.path.join(download_dir, BLOB_INDEX_FILENAME), timeout=30, check_same_thread=False
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS blobs ("
+            "digest TEXT PRIMARY KEY, size INTEGER NOT NULL, path TEXT NOT NULL, etag TEXT)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS blobs_size ON blobs (size)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS blobs_etag ON blobs (etag)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS posts (post_id TEXT PRIMARY KEY, digest TEXT NOT NULL)")
+        self._conn.commit()
+
+    def blob_path(self, digest: str, filename: str) -> str:
+        extension = os.path.splitext(filename)[1].lower()
+        return os.path.join(self.blob_dir, digest[:2], digest + extension)
+
+    def _existing(self, row) -> str | None:
+        """数据文件仍然存在时返回其路径（被手动删除的记录视为不存在）"""
+        if row is None:
+            return None
+        path = os.path.join(self.download_dir, row[0])
+        return path if os.path.exists(path) else None
+
+    def lookup_headers(self, headers) -> str | None:
+        """按响应头中的校验值 / 强 ETag 查找已知数据，返回数据文件路径"""
+        digest = advertised_digest(headers)
+        with self._lock:
+            if digest:
+                row = self._conn.execute("SELECT path FROM blobs WHERE digest = ?", (digest,)).fetchone()
+                return self._existing(row)
+            etag = strong_etag(headers)
+            if etag:
+                row = self._conn.execute("SELECT path FROM blobs WHERE etag = ?", (etag,)).fetchone()
+                return self._existing(row)
+        return None
+
+    def candidates(self, size: int | None) -> list[str]:
+        """大小相同的已知数据（用于比较第一块）"""
+        if not PREFIX_CHECK or not size:
+            return []
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT path FROM blobs WHERE size = ? LIMIT ?", (size, PREFIX_CANDIDATES)
+            ).fetchall()
+        return [path for path in map(self._existing, rows) if path]
+
+    @staticmethod
+    def match_prefix(candidates: list[str], first_chunk: bytes) -> str | None:
+        """返回开头字节与 first_chunk 完全相同的数据文件"""
+        for path in candidates:
+            with open(path, 'rb') as f:
+                if f.read(len(first_chunk)) == first_chunk:
+                    return path
+        return None
+
+    def link_existing(self, blob_path: str, save_path: str) -> str:
+        """不下载，直接让 save_path 指向已有数据并登记帖子"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT digest FROM blobs WHERE path = ?", (os.path.relpath(blob_path, self.download_dir),)
+            ).fetchone()
+        _link(blob_path, save_path)
+        if row:
+            self._record_post(save_path, row[0])
+        return save_path
+
+    def add(self, path: str, digest: str, etag: str | None = None) -> bool:
+        """
+        登记一个下载完成的文件。
+
+        Args:
+            path: 文件路径（文件名中含帖子 ID）
+            digest: 文件内容的 SHA-256（十六进制）
+            etag: 下载时服务器返回的强 ETag
+
+        Returns:
+            是否与已有数据重复（重复时 path 已换成指向已有数据的硬链接）
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT path FROM blobs WHERE digest = ?", (digest,)).fetchone()
+            existing = self._existing(row)
+            if existing and not os.path.samefile(existing, path):
+                _link(existing, path)
+                if etag:
+                    with self._conn:
+                        self._conn.execute("UPDATE blobs SET etag = ? WHERE digest = ? AND etag IS NULL", (etag, digest))
+                self._record_post(path, digest)
+                return True
+
+            if not existing:
+                blob_path = self.blob_path(digest, path)
+                os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+                try:
+                    if os.path.exists(blob_path):
+                        os.remove(blob_path)
+                    os.link(path, blob_path)
+                except OSError:
+                    # 不支持硬链接：帖子文件本身就是这份数据
+                    blob_path = path
+                with self._conn:
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO blobs (digest, size, path, etag) VALUES (?, ?, ?, ?)",
+                        (digest, os.path.getsize(path), os.path.relpath(blob_path, self.download_dir), etag),
+                    )
+            self._record_post(path, digest)
+            return False
+
+    def _record_post(self, path: str, digest: str):
+        post_id = post_id_from_filename(os.path.basename(path))
+        if not post_id:
+            return
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO posts (post_id, digest) VALUES (?, ?)", (post_id, digest))
+
+    def digest_of(self, post_id: str) -> str | None:
+        with self._lock:
+            row = self._conn.execute("SELECT digest FROM posts WHERE post_id = ?", (str(post_id),)).fetchone()
+        return row[0] if row else None
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+_stores: dict[str, BlobStore] = {}
+_stores_lock = threading.Lock()
+
+
+def get_blob_store(download_dir: str) -> BlobStore:
+    """获取下载目录对应的存储（每个进程只打开一次）"""
+    key = os.path.abspath(download_dir)
+    with _stores_lock:
+        store = _stores.get(key)
+        if store is None:
+            store = _stores[key] = BlobStore(download_dir)
+        return store
+
+
+def deduplicate(download_dir: str) -> tuple[int, int]:
+    """
+    对已有的下载目录计算摘要并登记，重复的文件换成硬链接。
+
+    Returns:
+        (重复的文件数, 节省的字节数)
+    """
+    store = get_blob_store(download_dir)
+    duplicates = 0
+    saved = 0
+    scanned = 0
+    for entry in storage_layout.iter_files(download_dir):
+        if not post_id_from_filename(entry.name):
+            continue
+        size = entry.stat().st_size
+        if store.add(entry.path, hash_file(entry.path).hexdigest()):
+            duplicates += 1
+            saved += size
+        scanned += 1
+        if scanned % 1000 == 0:
+            print(f"  -> 已处理 {scanned} 个文件，发现 {duplicates} 个重复...")
+    print(f"✅ 去重完成：处理 {scanned} 个文件，{duplicates} 个重复，节省 {saved / 1024 / 1024:.1f} MB")
+    return duplicates, saved
+
+
+def main():
+    download_dir = sys.argv[1] if len(sys.argv) > 1 else DEDUP_DIRECTORY
+    if not os.path.isdir(download_dir):
+        print(f"❌ 错误: 目录 '{download_dir}' 不存在。")
+        return
+    deduplicate(download_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+"""
+多浏览器下载池：同时运行多个 Edge，每个浏览器有独立的下载目录和用户数据目录。
+
+所有浏览器从同一个队列领取 URL，下载完成后交给协调线程，
+由协调线程把文件移动到最终目录并写入下载索引。
+上次运行中断时留在各浏览器目录里的已完成文件，会在下次启动时先归档。
+适用于必须用浏览器下载（例如仅凭 Cookies 无法通过验证）的情况。
+"""
+
+import os
+import queue
+import threading
+
+import storage_layout
+from aimd import AimdController
+from download_watcher import post_id_from_filename, start_download_watcher
+from my_operator_v2 import (
+    DOWNLOAD_DIRECTORY,
+    FILENAME,
+    MAX_RETRY,
+    check_file_exists,
+    download_image_with_retry,
+    extract_post_id_from_url,
+    mark_as_downloaded,
+    pass_cloudflare,
+    read_download_urls,
+    setup_edge_driver,
+)
+
+BROWSER_WORKERS = 3  # 同时运行的浏览器数量
+WORKER_DIRECTORY = ".workers"  # 各浏览器的下载目录（放在最终目录下，移动文件只需重命名）
+PROFILE_DIRECTORY = "browser_profiles"  # 各浏览器的用户数据目录
+
+
+class BrowserPool:
+    """N 个浏览器共享一个下载队列，协调线程负责归档和记录"""
+
+    def __init__(self, download_dir: str, workers: int = BROWSER_WORKERS, max_retry: int = MAX_RETRY):
+        """
+        Args:
+            download_dir: 最终下载目录
+            workers: 浏览器数量
+            max_retry: 每张图片的最大重试次数
+        """
+        self.download_dir = os.path.abspath(download_dir)
+        self.workers = workers
+        self.max_retry = max_retry
+        self.tasks = queue.Queue()
+        self.results = queue.Queue()
+        self.success = 0
+        self.failed = 0
+        # 所有浏览器共享，被限流时一起降速
+        self.controller = AimdController(initial=1, maximum=workers)
+
+    def _worker(self, worker_id: int):
+        """单个浏览器：领取任务、下载到自己的目录、把结果交给协调线程"""
+        worker_dir = os.path.join(self.download_dir, WORKER_DIRECTORY, f"worker{worker_id}")
+        profile_dir = os.path.abspath(os.path.join(PROFILE_DIRECTORY, f"worker{worker_id}"))
+        os.makedirs(worker_dir, exist_ok=True)
+        os.makedirs(profile_dir, exist_ok=True)
+
+        print(f"🚀 [浏览器 {worker_id}] 正在启动...")
+        driver = None
+        watcher = None
+        task = None  # 正在处理的任务，浏览器出错退出时计为失败
+        try:
+            driver = setup_edge_driver(worker_dir, profile_dir)
+            watcher = start_download_watcher(worker_dir)
+            pass_cloudflare(driver)
+            while True:
+                task = self.tasks.get()
+                if task is None:
+                    break
+                url, post_id, index, total = task
+                ok = download_image_with_retry(
+                    driver, url, post_id, worker_dir, index, total,
+                    self.max_retry, record=False, watcher=watcher,
+                    controller=self.controller
+                )
+                self.results.put((post_id, worker_dir if ok else None))
+                task = None
+        except Exception as e:
+            print(f"❌ [浏览器 {worker_id}] 发生错误，退出: {e}")
+            if task is not None:
+                # 已经领取的任务不会再被其他浏览器处理，在这里计为失败
+                self.results.put((task[1], None))
+        finally:
+            if watcher is not None:
+                watcher.stop()
+            if driver is not None:
+                driver.quit()
+
+    def _archive(self, post_id: str, path: str):
+        """把浏览器目录中的文件移动到最终目录并写入下载索引"""
+        storage_layout.place(self.download_dir, path)
+        mark_as_downloaded(self.download_dir, post_id)
+
+    def sweep_workers(self) -> set[str]:
+        """
+        归档上次运行留在各浏览器目录中的已完成文件（未完成的临时文件保持不动）。
+
+        Returns:
+            归档的帖子 ID
+        """
+        root = os.path.join(self.download_dir, WORKER_DIRECTORY)
+        if not os.path.isdir(root):
+            return set()
+        archived = set()
+        with os.scandir(root) as workers:
+            worker_dirs = [entry.path for entry in workers if entry.is_dir()]
+        for worker_dir in worker_dirs:
+            # 浏览器目录也可能按分片布局存放
+            for entry in list(storage_layout.iter_files(worker_dir)):
+                post_id = post_id_from_filename(entry.name)
+                if not post_id:
+                    continue
+                try:
+                    self._archive(post_id, entry.path)
+                    archived.add(post_id)
+                except Exception as e:
+                    print(f"⚠️ 归档 {entry.path} 时出错: {e}")
+        if archived:
+            print(f"📦 已归档上次留在浏览器目录中的 {len(archived)} 个文件")
+        return archived
+
+    def _coordinator(self):
+        """把各浏览器下载完成的文件移动到最终目录并记录（单个文件出错只计为失败，不影响后续文件）"""
+        while True:
+            item = self.results.get()
+            if item is None:
+                break
+            post_id, worker_dir = item
+            if worker_dir is None:
+                self.failed += 1
+                continue
+
+            try:
+                # 文件可能还在浏览器的落地目录，也可能已被移到分片子目录
+                path = storage_layout.find_post(worker_dir, post_id)
+                if path is not None:
+                    self._archive(post_id, path)
+                    self.success += 1
+                else:
+                    print(f"⚠️ 找不到 ID {post_id} 的下载文件")
+                    self.failed += 1
+            except Exception as e:
+                # 文件留在浏览器目录中，下次启动时由 sweep_workers() 归档
+                print(f"⚠️ 归档 ID {post_id} 时出错: {e}")
+                self.failed += 1
+
+    def download_all(self, items: list[tuple[str, str]]) -> tuple[int, int]:
+        """
+        用浏览器池下载所有图片。
+
+        Args:
+            items: (url, post_id) 列表
+
+        Returns:
+            (成功数, 失败数)
+        """
+        # 已经从浏览器目录归档的不再下载，直接计为成功
+        swept = self.sweep_workers()
+        if swept:
+            self.success += sum(1 for _, post_id in items if str(post_id) in swept)
+            items = [(url, post_id) for url, post_id in items if str(post_id) not in swept]
+        for index, (url, post_id) in enumerate(items, 1):
+            self.tasks.put((url, post_id, index, len(items)))
+        for _ in range(self.workers):
+            self.tasks.put(None)
+
+        coordinator = threading.Thread(target=self._coordinator, name="coordinator", daemon=True)
+        coordinator.start()
+        workers = [
+            threading.Thread(target=self._worker, args=(i,), name=f"browser-{i}", daemon=True)
+            for i in range(self.workers)
+        ]
+        for t in workers:
+            t.start()
+        for t in workers:
+            t.join()
+
+        # 所有浏览器都异常退出时，剩下的任务计为失败
+        while not self.tasks.empty():
+            if self.tasks.get() is not None:
+                self.results.put((None, None))
+
+        self.results.put(None)
+        coordinator.join()
+        return self.success, self.failed
+
+
+def main():
+    if not os.path.exists(DOWNLOAD_DIRECTORY):
+        os.makedirs(DOWNLOAD_DIRECTORY)
+        print(f"📁 创建下载目录: {DOWNLOAD_DIRECTORY}")
+
+    urls = read_download_urls(FILENAME)
+    pending = []
+    skip_count = 0
+    for target_url in urls:
+        post_id = extract_post_id_from_url(target_url)
+        if not post_id or check_file_exists(DOWNLOAD_DIRECTORY, post_id)[0]:
+            skip_count += 1
+            continue
+        pending.append((target_url, post_id))
+
+    if not pending:
+        print("❌ 没有需要下载的 URL，程序结束。")
+        return
+
+    print(f"\n{'='*60}")
+    print(f"使用 {BROWSER_WORKERS} 个浏览器下载 {len(pending)} 个文件到: {DOWNLOAD_DIRECTORY}")
+    print(f"{'='*60}")
+
+    try:
+        success_count, fail_count = BrowserPool(DOWNLOAD_DIRECTORY).download_all(pending)
+    except KeyboardInterrupt:
+        print("\n\n⚠️ 用户中断下载")
+        return
+
+    print(f"\n{'='*60}")
+    print("📊 下载统计:")
+    print(f"   ✅ 成功: {success_count} 个")
+    print(f"   🟢 跳过: {skip_count} 个")
+    print(f"   ❌ 失败: {fail_count} 个")
+    print(f"   📝 总计: {len(urls)} 个")
+    print(f"{'='*60}")
+
+
+if __name__ == "__main__":
+    main()
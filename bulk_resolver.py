@@ -0,0 +1,89 @@
+"""
+批量把帖子 ID 解析为原图下载链接，尽量少发请求。
+
+解析顺序：
+1. 列表页响应中已经内嵌的下载链接（SvelteKit 页面会把帖子数据序列化进 <script>）；
+2. 站点 JSON API 的同一页列表数据（一个请求覆盖整页）；
+3. 前两步都没有解析到的 ID，才逐个访问详情页。
+
+下载链接本身包含帖子 ID（download_image/<id>-<宽>x<高>-...），
+所以无论 HTML 还是 JSON，只需在响应文本里找链接即可建立 ID -> 链接的映射。
+"""
+
+import re
+from urllib.parse import urlsplit, urlunsplit
+
+API_BASE = "https://api.anime-pictures.net"  # 换成本地替身服务器地址即可离线测试
+API_LISTING_PATH = "/api/v3/posts"
+# JSON 中的 / 可能被转义为 \/，匹配前先还原
+DOWNLOAD_URL_PATTERN = re.compile(
+    r'https://api\.anime-pictures\.net/pictures/download_image/(\d+)-[^"\'\s<>\\]+'
+)
+
+
+def extract_download_urls(text: str) -> dict[int, str]:
+    """从任意响应文本（HTML 或 JSON）中提取 帖子ID -> 下载链接"""
+    text = text.replace('\\/', '/')
+    found = {}
+    for match in DOWNLOAD_URL_PATTERN.finditer(text):
+        found.setdefault(int(match.group(1)), match.group(0))
+    return found
+
+
+def api_url_for_listing(page_url: str, api_base: str = API_BASE) -> str:
+    """把列表页 URL 换成 JSON API 的同一页（保留查询参数）"""
+    base = urlsplit(api_base)
+    query = urlsplit(page_url).query
+    return urlunsplit((base.scheme, base.netloc, base.path.rstrip('/') + API_LISTING_PATH, query, ""))
+
+
+class BulkResolver:
+    """按 列表页内嵌数据 -> JSON API -> 详情页 的顺序批量解析下载链接"""
+
+    def __init__(self, fetch, detail_fallback, api_base: str | None = API_BASE):
+        """
+        Args:
+            fetch: 访问页面的函数 fetch(url) -> 响应（需有 status_code 和 text）
+            detail_fallback: 逐个访问详情页的函数 detail_fallback(ids) -> 与 ids 对应的链接列表
+            api_base: JSON API 地址，为 None 时不使用 API
+        """
+        self.fetch = fetch
+        self.detail_fallback = detail_fallback
+        self.api_base = api_base
+
+    def resolve(self, ids: list[int], page_url: str, listing_text: str = "") -> list[str | None]:
+        """
+        解析一整页帖子的下载链接。
+
+        Args:
+            ids: 列表页中的帖子 ID（按列表顺序）
+            page_url: 列表页 URL（用于构造 API 请求）
+            listing_text: 已经取得的列表页响应文本
+
+        Returns:
+            与 ids 一一对应的下载链接列表，解析失败的位置为 None
+        """
+        found = extract_download_urls(listing_text) if listing_text else {}
+        from_listing = sum(1 for post_id in ids if post_id in found)
+
+        from_api = 0
+        if self.api_base and any(post_id not in found for post_id in ids):
+            try:
+                resp = self.fetch(api_url_for_listing(page_url, self.api_base))
+                if resp.status_code == 200:
+                    api_found = extract_download_urls(resp.text)
+                    for post_id in ids:
+                        if post_id not in found and post_id in api_found:
+                            found[post_id] = api_found[post_id]
+                            from_api += 1
+            except Exception as e:
+                print(f"访问列表 API 时发生错误: {e}")
+
+        missing = [post_id for post_id in ids if post_id not in found]
+        if missing:
+            for post_id, url in zip(missing, self.detail_fallback(missing)):
+                if url:
+                    found[post_id] = url
+
+        print(f"  -> 列表页内嵌 {from_listing} 个，API {from_api} 个，详情页回退 {len(missing)} 个。")
+        return [found.get(post_id) for post_id in ids]
@@ -0,0 +1,108 @@
+"""
+Cloudflare 验证凭据（Cookies + User-Agent）的集中管理。
+
+- 记录凭据的获取时间和 cf_clearance 的过期时间，快过期时主动刷新；
+- 统一判断响应是否为验证页；
+- 同一时间只有一个线程执行刷新，其他线程等待它完成后直接使用新凭据。
+"""
+
+import threading
+import time
+
+import metrics
+from aimd import is_challenge_content
+
+CLEARANCE_COOKIE = "cf_clearance"
+CLEARANCE_MAX_AGE = 30 * 60  # 没有过期时间信息时，凭据最多使用多久（秒）
+EXPIRY_MARGIN = 60  # 距离过期不到多少秒时提前刷新
+MIN_REFRESH_INTERVAL = 30  # 两次刷新之间的最短间隔（秒），间隔内的刷新请求直接复用刚拿到的凭据
+
+
+class ChallengeError(Exception):
+    """请求被 Cloudflare 验证页拦截"""
+
+
+def is_challenge_response(response, check_body: bool = True) -> bool:
+    """
+    响应是否为 Cloudflare 验证页。
+
+    Args:
+        response: requests 响应
+        check_body: 是否读取 HTML 内容检查验证页标记（流式下载图片时为 False）
+    """
+    if response.headers.get("cf-mitigated") == "challenge":
+        return True
+    if "text/html" not in response.headers.get("Content-Type", ""):
+        return False
+    if response.status_code in (403, 503):
+        return True
+    return check_body and is_challenge_content(response.content)
+
+
+class ClearanceManager:
+    """线程安全的验证凭据管理器，刷新操作单飞（single-flight）"""
+
+    def __init__(self, refresh_fn, clearance: dict | None = None):
+        """
+        Args:
+            refresh_fn: 重新通过验证并返回新凭据的函数 refresh_fn() -> {"cookies": [...], "headers": {...}}
+            clearance: 已有的凭据，为 None 时立即调用 refresh_fn 获取
+        """
+        self.refresh_fn = refresh_fn
+        self._lock = threading.Lock()
+        self._listeners = []
+        self.generation = 0
+        self.clearance = None
+        self.obtained_at = 0.0
+        self.expires_at = 0.0
+        if clearance is not None:
+            self._set(clearance)
+        else:
+            self.refresh(self.generation)
+
+    def _set(self, clearance: dict):
+        now = time.time()
+        self.clearance = clearance
+        self.obtained_at = now
+        self.expires_at = now + CLEARANCE_MAX_AGE
+        for cookie in clearance["cookies"]:
+            if cookie["name"] == CLEARANCE_COOKIE and cookie.get("expiry"):
+                self.expires_at = min(self.expires_at, float(cookie["expiry"]))
+        self.generation += 1
+
+    def subscribe(self, callback):
+        """注册回调 callback(clearance)，每次刷新成功后调用（例如同步到所有 Session）"""
+        self._listeners.append(callback)
+
+    def current(self) -> tuple[int, dict]:
+        """返回 (版本号, 凭据)，凭据快过期时先刷新"""
+        generation = self.generation
+        if time.time() > self.expires_at - EXPIRY_MARGIN:
+            self.refresh(generation)
+        return self.generation, self.clearance
+
+    def refresh(self, seen_generation: int) -> dict:
+        """
+        刷新凭据。
+
+        Args:
+            seen_generation: 调用方发现凭据失效时所用的版本号；
+                如果在等待锁期间已经被其他线程刷新过（或刚刚刷新过），直接返回新凭据
+
+        Returns:
+            最新的凭据
+        """
+        with self._lock:
+            if self.generation != seen_generation:
+                return self.clearance
+            if self.clearance is not None and time.time() - self.obtained_at < MIN_REFRESH_INTERVAL:
+                return self.clearance
+
+            print("🔄 正在刷新 Cloudflare 凭据...")
+            with metrics.stage("clearance_refresh"):
+                self._set(self.refresh_fn())
+            clearance = self.clearance
+
+        for callback in self._listeners:
+            callback(clearance)
+        return clearance
@@ -0,0 +1,56 @@
+"""
+增量爬取状态：记录每个查询已经见过的最新帖子 ID（高水位）。
+
+按日期排序的查询中新帖子总在前面，且帖子 ID 随时间递增，
+所以 ID 不超过高水位的帖子都是上次运行时已经处理过的。
+"""
+
+import json
+import os
+import time
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+STATE_FILENAME = "crawl_state.json"
+
+
+def query_key(base_url_template: str) -> str:
+    """去掉 page 参数并规范化，得到代表同一个查询的键"""
+    parts = urlsplit(base_url_template)
+    params = sorted((k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if k != "page")
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path, urlencode(params), ""))
+
+
+def is_date_ordered(base_url_template: str) -> bool:
+    """查询是否按日期排序（只有这种查询才能用高水位提前停止）"""
+    params = dict(parse_qsl(urlsplit(base_url_template).query))
+    return params.get("order_by", "date") == "date"
+
+
+class CrawlState:
+    """每个查询的高水位，保存在 JSON 文件中"""
+
+    def __init__(self, path: str = STATE_FILENAME):
+        self.path = path
+        self.queries = {}
+        if os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    self.queries = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"⚠️ 读取 {path} 时出错，将从头开始: {e}")
+
+    def high_water(self, key: str) -> int:
+        return self.queries.get(key, {}).get("high_water", 0)
+
+    def update(self, key: str, high_water: int):
+        """更新高水位并立即写盘（先写临时文件再替换）"""
+        if high_water <= self.high_water(key):
+            return
+        self.queries[key] = {
+            "high_water": high_water,
+            "updated_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        }
+        temp_path = self.path + ".tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.queries, f, ensure_ascii=False, indent=2)
+        os.replace(temp_path, self.path)
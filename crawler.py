@@ -3,13 +3,14 @@
 """
 
 import time
-import random
 import undetected_chromedriver as uc #防cf检测浏览器对象
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.wait import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
+from selenium.common.exceptions import TimeoutException
 import login
 import set_maxpage
+import waits
 
 
 url = "https://anime-pictures.net/posts?page={}&search_tag=girl&order_by=rating&ldate=4&lang=zh-cn"
@@ -41,24 +42,36 @@ class photos:
         if login_flag == 1:
             username,password = input("输入账号密码(username-password):").split("-")
             login.login(driver=self.driver,username=username,password=password)
-            time.sleep(random.uniform(2, 4))
             set_maxpage.set(driver=self.driver, number=self.number)
 
-        time.sleep(random.uniform(2, 4))
         #运行隐藏参数js
         # self.driver.execute_cdp_cmd('Page.addScriptToEvaluateOnNewDocument', {'source': js})
     def page(self,count):
-        #加载页面
+        #加载页面（礼貌间隔加在每次跳转之前）
+        waits.pace()
         self.driver.get(self.url.format(count))
         # 等待页面加载
         print(f"________________________{count}________________________")
-        time.sleep(random.uniform(1, 2))
+        waits.wait_for_page_ready(self.driver)
     
     def get_page(self):
         #加载页面
+        waits.pace()
         self.driver.get("https://api.anime-pictures.net/pictures/download_image/885356-2280x3980-blue+archive-yuuka+(blue+archive)-dasiu-single-long+hair-tall+image.jpg")
         # 等待页面加载
-        time.sleep(random.uniform(1, 2))
+        waits.wait_for_page_ready(self.driver)
+
+    def wait_thumbnails(self, left_url=None, left_element=None):
+        # 返回列表页后等待缩略图重新出现
+        # 详情页上也有 picture img，先确认已经离开详情页（元素失效或 URL 变化），否则等待会立即成立
+        try:
+            if left_element is not None:
+                waits.wait_for(self.driver, EC.staleness_of(left_element))
+            elif left_url is not None:
+                waits.wait_for(self.driver, EC.url_changes(left_url))
+            waits.wait_for_element(self.driver, (By.CSS_SELECTOR, "#svelte picture img"))
+        except TimeoutException:
+            pass
 
     def all(self, last_number):
         # 等待图片区域加载
@@ -73,9 +86,9 @@ class photos:
                 link = links[i]
                 # 滚动到元素位置（确保不在屏幕外）
                 self.driver.execute_script("arguments[0].scrollIntoView({block: 'center'});", link)
-                time.sleep(random.uniform(0.5, 1))
                 
-                # 使用 JS 点击缩略图链接
+                # 使用 JS 点击缩略图链接（进入详情页，先补足礼貌间隔）
+                waits.pace()
                 self.driver.execute_script("arguments[0].click();", link)
 
                 # 等待并点击原图下载链接
@@ -85,16 +98,18 @@ class photos:
                 # 使用 JS 点击原图下载链接
                 self.driver.execute_script("arguments[0].click();", original_link)
 
+                waits.pace()
                 self.driver.back()
-                time.sleep(random.uniform(1, 2))
+                self.wait_thumbnails(left_element=original_link)
 
                 # 重要：重新获取 links，避免 StaleElementReferenceException
                 links = self.driver.find_elements(By.XPATH, '//*[@id="svelte"]//a[.//picture/img]')
                 print(i + 1, end=" ")
             except Exception as e:
                 print(f"\nError on {i+1}: {str(e)[:50]}")
+                current_url = self.driver.current_url
                 self.driver.back()
-                time.sleep(1)
+                self.wait_thumbnails(left_url=current_url)
                 links = self.driver.find_elements(By.XPATH, '//*[@id="svelte"]//a[.//picture/img]')
         print()
 
@@ -0,0 +1,125 @@
+"""
+基于文件系统事件的下载完成检测。
+
+监听下载目录的创建/重命名事件（Linux 上为 inotify，Windows 上为 ReadDirectoryChangesW），
+浏览器把 .crdownload 重命名为最终文件名的那一刻即判定该帖子下载完成，不再轮询扫描整个目录。
+"""
+
+import os
+import re
+import threading
+
+try:
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+except ImportError:
+    Observer = None
+    FileSystemEventHandler = object
+
+TEMP_SUFFIXES = ('.crdownload', '.tmp', '.partial', '.part')
+# 文件名形如 ANIME-PICTURES.NET_-_885356-2280x3980-xxx.jpg，取尺寸前面的数字作为帖子 ID
+POST_ID_PATTERN = re.compile(r'(\d+)-\d+x\d+')
+
+
+def post_id_from_filename(filename: str) -> str | None:
+    """从已完成的下载文件名中提取帖子 ID，临时文件返回 None"""
+    if filename.endswith(TEMP_SUFFIXES):
+        return None
+    match = POST_ID_PATTERN.search(filename)
+    return match.group(1) if match else None
+
+
+class _Handler(FileSystemEventHandler):
+    def __init__(self, watcher: "DownloadWatcher"):
+        super().__init__()
+        self.watcher = watcher
+
+    def on_created(self, event):
+        if not event.is_directory:
+            self.watcher.notify(event.src_path)
+
+    def on_moved(self, event):
+        if not event.is_directory:
+            self.watcher.notify(event.dest_path)
+
+
+class DownloadWatcher:
+    """监听下载目录，按帖子 ID 通知下载完成"""
+
+    def __init__(self, download_dir: str):
+        self.download_dir = download_dir
+        self._lock = threading.Lock()
+        self._events: dict[str, threading.Event] = {}
+        self._paths: dict[str, str] = {}
+        self._observer = None
+
+    def start(self) -> "DownloadWatcher":
+        self._observer = Observer()
+        self._observer.schedule(_Handler(self), self.download_dir, recursive=False)
+        self._observer.start()
+        return self
+
+    def stop(self):
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer.join()
+            self._observer = None
+
+    def __enter__(self) -> "DownloadWatcher":
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _event(self, post_id: str) -> threading.Event:
+        with self._lock:
+            event = self._events.get(post_id)
+            if event is None:
+                event = self._events[post_id] = threading.Event()
+            return event
+
+    def notify(self, path: str):
+        """
+        文件出现或被重命名时调用。
+
+        只记录已通过 expect() 登记的帖子；其他文件（手动复制、分片移动、重新下载前挪开的旧文件等）
+        直接忽略，不会留下无人领取的 Event 和路径，也不会让之后的 wait() 拿到旧文件。
+        """
+        post_id = post_id_from_filename(os.path.basename(path))
+        if not post_id:
+            return
+        with self._lock:
+            event = self._events.get(post_id)
+            if event is None:
+                return
+            self._paths[post_id] = path
+        event.set()
+
+    def expect(self, post_id: str):
+        """在触发下载之前登记，避免下载太快导致错过事件（同一帖子重试时清除上次的结果）"""
+        with self._lock:
+            self._events[post_id] = threading.Event()
+            self._paths.pop(post_id, None)
+
+    def wait(self, post_id: str, timeout: float) -> str | None:
+        """
+        等待帖子下载完成。
+
+        Returns:
+            完成后的文件路径，超时返回 None
+        """
+        event = self._event(post_id)
+        completed = event.wait(timeout)
+        # 无论是否超时都注销，超时后才到的文件不再记录
+        with self._lock:
+            self._events.pop(post_id, None)
+            path = self._paths.pop(post_id, None)
+        return path if completed else None
+
+
+def start_download_watcher(download_dir: str) -> DownloadWatcher | None:
+    """启动下载目录监听；未安装 watchdog 时返回 None（退回轮询模式）"""
+    if Observer is None:
+        print("⚠️ 未安装 watchdog，下载完成检测退回轮询模式 (pip install watchdog)")
+        return None
+    return DownloadWatcher(download_dir).start()
@@ -0,0 +1,192 @@
+"""
+已下载帖子 ID 索引（SQLite WAL 模式）。
+
+进程启动时把全部 ID 载入内存集合，成员查询为 O(1)；
+新增记录先进入缓冲区，攒够一批或超过时间间隔后一次性提交。
+多个进程可以共享同一个数据库文件，查询未命中时会增量读取其他进程新写入的记录。
+"""
+
+import atexit
+import os
+import sqlite3
+import threading
+import time
+
+INDEX_FILENAME = "downloaded.db"
+LEGACY_FILENAME = "downloaded.txt"
+BATCH_SIZE = 50  # 攒够多少条记录提交一次
+FLUSH_INTERVAL = 2.0  # 距上次提交超过多少秒时立即提交
+REFRESH_INTERVAL = 5.0  # 查询未命中时，最短间隔多少秒重新读取其他进程的写入
+
+
+class DownloadedIndex:
+    """已下载帖子 ID 的持久化索引"""
+
+    def __init__(
+        self,
+        db_path: str,
+        legacy_path: str | None = None,
+        batch_size: int = BATCH_SIZE,
+        flush_interval: float = FLUSH_INTERVAL,
+    ):
+        """
+        Args:
+            db_path: SQLite 数据库文件路径
+            legacy_path: 旧的 downloaded.txt 路径，文件有变化时自动导入
+            batch_size: 批量提交的记录数
+            flush_interval: 批量提交的最长间隔（秒）
+        """
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        self._lock = threading.RLock()
+        self._ids: set[str] = set()
+        self._pending: list[str] = []
+        self._last_row = 0
+        self._last_flush = time.time()
+        self._last_refresh = 0.0
+
+        self._conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS downloaded ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, post_id TEXT NOT NULL UNIQUE)"
+        )
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self._conn.commit()
+
+        if legacy_path:
+            self._import_legacy(legacy_path)
+        self.refresh(force=True)
+        atexit.register(self.close)
+
+    def _import_legacy(self, legacy_path: str):
+        """导入 downloaded.txt（仅在文件大小或修改时间变化时执行）"""
+        if not os.path.exists(legacy_path):
+            return
+
+        st = os.stat(legacy_path)
+        stamp = f"{st.st_size}:{st.st_mtime_ns}"
+        row = self._conn.execute("SELECT value FROM meta WHERE key = 'legacy_stamp'").fetchone()
+        if row and row[0] == stamp:
+            return
+
+        with open(legacy_path, 'r', encoding='utf-8') as f:
+            ids = [(line.strip(),) for line in f if line.strip()]
+        with self._conn:
+            self._conn.executemany("INSERT OR IGNORE INTO downloaded (post_id) VALUES (?)", ids)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('legacy_stamp', ?)", (stamp,)
+            )
+        print(f"📥 已从 {os.path.basename(legacy_path)} 导入 {len(ids)} 条记录到下载索引")
+
+    def refresh(self, force: bool = False):
+        """增量读取数据库中新增的记录（包括其他进程写入的）"""
+        with self._lock:
+            now = time.time()
+            if not force and now - self._last_refresh < REFRESH_INTERVAL:
+                return
+            self._last_refresh = now
+            rows = self._conn.execute(
+                "SELECT id, post_id FROM downloaded WHERE id > ? ORDER BY id", (self._last_row,)
+            ).fetchall()
+            for row_id, post_id in rows:
+                self._ids.add(post_id)
+                self._last_row = row_id
+
+    def __contains__(self, post_id: str) -> bool:
+        post_id = str(post_id)
+        if post_id in self._ids:
+            return True
+        # 未命中时看看其他进程是否刚刚记录过
+        self.refresh()
+        return post_id in self._ids
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def add(self, post_id: str):
+        """记录一个已下载的 ID（批量提交）"""
+        post_id = str(post_id)
+        with self._lock:
+            if post_id in self._ids:
+                return
+            self._ids.add(post_id)
+            self._pending.append(post_id)
+            if (
+                len(self._pending) >= self.batch_size
+                or time.time() - self._last_flush >= self.flush_interval
+            ):
+                self.flush()
+
+    def flush(self):
+        """把缓冲区中的记录一次性写入数据库"""
+        with self._lock:
+            self._last_flush = time.time()
+            if not self._pending:
+                return
+            pending, self._pending = self._pending, []
+            with self._conn:
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO downloaded (post_id) VALUES (?)",
+                    [(post_id,) for post_id in pending],
+                )
+
+    def discard(self, post_ids):
+        """
+        删除记录（文件已从下载目录中移除时使用）。
+
+        只影响本进程的内存集合和数据库；其他进程已载入的 ID 在它们重启前仍然有效。
+        """
+        post_ids = [str(post_id) for post_id in post_ids]
+        if not post_ids:
+            return
+        with self._lock:
+            self.flush()
+            self._ids.difference_update(post_ids)
+            with self._conn:
+                self._conn.executemany(
+                    "DELETE FROM downloaded WHERE post_id = ?", [(post_id,) for post_id in post_ids]
+                )
+
+    def update(self, post_ids):
+        """一次性记录多个 ID（立即提交）"""
+        with self._lock:
+            for post_id in post_ids:
+                post_id = str(post_id)
+                if post_id not in self._ids:
+                    self._ids.add(post_id)
+                    self._pending.append(post_id)
+            self.flush()
+
+    def close(self):
+        """提交剩余记录并关闭数据库"""
+        with self._lock:
+            if self._conn is None:
+                return
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"⚠️ 写入下载索引时出错: {e}")
+            self._conn.close()
+            self._conn = None
+
+
+_indexes: dict[str, DownloadedIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_downloaded_index(download_dir: str) -> DownloadedIndex:
+    """获取下载目录对应的索引（每个进程只加载一次）"""
+    key = os.path.abspath(download_dir)
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is None:
+            index = DownloadedIndex(
+                os.path.join(download_dir, INDEX_FILENAME),
+                legacy_path=os.path.join(download_dir, LEGACY_FILENAME),
+            )
+            _indexes[key] = index
+        return index
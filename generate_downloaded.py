@@ -1,38 +1,186 @@
+"""
+扫描下载目录，把其中图片对应的帖子 ID 同步到下载索引（downloaded.db）。
+
+- 多线程并行 os.scandir 各个子目录；
+- 记录每个目录上次扫描时的修改时间，未变化的目录直接复用上次的结果，不再列出其内容
+  （目录的修改时间只反映直接增删的文件，子目录仍会逐个检查修改时间）；
+- 只输出与上次扫描相比新增和消失的 ID，并原地增删索引中的记录，而不是重写整个文件。
+
+用法：
+    python generate_downloaded.py [下载目录]
+"""
+
+import json
 import os
 import re
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from downloaded_index import get_downloaded_index
+
+SCAN_DIRECTORY = r'D:\VsCodeProjects\Dataset\2Dimages'  # 未指定参数时扫描的目录
+SCAN_CACHE_FILENAME = ".scan_cache.json"  # 保存在扫描目录下
+SCAN_WORKERS = 8  # 并行扫描的线程数
+MTIME_SLACK = 2.0  # 修改时间距上次扫描不足该秒数的目录不信任缓存（文件系统时间精度有限）
+SHOW_IDS = 20  # 最多打印多少个变化的 ID
+
+# 支持的图片扩展名（可按需扩展）
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp', '.tiff'}
+# 文件名形如 "ANIME-PICTURES.NET_-_<post_id>-..."
+POST_ID_PATTERN = re.compile(r'ANIME-PICTURES\.NET_-_(\d+)-')
+
+
+def load_cache(path: str) -> dict:
+    """上次扫描的结果：{"scanned_at": 时间戳, "dirs": {相对路径: {"mtime_ns", "ids", "subdirs"}}}"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            cache = json.load(f)
+        if isinstance(cache.get("dirs"), dict):
+            return cache
+    except (OSError, ValueError):
+        pass
+    return {"scanned_at": 0, "dirs": {}}
+
+
+def save_cache(path: str, cache: dict):
+    temp_path = path + ".tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(cache, f, separators=(',', ':'))
+    os.replace(temp_path, path)
 
-def extract_post_ids_from_images(root_dir, output_file='downloaded.txt'):
+
+def scan_directory(root_dir: str, relative: str, cached: dict | None, trusted_before_ns: int) -> tuple[dict, bool]:
+    """
+    扫描单个目录（不递归）。
+
+    Returns:
+        (目录记录, 是否复用了缓存)
     """
-    遍历 root_dir 目录及其子目录，提取所有图片文件名中的 post_id，
-    并写入 output_file 文件中（每行一个 ID）。
+    path = os.path.join(root_dir, relative) if relative else root_dir
+    mtime_ns = os.stat(path).st_mtime_ns
+    if cached and cached["mtime_ns"] == mtime_ns and mtime_ns < trusted_before_ns:
+        return cached, True
+
+    ids = []
+    subdirs = []
+    with os.scandir(path) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                # 跳过 .thumbs / .blobs 等隐藏目录，其中的预览图和数据文件不是独立的下载
+                if not entry.name.startswith('.'):
+                    subdirs.append(os.path.join(relative, entry.name) if relative else entry.name)
+                continue
+            if os.path.splitext(entry.name)[1].lower() not in IMAGE_EXTENSIONS:
+                continue
+            match = POST_ID_PATTERN.search(entry.name)
+            if match:
+                ids.append(match.group(1))
+    return {"mtime_ns": mtime_ns, "ids": ids, "subdirs": subdirs}, False
+
+
+def cached_subtree(old_dirs: dict, relative: str) -> dict:
+    """上次扫描时 relative 及其所有子目录的记录"""
+    prefix = relative + os.sep
+    return {
+        path: record for path, record in old_dirs.items()
+        if not relative or path == relative or path.startswith(prefix)
+    }
+
+
+def scan_tree(root_dir: str, cache: dict, workers: int = SCAN_WORKERS) -> tuple[dict, int]:
     """
+    并行扫描整个目录树。
+
+    扫描期间被删除的目录视为消失；无权限、被占用等其他错误时沿用上次对该目录及其子目录的记录，
+    避免其中的 ID 被当作"已消失"从下载索引中删除。
+
+    Returns:
+        (新的目录记录 {相对路径: 记录}, 实际列出内容的目录数)
+    """
+    old_dirs = cache["dirs"]
+    trusted_before_ns = int((cache["scanned_at"] - MTIME_SLACK) * 1e9)
+    dirs = {}
+    listed = 0
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        running = {}  # future -> 相对路径
+
+        def submit(relative: str):
+            future = executor.submit(scan_directory, root_dir, relative, old_dirs.get(relative), trusted_before_ns)
+            running[future] = relative
+
+        submit("")
+        while running:
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                relative = running.pop(future)
+                try:
+                    record, reused = future.result()
+                except FileNotFoundError:
+                    # 扫描期间被删除的目录
+                    continue
+                except OSError as e:
+                    # 暂时读不了的目录：保留上次的结果，不再深入
+                    print(f"⚠️ 无法读取目录 {relative or root_dir}，沿用上次的扫描结果: {e}")
+                    dirs.update(cached_subtree(old_dirs, relative))
+                    continue
+                dirs[relative] = record
+                listed += not reused
+                for subdir in record["subdirs"]:
+                    submit(subdir)
+    return dirs, listed
+
+
+def collect_ids(dirs: dict) -> set[str]:
+    return {post_id for record in dirs.values() for post_id in record["ids"]}
+
+
+def rescan(root_dir: str, workers: int = SCAN_WORKERS) -> tuple[set[str], set[str]]:
+    """
+    增量扫描 root_dir，并把变化同步到下载索引。
+
+    只删除上次扫描见过、这次消失的 ID；通过其他途径记录到索引中的 ID 不受影响。
+
+    Args:
+        root_dir: 下载目录
+        workers: 并行扫描的线程数
+
+    Returns:
+        (新增的 ID, 消失的 ID)
+    """
+    cache_path = os.path.join(root_dir, SCAN_CACHE_FILENAME)
+    cache = load_cache(cache_path)
+    started = time.time()
+
+    dirs, listed = scan_tree(root_dir, cache, workers)
+    previous = collect_ids(cache["dirs"])
+    current = collect_ids(dirs)
+    added = current - previous
+    removed = previous - current
+
+    index = get_downloaded_index(root_dir)
+    index.update(added)
+    index.discard(removed)
+    save_cache(cache_path, {"scanned_at": started, "dirs": dirs})
+
+    print(f"🔍 扫描 {len(dirs)} 个目录（实际列出 {listed} 个），耗时 {time.time() - started:.2f} 秒")
+    print(f"✅ 共 {len(current)} 个帖子 ID：新增 {len(added)} 个，移除 {len(removed)} 个")
+    for label, ids in (("+", added), ("-", removed)):
+        shown = sorted(ids, key=int)[:SHOW_IDS]
+        if shown:
+            more = f" ...（另有 {len(ids) - len(shown)} 个）" if len(ids) > len(shown) else ""
+            print(f"   {label} {', '.join(shown)}{more}")
+    return added, removed
+
+
+def main():
+    root_dir = sys.argv[1] if len(sys.argv) > 1 else SCAN_DIRECTORY
+    if not os.path.isdir(root_dir):
+        print(f"❌ 错误: 目录 '{root_dir}' 不存在。")
+        return
+    rescan(root_dir)
+
 
-    # 支持的图片扩展名（可按需扩展）
-    image_extensions = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp', '.tiff'}
-
-    post_ids = set()  # 使用 set 避免重复
-
-    for dirpath, _, filenames in os.walk(root_dir):
-        print(f"正在检查目录: {dirpath}")  # 调试信息
-        for filename in filenames:
-            print(f"找到文件: {filename}")  # 调试信息
-            _, ext = os.path.splitext(filename)
-            if ext.lower() in image_extensions:
-                # 尝试匹配 post_id：在文件名中找形如 "ANIME-PICTURES.NET_-_<post_id>-" 的模式
-                match = re.search(r'ANIME-PICTURES\.NET_-_(\d+)-', filename)
-                if match:
-                    post_id = match.group(1)
-                    post_ids.add(post_id)
-                    print(f"从文件 {filename} 提取到 post_id: {post_id}")  # 调试信息
-                else:
-                    print(f"未能从文件 {filename} 中提取 post_id.")  # 调试信息
-
-    # 写入文件
-    with open(output_file, 'w', encoding='utf-8') as f:
-        for pid in sorted(post_ids, key=int):  # 按数字大小排序（可选）
-            f.write(pid + '\n')
-
-    print(f"成功提取 {len(post_ids)} 个唯一 post_id，已写入 {output_file}")
-
-# 使用示例：
-extract_post_ids_from_images(r'D:\VsCodeProjects\Dataset\2Dimages')
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -5,9 +5,11 @@ from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 import time
-import requests
 import os
 
+from http_downloader import build_session, harvest_clearance, stream_to_file
+from session_pool import SessionPool
+
 def download_image_with_selenium(img_url, save_path):
     # 配置 Edge 浏览器
     edge_options = Options()
@@ -44,41 +46,27 @@ def download_image_with_selenium(img_url, save_path):
         print("✓ 列表页访问成功")
         
         # 2. 获取 cookies
-        cookies = driver.get_cookies()
+        clearance = harvest_clearance(driver, list_url)
         print(f"\n获取到的 Cookies:")
-        for cookie in cookies:
+        for cookie in clearance["cookies"]:
             print(f"  {cookie['name']} = {cookie['value'][:50]}...")
         
         # 3. 使用 requests 下载图片（带上 cookies）
-        session = requests.Session()
-        for cookie in cookies:
-            session.cookies.set(cookie['name'], cookie['value'], domain=cookie.get('domain'))
-        
-        headers = {
-            'User-Agent': driver.execute_script("return navigator.userAgent"),
-            'Referer': list_url,
-            'Accept': 'image/avif,image/webp,image/apng,image/svg+xml,image/*,*/*;q=0.8',
-            'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8',
-            'Origin': 'https://anime-pictures.net',
-        }
+        sessions = SessionPool(lambda: build_session(clearance), size=1)
         
         print(f"\n正在下载图片...")
         print(f"请求头:")
-        for k, v in headers.items():
+        for k, v in clearance["headers"].items():
             print(f"  {k}: {v[:80]}...")
         
-        response = session.get(img_url, headers=headers, timeout=30)
-        
-        print(f"\n图片响应状态码: {response.status_code}")
-        
-        if response.status_code == 200:
-            with open(save_path, 'wb') as f:
-                f.write(response.content)
-            print(f"✓ 下载成功: {save_path} ({len(response.content)} bytes)")
+        # 分块写入 .part 文件，中断后用 Range 续传，内存占用与图片大小无关
+        with sessions.session() as session:
+            ok = stream_to_file(session, img_url, save_path)
+        if ok:
+            print(f"✓ 下载成功: {save_path} ({os.path.getsize(save_path)} bytes)")
             return True
         else:
-            print(f"✗ 下载失败: {response.status_code}")
-            print(f"响应头: {response.headers}")
+            print(f"✗ 下载失败: {img_url}")
             return False
         
     except Exception as e:
@@ -90,5 +78,6 @@ def download_image_with_selenium(img_url, save_path):
         driver.quit()
 
 # 测试
-url = "https://api.anime-pictures.net/pictures/download_image/888175-5403x7641-original-haruhiruri-single-long+hair-tall+image-looking+at+viewer.jpg"
-download_image_with_selenium(url, "test_image.jpg")
\ No newline at end of file
+if __name__ == "__main__":
+    url = "https://api.anime-pictures.net/pictures/download_image/888175-5403x7641-original-haruhiruri-single-long+hair-tall+image-looking+at+viewer.jpg"
+    download_image_with_selenium(url, "test_image.jpg")
@@ -0,0 +1,190 @@
+"""
+列表页 / 详情页的磁盘缓存。
+
+页面按规范化后的 URL 存储（zlib 压缩），每种页面有各自的有效期；
+过期后如果服务器给过 ETag / Last-Modified，就发条件请求，返回 304 时直接沿用缓存。
+缓存总大小超过上限时按最近访问时间淘汰（LRU）。
+缓存目录和索引在第一次读取页面时才创建，只导入模块或创建 HttpCache 不会产生任何文件。
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+CACHE_DIRECTORY = ".http_cache"
+CACHE_MAX_BYTES = 500 * 1024 * 1024  # 缓存总大小上限（压缩后）
+# 各类页面的有效期（秒）：列表页会随新帖子变化，详情页里的下载链接基本不变
+CACHE_TTL = {
+    "listing": 60 * 60,
+    "detail": 30 * 24 * 60 * 60,
+}
+DEFAULT_TTL = 60 * 60
+
+
+def normalize_url(url: str) -> str:
+    """规范化 URL：协议和域名小写、去掉默认端口和 #fragment、查询参数排序"""
+    parts = urlsplit(url)
+    scheme = parts.scheme.lower()
+    netloc = parts.netloc.lower()
+    if (scheme == "http" and netloc.endswith(":80")) or (scheme == "https" and netloc.endswith(":443")):
+        netloc = netloc.rsplit(":", 1)[0]
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return urlunsplit((scheme, netloc, parts.path or "/", query, ""))
+
+
+class CachedResponse:
+    """缓存命中时返回的响应，提供与 requests.Response 相同的常用属性"""
+
+    def __init__(self, url: str, content: bytes, encoding: str | None, status_code: int = 200):
+        self.url = url
+        self.status_code = status_code
+        self.content = content
+        self.encoding = encoding
+        self.headers = {}
+        self.from_cache = True
+
+    @property
+    def text(self) -> str:
+        return self.content.decode(self.encoding or "utf-8", errors="replace")
+
+
+class HttpCache:
+    """带有效期、条件重验证和 LRU 淘汰的磁盘响应缓存"""
+
+    def __init__(self, directory: str = CACHE_DIRECTORY, max_bytes: int = CACHE_MAX_BYTES, ttl: dict | None = None):
+        """
+        Args:
+            directory: 缓存目录
+            max_bytes: 缓存总大小上限（字节）
+            ttl: 各页面类型的有效期（秒），默认为 CACHE_TTL
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl = ttl if ttl is not None else CACHE_TTL
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _open(self):
+        """第一次使用时创建缓存目录并打开索引"""
+        with self._lock:
+            if self._conn is not None:
+                return
+            os.makedirs(self.directory, exist_ok=True)
+            conn = sqlite3.connect(os.path.join(self.directory, "index.db"), timeout=30, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "key TEXT PRIMARY KEY, url TEXT, kind TEXT, etag TEXT, last_modified TEXT, "
+                "encoding TEXT, size INTEGER, stored_at REAL, last_access REAL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS entries_last_access ON entries (last_access)")
+            conn.commit()
+            self._conn = conn
+
+    def _blob_path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], key + ".z")
+
+    def _read_blob(self, key: str) -> bytes | None:
+        try:
+            with open(self._blob_path(key), 'rb') as f:
+                return zlib.decompress(f.read())
+        except (OSError, zlib.error):
+            return None
+
+    def _store(self, key: str, url: str, kind: str, response):
+        data = zlib.compress(response.content, 6)
+        path = self._blob_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(temp_path, 'wb') as f:
+            f.write(data)
+        os.replace(temp_path, path)
+
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    key, url, kind,
+                    response.headers.get("ETag"),
+                    response.headers.get("Last-Modified"),
+                    response.encoding,
+                    len(data), now, now,
+                ),
+            )
+        self._evict()
+
+    def _evict(self):
+        """总大小超过上限时，从最久未访问的条目开始删除，直到降到上限的 90%"""
+        with self._lock:
+            total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+            if total <= self.max_bytes:
+                return
+            target = self.max_bytes * 0.9
+            victims = []
+            for key, size in self._conn.execute("SELECT key, size FROM entries ORDER BY last_access"):
+                if total <= target:
+                    break
+                victims.append(key)
+                total -= size
+            with self._conn:
+                self._conn.executemany("DELETE FROM entries WHERE key = ?", [(k,) for k in victims])
+        for key in victims:
+            try:
+                os.remove(self._blob_path(key))
+            except OSError:
+                pass
+
+    def get(self, fetch, url: str, kind: str, cacheable=None):
+        """
+        读取页面，必要时通过 fetch 访问网络。
+
+        Args:
+            fetch: 实际发请求的函数 fetch(url, headers) -> requests.Response
+            url: 页面 URL
+            kind: 页面类型（"listing" / "detail"），决定有效期
+            cacheable: 可选的 cacheable(response) -> bool，返回 False 的 200 响应不写入缓存
+                （例如没有下载链接的详情页，下次仍会重新请求）
+
+        Returns:
+            命中缓存时为 CachedResponse，否则为 fetch 返回的响应
+        """
+        self._open()
+        normalized = normalize_url(url)
+        key = hashlib.sha1(normalized.encode("utf-8")).hexdigest()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT etag, last_modified, encoding, stored_at FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+
+        headers = {}
+        if row:
+            etag, last_modified, encoding, stored_at = row
+            content = self._read_blob(key)
+            if content is not None:
+                now = time.time()
+                if now - stored_at < self.ttl.get(kind, DEFAULT_TTL):
+                    with self._lock, self._conn:
+                        self._conn.execute("UPDATE entries SET last_access = ? WHERE key = ?", (now, key))
+                    return CachedResponse(url, content, encoding)
+                # 已过期：能重验证就发条件请求
+                if etag:
+                    headers["If-None-Match"] = etag
+                if last_modified:
+                    headers["If-Modified-Since"] = last_modified
+
+        response = fetch(url, headers)
+        if response.status_code == 304 and row and content is not None:
+            now = time.time()
+            with self._lock, self._conn:
+                self._conn.execute(
+                    "UPDATE entries SET stored_at = ?, last_access = ? WHERE key = ?", (now, now, key)
+                )
+            return CachedResponse(url, content, encoding)
+        if response.status_code == 200 and (cacheable is None or cacheable(response)):
+            self._store(key, normalized, kind, response)
+        return response
@@ -0,0 +1,351 @@
+"""
+HTTP 下载线程池：浏览器只负责通过 Cloudflare 验证，
+图片由多个 requests.Session 并行下载（共享浏览器拿到的 Cookies 和 User-Agent）。
+"""
+
+import itertools
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from urllib.parse import urlparse, unquote
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import blob_store
+import metrics
+from aimd import THROTTLE, AimdController, Slot, classify_response
+from clearance import ChallengeError, ClearanceManager, is_challenge_response
+from session_pool import SessionPool, apply_clearance
+import storage_layout
+
+HTTP_WORKERS = 8  # 并行下载线程数
+REQUEST_TIMEOUT = 30  # 单次请求超时（秒）
+FILENAME_PREFIX = "ANIME-PICTURES.NET_-_"  # 与浏览器下载保存的文件名保持一致
+CHUNK_SIZE = 256 * 1024  # 流式下载每块大小（字节）
+RESUME_ATTEMPTS = 5  # 连接中断后最多续传几次
+PART_SUFFIX = ".part"  # 下载中的临时文件后缀
+
+
+def harvest_clearance(driver, referer: str) -> dict:
+    """
+    从已通过 Cloudflare 验证的浏览器中提取 Cookies 和请求头。
+
+    Args:
+        driver: Selenium WebDriver 实例
+        referer: 通过验证时访问的页面（作为 Referer）
+
+    Returns:
+        {"cookies": [...], "headers": {...}}
+    """
+    return {
+        "cookies": driver.get_cookies(),
+        "headers": {
+            'User-Agent': driver.execute_script("return navigator.userAgent"),
+            'Referer': referer,
+            'Accept': 'image/avif,image/webp,image/apng,image/svg+xml,image/*,*/*;q=0.8',
+            'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8',
+            'Origin': 'https://anime-pictures.net',
+        },
+    }
+
+
+def build_session(clearance: dict, pool_size: int = 1) -> requests.Session:
+    """用浏览器的 Cookies 和请求头构造一个保持连接的 Session"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    apply_clearance(session, clearance)
+    return session
+
+
+def filename_from_url(url: str) -> str:
+    """按浏览器的命名规则由 URL 推出保存的文件名"""
+    filename = unquote(os.path.basename(urlparse(url).path))
+    if not filename.startswith(FILENAME_PREFIX):
+        filename = FILENAME_PREFIX + filename
+    # 去掉路径分隔符，防止写到下载目录之外
+    return os.path.basename(filename.replace('\\', '/'))
+
+
+def _total_size(response: requests.Response, offset: int) -> int | None:
+    """从 Content-Range / Content-Length 推出文件总大小"""
+    content_range = response.headers.get('Content-Range', '')
+    match = re.match(r'bytes \d+-\d+/(\d+)', content_range)
+    if match:
+        return int(match.group(1))
+    length = response.headers.get('Content-Length')
+    if length is not None:
+        return offset + int(length)
+    return None
+
+
+def _discard_part(part_path: str) -> bool:
+    """
+    删除无法续传的 .part，返回之后能否从头下载。
+
+    文件已经不在视为成功；被占用（Windows 上其他程序打开着）等其他错误时返回 False，由调用方放弃本次下载。
+    """
+    try:
+        os.remove(part_path)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        print(f"  ✗ 无法删除 {os.path.basename(part_path)}: {e}")
+        return False
+    return True
+
+
+def _finish_part(part_path: str, save_path: str, blobs=None, hasher=None, etag: str | None = None):
+    """把下载完整的 .part 原子重命名为 save_path，并登记到内容寻址存储"""
+    os.replace(part_path, save_path)
+    if blobs is None:
+        return
+    if hasher is None:
+        hasher = blob_store.hash_file(save_path)
+    if blobs.add(save_path, hasher.hexdigest(), etag):
+        metrics.inc("dedup_linked_total", stage="download")
+
+
+def stream_to_file(
+    session: requests.Session,
+    url: str,
+    save_path: str,
+    chunk_size: int = CHUNK_SIZE,
+    max_attempts: int = RESUME_ATTEMPTS,
+    controller: AimdController | None = None,
+    blobs: "blob_store.BlobStore | None" = None,
+) -> bool:
+    """
+    分块流式下载到 save_path.part，中断后用 Range 请求续传，
+    字节数与 Content-Length 一致后再原子重命名为 save_path。
+
+    传入 blobs 时边下载边计算摘要并按内容去重；响应头或第一块内容表明是已有数据时不再传输正文。
+
+    Args:
+        session: 已带上 Cookies 的 Session
+        url: 图片下载 URL
+        save_path: 最终保存路径
+        chunk_size: 每次写入的块大小（字节），决定单个下载占用的内存
+        max_attempts: 连接中断时的最大续传次数
+        controller: 自适应并发控制器，每次请求占用一个名额并报告服务器状态
+        blobs: 内容寻址存储，为 None 时不去重
+
+    Returns:
+        是否下载成功
+
+    Raises:
+        ChallengeError: 遇到 Cloudflare 验证页（已下载的 .part 会保留，刷新 Cookies 后可继续续传）
+    """
+    part_path = save_path + PART_SUFFIX
+
+    for attempt in range(1, max_attempts + 1):
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        # 图片按原样传输，避免 Content-Length 对应压缩后的字节数
+        headers = {'Accept-Encoding': 'identity'}
+        if offset:
+            headers['Range'] = f'bytes={offset}-'
+
+        slot_context = controller.slot() if controller is not None else nullcontext(Slot())
+        try:
+            with slot_context as slot, metrics.stage("download"), \
+                    session.get(url, headers=headers, stream=True, timeout=REQUEST_TIMEOUT) as response:
+                outcome = classify_response(response, check_body=False)
+                slot.report(outcome)
+                if outcome == THROTTLE:
+                    metrics.inc("throttled_total", stage="download")
+                if is_challenge_response(response, check_body=False):
+                    # 图片地址返回了验证页，需要刷新 Cookies 后再试
+                    slot.report(THROTTLE)
+                    metrics.inc("challenges_total", stage="download")
+                    raise ChallengeError(url)
+                if response.status_code == 416:
+                    # Content-Range: bytes */N 给出了文件大小：与 .part 相同说明上次已经下载完整，只差重命名
+                    match = re.match(r'bytes \*/(\d+)', response.headers.get('Content-Range', ''))
+                    if match and int(match.group(1)) == offset:
+                        _finish_part(part_path, save_path, blobs)
+                        return True
+                    # 否则 .part 比服务器上的文件还大，说明不是同一个文件，重新下载
+                    if not _discard_part(part_path):
+                        return False
+                    continue
+                if response.status_code == 200 and offset:
+                    # 服务器不支持 Range，只能从头开始
+                    offset = 0
+                elif response.status_code not in (200, 206):
+                    print(f"  ✗ HTTP {response.status_code}: {url}")
+                    return False
+
+                total = _total_size(response, offset)
+                chunks = response.iter_content(chunk_size=chunk_size)
+                hasher = None
+                etag = None
+                if blobs is not None:
+                    known = None
+                    if not offset:
+                        known = blobs.lookup_headers(response.headers)
+                        candidates = [] if known else blobs.candidates(total)
+                        if candidates:
+                            first = next(chunks, b"")
+                            known = blobs.match_prefix(candidates, first)
+                            chunks = itertools.chain([first], chunks)
+                    if known:
+                        # 同一张图已经以其他帖子下载过，不再传输正文
+                        blobs.link_existing(known, save_path)
+                        # 残留的 .part 删不掉也不影响结果，下次下载时会被覆盖
+                        _discard_part(part_path)
+                        metrics.inc("dedup_skipped_total", stage="download")
+                        return True
+                    hasher = blob_store.hash_file(part_path) if offset else blob_store.new_hasher()
+                    etag = blob_store.strong_etag(response.headers)
+
+                received = 0
+                try:
+                    with open(part_path, 'ab' if offset else 'wb') as f:
+                        for chunk in chunks:
+                            f.write(chunk)
+                            if hasher is not None:
+                                hasher.update(chunk)
+                            received += len(chunk)
+                finally:
+                    metrics.inc("bytes_total", received, stage="download")
+        except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError) as e:
+            print(f"  ... 连接中断，准备续传 ({attempt}/{max_attempts}): {e}")
+            metrics.inc("retries_total", stage="download")
+            continue
+
+        size = os.path.getsize(part_path)
+        if total is not None and size < total:
+            print(f"  ... 数据不完整 ({size}/{total} bytes)，准备续传 ({attempt}/{max_attempts})")
+            continue
+        if total is not None and size > total:
+            print(f"  ✗ 文件大小异常 ({size}/{total} bytes)，删除后重试")
+            if not _discard_part(part_path):
+                return False
+            continue
+
+        _finish_part(part_path, save_path, blobs, hasher, etag)
+        return True
+
+    return False
+
+
+def download_with_session(
+    session: requests.Session,
+    url: str,
+    download_dir: str,
+    controller: AimdController | None = None,
+) -> str | None:
+    """
+    用给定 Session 流式下载单张图片到下载目录。
+
+    Returns:
+        保存后的文件路径，失败时返回 None
+    """
+    save_path = storage_layout.stored_path(download_dir, filename_from_url(url))
+    os.makedirs(os.path.dirname(save_path), exist_ok=True)
+    blobs = blob_store.get_blob_store(download_dir) if blob_store.BLOB_STORE else None
+    if stream_to_file(session, url, save_path, controller=controller, blobs=blobs):
+        return save_path
+    return None
+
+
+class HttpDownloadPool:
+    """共享 Cookies 的 HTTP 下载线程池，每个下载任务从 Session 池借用一个 Session"""
+
+    def __init__(
+        self,
+        clearance: ClearanceManager,
+        download_dir: str,
+        workers: int = HTTP_WORKERS,
+        max_retry: int = 3,
+        controller: AimdController | None = None,
+        postprocessor=None,
+    ):
+        """
+        Args:
+            clearance: 验证凭据管理器，遇到验证页时由它统一刷新 Cookies
+            download_dir: 下载目录
+            workers: 线程数，即并发下载数的上限
+            max_retry: 每张图片的最大尝试次数
+            controller: 自适应并发控制器，默认在 1 到 workers 之间随服务器响应调整
+            postprocessor: postprocess.PostProcessor，下载完成的图片交给它校验并生成预览
+        """
+        self.clearance = clearance
+        self.download_dir = download_dir
+        self.workers = workers
+        self.max_retry = max_retry
+        self.controller = controller or AimdController(initial=min(2, workers), maximum=workers)
+        self.postprocessor = postprocessor
+        # 凭据刷新后新的 Cookies 会在下次借出时同步到每个 Session
+        self.sessions = SessionPool(lambda: build_session(self.clearance.clearance, pool_size=2), workers)
+        clearance.subscribe(self.sessions.set_clearance)
+
+    def download(self, url: str, post_id: str) -> bool:
+        """
+        下载单张图片（带重试），在工作线程中调用。
+
+        不会抛出异常：刷新凭据、借用 Session 等环节出错都计为一次失败的尝试，
+        download_all / size_scheduler / work_queue 等调用方只需要看返回值。
+        """
+        for attempt in range(1, self.max_retry + 1):
+            if attempt > 1:
+                metrics.inc("retries_total", stage="http_download")
+            try:
+                # 凭据快过期时 current() 会先刷新，刷新失败计为本次尝试失败
+                generation, _ = self.clearance.current()
+                with self.sessions.session() as session:
+                    try:
+                        save_path = download_with_session(session, url, self.download_dir, self.controller)
+                    except ChallengeError:
+                        self.sessions.report(session, ok=False)
+                        raise
+                    self.sessions.report(session, ok=True)
+                if save_path:
+                    break
+            except ChallengeError:
+                print(f"🛡️ 遇到验证页 (尝试 {attempt}/{self.max_retry}) [ID: {post_id}]")
+                # 其他线程可能已经刷新过，此时直接使用新凭据
+                try:
+                    self.clearance.refresh(generation)
+                except Exception as e:
+                    print(f"⚠️ 刷新 Cookies 时出错: {e}")
+            except Exception as e:
+                print(f"❌ 下载时发生错误 (尝试 {attempt}/{self.max_retry}) [ID: {post_id}]: {e}")
+        else:
+            print(f"🔴 下载失败，已重试 {self.max_retry} 次，跳过 [ID: {post_id}]")
+            return False
+
+        print(f"✅ 下载完成 [ID: {post_id}] {os.path.basename(save_path)}")
+        # 文件已经下载完成，后处理出错不能让调用方把它当作失败重新下载
+        if self.postprocessor is not None:
+            try:
+                self.postprocessor.submit(post_id, url)
+            except Exception as e:
+                print(f"⚠️ 提交后处理时出错 [ID: {post_id}]: {e}")
+        return True
+
+    def download_all(self, items: list[tuple[str, str]], on_success=None) -> tuple[int, int]:
+        """
+        并行下载所有图片。
+
+        Args:
+            items: (url, post_id) 列表
+            on_success: 每张下载成功后的回调 on_success(post_id)，在工作线程中调用
+
+        Returns:
+            (成功数, 失败数)
+        """
+        def task(item: tuple[str, str]) -> bool:
+            url, post_id = item
+            ok = self.download(url, post_id)
+            if ok and on_success:
+                on_success(post_id)
+            return ok
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            results = list(executor.map(task, items))
+        success = sum(results)
+        return success, len(results) - success
@@ -0,0 +1,119 @@
+"""
+爬取进度日志：只追加的 JSON Lines 文件，记录每个解析完成的帖子和每个完成的列表页。
+
+- 帖子解析出下载链接后立即写入一条 post 记录；整页完成后写入一条 page 记录；
+- 写入先进入缓冲区，攒够 JOURNAL_BATCH 条或整页完成时再 flush + fsync；
+- 程序崩溃、Ctrl-C 或被封后重新运行，已完成的页直接复用记录，
+  未完成的页只解析还没有记录的帖子；
+- 整个范围爬取完成并写出 download_urls.txt 后删除日志。
+
+崩溃时最后一行可能只写了一半，读取时忽略无法解析的行。
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+
+from crawl_state import query_key
+
+JOURNAL_DIRECTORY = ".journal"
+JOURNAL_BATCH = 50  # 每攒够多少条记录 fsync 一次
+JOURNAL_FLUSH_INTERVAL = 5  # 距离上次 fsync 超过多少秒时也会 fsync（秒）
+
+
+def journal_path(base_url_template: str, directory: str = JOURNAL_DIRECTORY) -> str:
+    """同一个查询（忽略 page 参数）对应同一个日志文件"""
+    digest = hashlib.sha1(query_key(base_url_template).encode("utf-8")).hexdigest()[:16]
+    return os.path.join(directory, f"{digest}.jsonl")
+
+
+class CrawlJournal:
+    """列表页 / 帖子粒度的断点记录"""
+
+    def __init__(self, path: str, batch_size: int = JOURNAL_BATCH, flush_interval: float = JOURNAL_FLUSH_INTERVAL):
+        """
+        Args:
+            path: 日志文件路径（不存在时创建）
+            batch_size: 每攒够多少条记录 fsync 一次
+            flush_interval: 距离上次 fsync 超过多少秒时也会 fsync
+        """
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.pages = {}  # 页码 -> (帖子ID列表, 下载链接列表)，只包含已完成的页
+        self.posts = {}  # 页码 -> {帖子ID: 下载链接}
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._last_sync = time.time()
+
+        if os.path.exists(path):
+            self._load()
+            if self.pages or self.posts:
+                resolved = sum(len(posts) for posts in self.posts.values())
+                print(f"📒 从断点日志恢复: {len(self.pages)} 页已完成，{resolved} 个帖子已解析")
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._file = open(path, 'a', encoding='utf-8')
+
+    def _load(self):
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # 崩溃时写了一半的行
+                page = record.get("page")
+                if record.get("type") == "post":
+                    self.posts.setdefault(page, {})[record["id"]] = record["url"]
+                elif record.get("type") == "page":
+                    self.pages[page] = (record["ids"], record["urls"])
+
+    def _write(self, record: dict, sync: bool = False):
+        with self._lock:
+            self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self._pending += 1
+            if sync or self._pending >= self.batch_size or time.time() - self._last_sync >= self.flush_interval:
+                self._sync()
+
+    def _sync(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._pending = 0
+        self._last_sync = time.time()
+
+    def page_done(self, page: int) -> tuple[list[int], list[str]] | None:
+        """已完成的页返回 (帖子ID列表, 下载链接列表)，否则返回 None"""
+        return self.pages.get(page)
+
+    def resolved_posts(self, page: int) -> dict[int, str]:
+        """该页中已经解析出下载链接的帖子"""
+        return dict(self.posts.get(page, {}))
+
+    def record_post(self, page: int, post_id: int, url: str):
+        """记录一个解析完成的帖子（只记录成功的，失败的下次重新尝试）"""
+        with self._lock:
+            posts = self.posts.setdefault(page, {})
+            if posts.get(post_id) == url:
+                return
+            posts[post_id] = url
+        self._write({"type": "post", "page": page, "id": post_id, "url": url})
+
+    def record_page(self, page: int, ids: list[int], urls: list[str]):
+        """记录整页完成，立即 fsync"""
+        self.pages[page] = (ids, urls)
+        self._write({"type": "page", "page": page, "ids": ids, "urls": urls}, sync=True)
+
+    def close(self):
+        with self._lock:
+            if not self._file.closed:
+                self._sync()
+                self._file.close()
+
+    def remove(self):
+        """整个范围完成后删除日志"""
+        self.close()
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
@@ -1,14 +1,16 @@
-import time
-import random
 from selenium.webdriver.common.by import By
+import waits
+
+LOGIN_URL = "https://anime-pictures.net/login?lang=zh-cn"
 
 def login(driver,username,password):
-    driver.get("https://anime-pictures.net/login?lang=zh-cn")
-    time.sleep(random.uniform(1,2))
-    driver.find_element(By.XPATH,"//*[@id=\"svelte\"]/div/div[1]/div[1]/div/div/form/table/tbody/tr[1]/td[2]/input").send_keys(username)
-    time.sleep(random.uniform(1,2))
-    driver.find_element(By.XPATH,"//*[@id=\"svelte\"]/div/div[1]/div[1]/div/div/form/table/tbody/tr[2]/td[2]/input").send_keys(password)
-    time.sleep(random.uniform(1,2))
-    target = driver.find_element(By.XPATH,"//*[@id=\"svelte\"]/div/div[1]/div[1]/div/div/form/table/tbody/tr[3]/td[2]/input")
+    # 礼貌间隔只加在页面跳转前，填写表单的各步之间只等元素就绪
+    waits.pace()
+    driver.get(LOGIN_URL)
+    waits.wait_for_element(driver,(By.XPATH,"//*[@id=\"svelte\"]/div/div[1]/div[1]/div/div/form/table/tbody/tr[1]/td[2]/input")).send_keys(username)
+    waits.wait_for_element(driver,(By.XPATH,"//*[@id=\"svelte\"]/div/div[1]/div[1]/div/div/form/table/tbody/tr[2]/td[2]/input")).send_keys(password)
+    target = waits.wait_for_element(driver,(By.XPATH,"//*[@id=\"svelte\"]/div/div[1]/div[1]/div/div/form/table/tbody/tr[3]/td[2]/input"),clickable=True)
     target.click()
-    time.sleep(random.uniform(1, 2))
\ No newline at end of file
+    # 等待登录请求完成（跳转离开登录页或网络空闲）
+    if not waits.wait_for_url_change(driver, LOGIN_URL, timeout=10):
+        waits.wait_for_network_idle(driver)
\ No newline at end of file
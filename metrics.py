@@ -0,0 +1,206 @@
+"""
+各阶段的计时和吞吐量统计：计数器、耗时直方图、在途数量，以及 sleep 与 I/O 的时间对比。
+
+默认关闭（ENABLED = False），此时所有记录函数直接返回，stage() 返回共享的空上下文，几乎没有开销。
+打开后可导出为：
+- JSON Lines 文件（每次导出追加一行快照，便于事后分析）；
+- Prometheus 文本格式文件（可交给 node_exporter 的 textfile collector 采集）。
+
+用法：
+    with metrics.stage("detail"):
+        resp = session.get(url)
+    metrics.inc("bytes_total", len(resp.content), stage="detail")
+    metrics.sleep(3, reason="cookie_refresh")
+"""
+
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+ENABLED = False  # 是否记录指标
+JSONL_PATH = "metrics.jsonl"  # JSON Lines 导出文件
+PROM_PATH = "metrics.prom"  # Prometheus 文本格式导出文件
+EXPORT_INTERVAL = 10  # 后台定期导出的间隔（秒）
+# 耗时直方图的桶上限（秒）
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, float("inf"))
+
+_lock = threading.Lock()
+_counters = {}  # (名称, 标签) -> 数值
+_gauges = {}
+_histograms = {}  # (名称, 标签) -> [各桶计数..., 总和, 次数]
+_started_at = time.time()
+_NULL_STAGE = nullcontext()
+
+
+def _key(name: str, labels: dict) -> tuple:
+    return name, tuple(sorted(labels.items()))
+
+
+def inc(name: str, value: float = 1, **labels):
+    """计数器加 value"""
+    if not ENABLED:
+        return
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def gauge_add(name: str, delta: float, **labels):
+    """在途数量等瞬时值加 delta（可为负）"""
+    if not ENABLED:
+        return
+    key = _key(name, labels)
+    with _lock:
+        _gauges[key] = _gauges.get(key, 0) + delta
+
+
+def observe(name: str, value: float, **labels):
+    """向直方图记录一个观测值（通常是耗时，单位秒）"""
+    if not ENABLED:
+        return
+    key = _key(name, labels)
+    with _lock:
+        hist = _histograms.get(key)
+        if hist is None:
+            hist = _histograms[key] = [0] * (len(BUCKETS) + 2)
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                hist[i] += 1
+                break
+        hist[-2] += value
+        hist[-1] += 1
+
+
+@contextmanager
+def _stage(name: str):
+    gauge_add("stage_in_flight", 1, stage=name)
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        inc("stage_errors_total", stage=name)
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        gauge_add("stage_in_flight", -1, stage=name)
+        observe("stage_seconds", elapsed, stage=name)
+        inc("stage_total", stage=name)
+
+
+def stage(name: str):
+    """统计一个阶段的调用次数、耗时、错误数和在途数量"""
+    if not ENABLED:
+        return _NULL_STAGE
+    return _stage(name)
+
+
+def sleep(seconds: float, reason: str):
+    """time.sleep 的替代，记录因为什么原因等待了多久"""
+    if seconds <= 0:
+        return
+    time.sleep(seconds)
+    inc("sleep_seconds_total", seconds, reason=reason)
+
+
+def record_wait(seconds: float, reason: str):
+    """记录已经发生的等待（例如阻塞在锁或条件变量上的时间）"""
+    if seconds > 0:
+        inc("sleep_seconds_total", seconds, reason=reason)
+
+
+def snapshot() -> dict:
+    """当前所有指标的快照"""
+    def fmt(key):
+        name, labels = key
+        return {"name": name, "labels": dict(labels)}
+
+    with _lock:
+        return {
+            "time": time.time(),
+            "uptime": time.time() - _started_at,
+            "counters": [dict(fmt(k), value=v) for k, v in _counters.items()],
+            "gauges": [dict(fmt(k), value=v) for k, v in _gauges.items()],
+            "histograms": [
+                dict(fmt(k), buckets=h[:len(BUCKETS)], sum=h[-2], count=h[-1])
+                for k, h in _histograms.items()
+            ],
+        }
+
+
+def _labels_text(labels: dict, extra: dict | None = None) -> str:
+    items = {**labels, **(extra or {})}
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in items.items()) + "}"
+
+
+def prometheus_text(data: dict | None = None) -> str:
+    """把快照转换为 Prometheus 文本格式"""
+    data = data or snapshot()
+    lines = []
+    for kind, entries in (("counter", data["counters"]), ("gauge", data["gauges"])):
+        seen = set()
+        for entry in sorted(entries, key=lambda e: e["name"]):
+            name = f"crawler_{entry['name']}"
+            if name not in seen:
+                lines.append(f"# TYPE {name} {kind}")
+                seen.add(name)
+            lines.append(f"{name}{_labels_text(entry['labels'])} {entry['value']}")
+    seen = set()
+    for entry in sorted(data["histograms"], key=lambda e: e["name"]):
+        name = f"crawler_{entry['name']}"
+        if name not in seen:
+            lines.append(f"# TYPE {name} histogram")
+            seen.add(name)
+        cumulative = 0
+        for bound, count in zip(BUCKETS, entry["buckets"]):
+            cumulative += count
+            le = "+Inf" if bound == float("inf") else str(bound)
+            lines.append(f"{name}_bucket{_labels_text(entry['labels'], {'le': le})} {cumulative}")
+        lines.append(f"{name}_sum{_labels_text(entry['labels'])} {entry['sum']}")
+        lines.append(f"{name}_count{_labels_text(entry['labels'])} {entry['count']}")
+    return "\n".join(lines) + "\n"
+
+
+def export(jsonl_path: str | None = JSONL_PATH, prom_path: str | None = PROM_PATH):
+    """导出当前快照：追加到 JSON Lines 文件并覆盖 Prometheus 文本文件（未启用时什么都不做）"""
+    if not ENABLED:
+        return
+    data = snapshot()
+    if jsonl_path:
+        with open(jsonl_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(data, ensure_ascii=False) + "\n")
+    if prom_path:
+        # 先写临时文件再替换，采集方不会读到写了一半的文件
+        temp_path = prom_path + ".tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            f.write(prometheus_text(data))
+        os.replace(temp_path, prom_path)
+
+
+def start_exporter(interval: float = EXPORT_INTERVAL):
+    """
+    启动后台线程定期导出。
+
+    Returns:
+        停止函数，调用后做最后一次导出并等待线程退出；未启用时返回 None
+    """
+    if not ENABLED:
+        return None
+    stop_event = threading.Event()
+
+    def loop():
+        while not stop_event.wait(interval):
+            export()
+        export()
+
+    thread = threading.Thread(target=loop, name="metrics-exporter", daemon=True)
+    thread.start()
+
+    def stop():
+        stop_event.set()
+        thread.join()
+
+    return stop
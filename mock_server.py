@@ -0,0 +1,236 @@
+"""
+本地替身服务器：模拟 anime-pictures.net 的列表页、详情页、JSON API 和图片下载，
+用于离线测量和回归测试爬虫性能。
+
+- 列表页 /posts?page=N：包含 extract_post_ids 能解析的 href="/posts/<id>"；
+- 详情页 /posts/<id>：包含 download_image/ 原图链接；
+- 列表 API /api/v3/posts?page=N：JSON 中带有整页的下载链接（供 bulk_resolver 使用）；
+- 图片 /pictures/download_image/<id>-<宽>x<高>-...：可配置大小和延迟，支持 Range；
+- 可按比例随机返回 429 或 Cloudflare 验证页。
+
+页面中的链接仍然使用真实站点的域名（爬虫的正则依赖它），
+客户端通过 LocalSession 把这些域名的请求改发到本地服务器。
+
+用法：
+    python mock_server.py
+"""
+
+import json
+import random
+import re
+import threading
+import time
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit, urlunsplit
+
+import requests
+
+MOCK_HOST = "127.0.0.1"
+MOCK_PORT = 8765
+SITE_HOSTS = ("anime-pictures.net", "api.anime-pictures.net")  # LocalSession 改发到本地的域名
+
+DOWNLOAD_URL_TEMPLATE = "https://api.anime-pictures.net/pictures/download_image/{id}-{width}x{height}-mock+tag.jpg"
+CHALLENGE_HTML = b"<html><head><title>Just a moment...</title></head><body>Checking your browser</body></html>"
+JPEG_HEADER = b"\xff\xd8\xff\xe0\x00\x10JFIF\x00"
+
+
+@dataclass
+class MockConfig:
+    """替身服务器的行为配置"""
+    posts_per_page: int = 40  # 每个列表页的帖子数
+    first_post_id: int = 900000  # 第 1 页第一个帖子的 ID（之后递减，模拟按日期排序）
+    image_size: int = 200 * 1024  # 每张图片的字节数
+    page_latency: float = 0.0  # 列表页 / 详情页 / API 的响应延迟（秒）
+    image_latency: float = 0.0  # 图片响应的首字节延迟（秒）
+    throttle_rate: float = 0.0  # 随机返回 429 的比例
+    challenge_rate: float = 0.0  # 随机返回验证页的比例
+    embed_urls: bool = False  # 列表页是否内嵌下载链接（模拟 SvelteKit 序列化数据）
+    seed: int = 0  # 随机数种子，保证每次运行的限流序列一致
+
+
+class MockSite:
+    """根据配置生成各类页面，并统计请求数"""
+
+    def __init__(self, config: MockConfig):
+        self.config = config
+        self.random = random.Random(config.seed)
+        self.counts = {}
+        self._lock = threading.Lock()
+        self.image = (JPEG_HEADER + bytes(range(256)) * (config.image_size // 256 + 1))[:config.image_size]
+
+    def count(self, kind: str):
+        with self._lock:
+            self.counts[kind] = self.counts.get(kind, 0) + 1
+
+    def roll(self) -> str | None:
+        """按配置的比例随机决定本次请求是否被限流或拦截"""
+        with self._lock:
+            value = self.random.random()
+        if value < self.config.throttle_rate:
+            return "throttle"
+        if value < self.config.throttle_rate + self.config.challenge_rate:
+            return "challenge"
+        return None
+
+    def post_ids(self, page: int) -> list[int]:
+        start = self.config.first_post_id - (page - 1) * self.config.posts_per_page
+        return [start - i for i in range(self.config.posts_per_page) if start - i > 0]
+
+    def download_url(self, post_id: int) -> str:
+        width, height = 1000 + post_id % 3000, 1000 + post_id % 2000
+        return DOWNLOAD_URL_TEMPLATE.format(id=post_id, width=width, height=height)
+
+    def listing_html(self, page: int) -> bytes:
+        items = "".join(f'<a href="/posts/{post_id}"><picture><img src="/thumb/{post_id}.jpg"></picture></a>'
+                        for post_id in self.post_ids(page))
+        data = ""
+        if self.config.embed_urls:
+            posts = [{"id": post_id, "download": self.download_url(post_id)} for post_id in self.post_ids(page)]
+            data = f"<script>const data = {json.dumps(posts)};</script>"
+        return f'<html><body><div id="svelte">{items}</div>{data}</body></html>'.encode()
+
+    def listing_json(self, page: int) -> bytes:
+        posts = [{"id": post_id, "file_url": self.download_url(post_id)} for post_id in self.post_ids(page)]
+        # 与真实 API 一样把 / 转义为 \/
+        return json.dumps({"posts": posts}).replace("/", "\\/").encode()
+
+    def detail_html(self, post_id: int) -> bytes:
+        return f'<html><body><a href="{self.download_url(post_id)}">原图</a></body></html>'.encode()
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    site: MockSite = None
+    protocol_version = "HTTP/1.1"  # 支持 keep-alive，与真实服务器一样复用连接
+    wbufsize = -1  # 响应头和响应体一起发送，避免小响应被延迟确认拖慢
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status: int, body: bytes, content_type: str, headers: dict | None = None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        site = self.site
+        parts = urlsplit(self.path)
+        query = parse_qs(parts.query)
+        page = int(query.get("page", ["1"])[0])
+
+        if parts.path.startswith("/pictures/download_image/"):
+            site.count("image")
+            time.sleep(site.config.image_latency)
+        else:
+            time.sleep(site.config.page_latency)
+
+        outcome = site.roll()
+        if outcome == "throttle":
+            site.count("throttle")
+            return self._send(429, b"Too Many Requests", "text/plain", {"Retry-After": "1"})
+        if outcome == "challenge":
+            site.count("challenge")
+            return self._send(403, CHALLENGE_HTML, "text/html; charset=utf-8", {"cf-mitigated": "challenge"})
+
+        if parts.path == "/posts":
+            site.count("listing")
+            return self._send(200, site.listing_html(page), "text/html; charset=utf-8")
+        if parts.path == "/api/v3/posts":
+            site.count("api")
+            return self._send(200, site.listing_json(page), "application/json")
+        match = re.fullmatch(r"/posts/(\d+)", parts.path)
+        if match:
+            site.count("detail")
+            return self._send(200, site.detail_html(int(match.group(1))), "text/html; charset=utf-8")
+        if parts.path.startswith("/pictures/download_image/"):
+            return self._send_image()
+        return self._send(404, b"Not Found", "text/plain")
+
+    def _send_image(self):
+        image = self.site.image
+        match = re.fullmatch(r"bytes=(\d+)-", self.headers.get("Range", ""))
+        if match:
+            start = int(match.group(1))
+            if start >= len(image):
+                return self._send(416, b"", "text/plain", {"Content-Range": f"bytes */{len(image)}"})
+            headers = {"Content-Range": f"bytes {start}-{len(image) - 1}/{len(image)}", "Accept-Ranges": "bytes"}
+            return self._send(206, image[start:], "image/jpeg", headers)
+        return self._send(200, image, "image/jpeg", {"Accept-Ranges": "bytes"})
+
+
+class MockServer:
+    """在后台线程中运行的替身服务器，可作为上下文管理器使用"""
+
+    def __init__(self, config: MockConfig | None = None, host: str = MOCK_HOST, port: int = 0):
+        """
+        Args:
+            config: 服务器行为配置
+            host: 监听地址
+            port: 监听端口，0 表示随机选择空闲端口
+        """
+        self.site = MockSite(config or MockConfig())
+        handler = type("BoundMockHandler", (MockHandler,), {"site": self.site})
+        self.httpd = ThreadingHTTPServer((host, port), handler)
+        self.httpd.daemon_threads = True
+        self.base_url = f"http://{host}:{self.httpd.server_port}"
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="mock-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+class LocalSession(requests.Session):
+    """把真实站点域名的请求改发到替身服务器，并记录每个请求的延迟（到收到响应头为止）"""
+
+    def __init__(self, base_url: str, latencies: list | None = None):
+        """
+        Args:
+            base_url: 替身服务器地址
+            latencies: 记录延迟的列表，多个 Session 可以共用一个
+        """
+        super().__init__()
+        self.base = urlsplit(base_url)
+        self.latencies = latencies if latencies is not None else []
+
+    def rewrite(self, url: str) -> str:
+        parts = urlsplit(url)
+        if parts.hostname in SITE_HOSTS:
+            return urlunsplit((self.base.scheme, self.base.netloc, parts.path, parts.query, ""))
+        return url
+
+    def request(self, method, url, *args, **kwargs):
+        start = time.perf_counter()
+        response = super().request(method, self.rewrite(url), *args, **kwargs)
+        self.latencies.append(time.perf_counter() - start)
+        return response
+
+
+def main():
+    server = MockServer(port=MOCK_PORT)
+    print(f"🧪 替身服务器已启动: {server.base_url}  (Ctrl+C 停止)")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -6,6 +6,9 @@ import time
 from urllib.parse import urlparse, unquote # 导入用于解析URL的库
 import re
 
+from download_watcher import DownloadWatcher, post_id_from_filename, start_download_watcher
+import storage_layout
+
 # --- 1. 配置参数 ---
 # 确保这个路径与 options 中设置的路径一致
 DOWNLOAD_DIRECTORY = r"D:\VsCodeProjects\Dataset\2Dimages"
@@ -84,7 +87,8 @@ def wait_for_specific_download_complete(
     download_dir: str, 
     post_id: str, 
     timeout: int = 300, 
-    poll_interval: int = 1
+    poll_interval: int = 1,
+    watcher: DownloadWatcher | None = None
 ) -> bool:
     """
     等待下载目录中出现包含特定 post_id 的完整文件，表示下载完成。
@@ -93,28 +97,29 @@ def wait_for_specific_download_complete(
         download_dir: 下载文件夹路径。
         post_id: 正在下载图片的唯一 ID。
         timeout: 最大等待时间（秒）。
-        poll_interval: 检查间隔（秒）。
+        poll_interval: 检查间隔（秒），仅在没有 watcher 时使用。
+        watcher: 下载目录监听器，提供时由文件事件直接通知完成。
         
     Returns:
         如果文件在超时前出现则返回 True，否则返回 False。
     """
-    start_time = time.time()
-    
-    # 增加一个初始等待，确保浏览器开始写入文件
-    time.sleep(poll_interval * 2) 
-    
     print(f"  ... 正在等待 ID {post_id} 完整下载到 {download_dir} ...")
 
+    # 事件模式：浏览器把 .crdownload 重命名为最终文件时立即返回
+    if watcher is not None:
+        if watcher.wait(post_id, timeout):
+            return True
+        print(f"🔴 错误: 等待 ID {post_id} 下载超时 ({timeout}秒)。")
+        return False
+
+    start_time = time.time()
     while time.time() - start_time < timeout:
         
         # 遍历下载目录中的所有文件
-        for filename in os.listdir(download_dir):
-            # 1. 检查文件名中是否包含该 ID
-            if post_id in filename:
-                # 2. 检查文件是否不是临时文件 (.crdownload 或 .tmp)
-                if not filename.endswith(('.crdownload', '.tmp', '.partial')):
-                    # 找到了完整的目标文件
-                    time.sleep(1) # 增加短暂等待，确保文件写入完成
+        with os.scandir(download_dir) as entries:
+            for entry in entries:
+                # 文件名中的 ID 与目标一致，且不是临时文件 (.crdownload 或 .tmp)
+                if post_id_from_filename(entry.name) == post_id:
                     return True
 
         # 如果没有找到完整文件，继续等待
@@ -164,6 +169,7 @@ else:
     
     # 首先访问一个正常的页面
     driver.get("https://anime-pictures.net/posts?page=4&search_tag=girl&order_by=rating&ldate=4&lang=zh-cn")
+    watcher = start_download_watcher(DOWNLOAD_DIRECTORY)
     
     print(f"\n--- 开始批量下载到目录: {DOWNLOAD_DIRECTORY} ---")
 
@@ -184,28 +190,19 @@ else:
             print(f"⚠️ 警告: 无法从 URL 提取 ID，跳过此 URL ({i+1}/{len(urls)}): {target_url}")
             continue
             
-        # b. 检查下载目录中是否存在包含此 ID 的文件
-        found_existing = False
-        
-        # 遍历下载目录中的所有文件
-        for filename in os.listdir(DOWNLOAD_DIRECTORY):
-            # 检查文件名中是否包含该 ID
-            # 即使文件名开头是 ANIME-PICTURES.NET_- 或其他，只要包含 ID 就认为已存在
-            if post_id in filename:
-                # 确保这不是一个临时文件 (.crdownload 或 .tmp)
-                if not filename.endswith(('.crdownload', '.tmp', '.partial')):
-                    print(f"🟢 跳过: 文件已存在 ({i+1}/{len(urls)}) [ID: {post_id}]，本地文件名: {filename}")
-                    found_existing = True
-                    break
-        
-        if found_existing:
+        # b. 检查下载目录中是否存在此 ID 的文件（先按预期文件名直接定位，分片布局下只看一个子目录）
+        existing = storage_layout.find_post(DOWNLOAD_DIRECTORY, post_id, expected_filename)
+        if existing:
+            print(f"🟢 跳过: 文件已存在 ({i+1}/{len(urls)}) [ID: {post_id}]，本地文件名: {os.path.basename(existing)}")
             continue # 跳过当前循环，进入下一个 URL
         
         # --- 新增的跳过逻辑 END ---
         
         print(f"\n▶️ 正在下载第 {i+1}/{len(urls)} 张图片: {expected_filename}")
         
-        # 触发下载
+        # 触发下载（先登记，避免错过完成事件）
+        if watcher is not None:
+            watcher.expect(post_id)
         driver.get(target_url)
         
         # 等待当前下载完成
@@ -218,12 +215,19 @@ else:
             DOWNLOAD_DIRECTORY, 
             post_id, 
             timeout=TIMEOUT, 
-            poll_interval=POLL_INTERVAL
+            poll_interval=POLL_INTERVAL,
+            watcher=watcher
         ):
             print(f"✅ 第 {i+1} 张图片下载完成。")
+            if storage_layout.SHARDED_LAYOUT:
+                downloaded = storage_layout.find_post(DOWNLOAD_DIRECTORY, post_id)
+                if downloaded:
+                    storage_layout.place(DOWNLOAD_DIRECTORY, downloaded)
         else:
             print(f"❌ 第 {i+1} 张图片下载失败或超时，跳过。")
             
     # 5. 清理和退出
+    if watcher is not None:
+        watcher.stop()
     driver.quit()
     print("\n所有下载任务已处理完毕。")
\ No newline at end of file
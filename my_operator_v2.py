@@ -6,6 +6,16 @@ import time
 from urllib.parse import urlparse, unquote
 import re
 
+import metrics
+from aimd import OK, THROTTLE, AimdController
+from clearance import ClearanceManager
+from downloaded_index import get_downloaded_index
+import storage_layout
+from http_downloader import HttpDownloadPool, harvest_clearance
+from postprocess import PostProcessor, start_postprocessor
+import size_scheduler
+from download_watcher import TEMP_SUFFIXES, DownloadWatcher, post_id_from_filename, start_download_watcher
+
 # --- 1. 配置参数 ---
 DOWNLOAD_DIRECTORY = r"D:\VsCodeProjects\Dataset\2Dimages"
 FILENAME = "download_urls.txt"
@@ -14,6 +24,11 @@ POLL_INTERVAL = 1  # 检查下载目录的间隔时间 (秒)
 MAX_RETRY = 3  # 每个图片的最大重试次数
 REFRESH_PAGE_URL = "https://anime-pictures.net/posts?page=4&search_tag=girl&order_by=rating&ldate=4&lang=zh-cn"
 COOKIE_REFRESH_WAIT = 5  # 刷新 Cookie 时的等待时间（秒）
+DOWNLOAD_MODE = "browser"  # "browser": 浏览器逐张下载；"http": 浏览器只负责通过验证，图片由 HTTP 线程池并行下载
+HTTP_WORKERS = 8  # http 模式下的并行下载线程数
+
+# 单浏览器只有一个并发名额，控制器只负责被限流后的退避等待
+browser_controller = AimdController(initial=1, maximum=1)
 
 
 def read_download_urls(filename: str) -> list[str]:
@@ -43,7 +58,7 @@ def read_download_urls(filename: str) -> list[str]:
 def is_downloading(download_dir: str) -> bool:
     """检查下载目录中是否存在正在下载的临时文件"""
     for filename in os.listdir(download_dir):
-        if filename.endswith(('.crdownload', '.tmp', '.partial')):
+        if filename.endswith(TEMP_SUFFIXES):
             return True
     return False
 
@@ -52,7 +67,8 @@ def wait_for_specific_download_complete(
     download_dir: str, 
     post_id: str, 
     timeout: int = 300, 
-    poll_interval: int = 1
+    poll_interval: int = 1,
+    watcher: DownloadWatcher | None = None
 ) -> bool:
     """
     等待下载目录中出现包含特定 post_id 的完整文件，表示下载完成。
@@ -61,30 +77,49 @@ def wait_for_specific_download_complete(
         download_dir: 下载文件夹路径
         post_id: 正在下载图片的唯一 ID
         timeout: 最大等待时间（秒）
-        poll_interval: 检查间隔（秒）
+        poll_interval: 检查间隔（秒），仅在没有 watcher 时使用
+        watcher: 下载目录监听器，提供时由文件事件直接通知完成
         
     Returns:
         如果文件在超时前出现则返回 True，否则返回 False
     """
-    start_time = time.time()
-    time.sleep(poll_interval * 2)  # 初始等待
-    
     print(f"  ... 正在等待 ID {post_id} 完整下载...")
+    with metrics.stage("download_wait"):
+        path = _wait_for_download(download_dir, post_id, timeout, poll_interval, watcher)
+    if path is None:
+        return False
+    # 分片布局下把文件从落地目录移到分片子目录，根目录里只留下正在下载的文件
+    if storage_layout.SHARDED_LAYOUT:
+        storage_layout.place(download_dir, path)
+    return True
+
 
+def _wait_for_download(download_dir, post_id, timeout, poll_interval, watcher) -> str | None:
+    # 事件模式：浏览器完成最终重命名时立即返回
+    if watcher is not None:
+        path = watcher.wait(post_id, timeout)
+        if path:
+            return path
+        print(f"🔴 错误: 等待 ID {post_id} 下载超时 ({timeout}秒)。")
+        return None
+
+    # 轮询模式（未安装 watchdog 时）
+    start_time = time.time()
+    last_report = 0
     while time.time() - start_time < timeout:
-        for filename in os.listdir(download_dir):
-            if post_id in filename:
-                if not filename.endswith(('.crdownload', '.tmp', '.partial')):
-                    time.sleep(1)  # 确保文件写入完成
-                    return True
+        with os.scandir(download_dir) as entries:
+            for entry in entries:
+                if post_id_from_filename(entry.name) == post_id:
+                    return entry.path
 
         elapsed = int(time.time() - start_time)
-        if elapsed % 10 == 0:  # 每 10 秒输出一次
+        if elapsed - last_report >= 10:  # 每 10 秒输出一次
+            last_report = elapsed
             print(f"  ... 正在等待下载完成 ({elapsed}s / {timeout}s)")
-        time.sleep(poll_interval)
+        metrics.sleep(poll_interval, reason="download_poll")
         
     print(f"🔴 错误: 等待 ID {post_id} 下载超时 ({timeout}秒)。")
-    return False
+    return None
 
 
 def extract_post_id_from_url(url: str) -> str | None:
@@ -97,7 +132,7 @@ def extract_post_id_from_url(url: str) -> str | None:
 
 def check_file_exists(download_dir: str, post_id: str) -> tuple[bool, str | None]:
     """
-    检查文件是否已存在（通过 downloaded.txt 记录）
+    检查文件是否已存在（通过下载索引 downloaded.db 记录）
     
     Args:
         download_dir: 下载目录
@@ -106,41 +141,28 @@ def check_file_exists(download_dir: str, post_id: str) -> tuple[bool, str | None
     Returns:
         (是否存在, 提示信息)
     """
-    downloaded_file = os.path.join(download_dir, "downloaded.txt")
-    
-    # 如果 downloaded.txt 不存在，说明没有下载过
-    if not os.path.exists(downloaded_file):
-        return False, None
-    
     try:
-        with open(downloaded_file, 'r', encoding='utf-8') as f:
-            downloaded_ids = set(line.strip() for line in f if line.strip())
-        
-        if post_id in downloaded_ids:
-            return True, f"已记录在 downloaded.txt 中"
-        else:
-            return False, None
+        if post_id in get_downloaded_index(download_dir):
+            return True, f"已记录在下载索引中"
+        return False, None
             
     except Exception as e:
-        print(f"⚠️ 读取 downloaded.txt 时出错: {e}")
+        print(f"⚠️ 读取下载索引时出错: {e}")
         return False, None
 
 def mark_as_downloaded(download_dir: str, post_id: str):
     """
-    将成功下载的图片 ID 记录到 downloaded.txt
+    将成功下载的图片 ID 记录到下载索引（批量提交）
     
     Args:
         download_dir: 下载目录
         post_id: 图片 ID
     """
-    downloaded_file = os.path.join(download_dir, "downloaded.txt")
-    
     try:
-        with open(downloaded_file, 'a', encoding='utf-8') as f:
-            f.write(f"{post_id}\n")
-        print(f"  ✓ 已记录 ID: {post_id} 到 downloaded.txt")
+        get_downloaded_index(download_dir).add(post_id)
+        print(f"  ✓ 已记录 ID: {post_id} 到下载索引")
     except Exception as e:
-        print(f"  ⚠️ 记录到 downloaded.txt 时出错: {e}")
+        print(f"  ⚠️ 记录到下载索引时出错: {e}")
 
 def refresh_cookies(driver: webdriver.Edge, wait_time: int = 5) -> bool:
     """
@@ -155,13 +177,15 @@ def refresh_cookies(driver: webdriver.Edge, wait_time: int = 5) -> bool:
     """
     try:
         print("🔄 正在刷新 Cookies（重新访问列表页）...")
+        metrics.inc("challenge_refreshes_total", stage="browser")
         driver.get(REFRESH_PAGE_URL)
-        time.sleep(wait_time)
+        metrics.sleep(wait_time, reason="cookie_refresh")
         
         # 检查是否还在 Cloudflare 验证页面
         if "Just a moment" in driver.page_source or "Checking your browser" in driver.page_source:
             print("  ... 等待 Cloudflare 验证完成...")
-            time.sleep(wait_time * 2)  # 额外等待
+            metrics.inc("challenges_total", stage="browser")
+            metrics.sleep(wait_time * 2, reason="challenge_wait")  # 额外等待
         
         print("✅ Cookies 刷新成功")
         return True
@@ -178,7 +202,12 @@ def download_image_with_retry(
     download_dir: str,
     index: int,
     total: int,
-    max_retry: int = MAX_RETRY
+    max_retry: int = MAX_RETRY,
+    record: bool = True,
+    watcher: DownloadWatcher | None = None,
+    controller: AimdController | None = None,
+    clearance: ClearanceManager | None = None,
+    postprocessor: PostProcessor | None = None
 ) -> bool:
     """
     带重试机制的图片下载函数
@@ -191,35 +220,58 @@ def download_image_with_retry(
         index: 当前图片索引
         total: 总图片数
         max_retry: 最大重试次数
+        record: 下载成功后是否写入下载索引（流水线模式下由记录阶段负责）
+        watcher: 下载目录监听器，为 None 时轮询下载目录
+        controller: 自适应并发控制器（多个浏览器共享），默认使用单浏览器的 browser_controller
+        clearance: 验证凭据管理器，重试时通过它刷新 Cookies，避免短时间内重复刷新
+        postprocessor: 后处理进程池，下载完成的图片交给它校验并生成预览（不等待结果）
         
     Returns:
         是否下载成功
     """
+    controller = controller or browser_controller
+    generation = clearance.generation if clearance is not None else 0
     for attempt in range(1, max_retry + 1):
         print(f"\n▶️ 正在下载第 {index}/{total} 张图片 (尝试 {attempt}/{max_retry})")
         print(f"   URL: {url}")
         
         try:
-            # 如果不是第一次尝试，先刷新 Cookies
+            # 被限流后 slot() 会按退避时间等待，不再固定 sleep
             if attempt > 1:
-                if not refresh_cookies(driver, COOKIE_REFRESH_WAIT):
-                    print(f"⚠️ Cookie 刷新失败，继续尝试下载...")
-                time.sleep(2)  # 短暂等待
-            
-            # 触发下载
-            driver.get(url)
-            
-            # 等待下载完成
-            if wait_for_specific_download_complete(
-                download_dir, 
-                post_id, 
-                timeout=TIMEOUT, 
-                poll_interval=POLL_INTERVAL
-            ):
+                metrics.inc("retries_total", stage="browser_download")
+            with controller.slot() as slot, metrics.stage("browser_download"):
+                # 如果不是第一次尝试，先刷新 Cookies（刚刷新过则直接复用）
+                if attempt > 1:
+                    if clearance is not None:
+                        clearance.refresh(generation)
+                        generation = clearance.generation
+                    elif not refresh_cookies(driver, COOKIE_REFRESH_WAIT):
+                        print(f"⚠️ Cookie 刷新失败，继续尝试下载...")
+                
+                # 触发下载（先登记，避免错过完成事件）
+                if watcher is not None:
+                    watcher.expect(post_id)
+                driver.get(url)
+                
+                # 等待下载完成
+                completed = wait_for_specific_download_complete(
+                    download_dir, 
+                    post_id, 
+                    timeout=TIMEOUT, 
+                    poll_interval=POLL_INTERVAL,
+                    watcher=watcher
+                )
+                # 下载超时多半是被限流或卡在验证页
+                slot.report(OK if completed else THROTTLE)
+
+            if completed:
                 print(f"✅ 第 {index} 张图片下载完成 [ID: {post_id}]")
 
-                # ⭐ 新增：记录到 downloaded.txt
-                mark_as_downloaded(download_dir, post_id)
+                # ⭐ 新增：记录到下载索引
+                if record:
+                    mark_as_downloaded(download_dir, post_id)
+                if postprocessor is not None:
+                    postprocessor.submit(post_id, url)
                 
                 return True
             else:
@@ -228,25 +280,29 @@ def download_image_with_retry(
                 # 如果还有重试机会，继续
                 if attempt < max_retry:
                     print(f"🔁 准备重试...")
-                    time.sleep(2)
                     
         except Exception as e:
             print(f"❌ 下载时发生错误 (尝试 {attempt}/{max_retry}): {e}")
             if attempt < max_retry:
                 print(f"🔁 准备重试...")
-                time.sleep(2)
     
     # 所有重试都失败
     print(f"🔴 第 {index} 张图片下载失败，已重试 {max_retry} 次，跳过 [ID: {post_id}]")
     return False
 
 
-def setup_edge_driver(download_dir: str) -> webdriver.Edge:
+def setup_edge_driver(download_dir: str, profile_dir: str | None = None) -> webdriver.Edge:
     """
     配置并启动 Edge 浏览器，增强反检测能力
+    
+    Args:
+        download_dir: 浏览器的下载目录
+        profile_dir: 独立的用户数据目录（多个浏览器同时运行时避免互相占用），为 None 时使用临时目录
     """
     options = EdgeOptions()
     options.add_argument("--start-maximized")
+    if profile_dir:
+        options.add_argument(f"--user-data-dir={profile_dir}")
     options.add_argument("--disable-blink-features=AutomationControlled")
     options.add_experimental_option("excludeSwitches", ["enable-automation"])
     options.add_experimental_option('useAutomationExtension', False)
@@ -272,6 +328,30 @@ def setup_edge_driver(download_dir: str) -> webdriver.Edge:
     return driver
 
 
+def create_clearance_manager(driver: webdriver.Edge) -> ClearanceManager:
+    """以当前浏览器为凭据来源创建管理器，刷新时重新访问列表页"""
+    def refresh() -> dict:
+        if not refresh_cookies(driver, COOKIE_REFRESH_WAIT):
+            raise RuntimeError("刷新 Cookies 失败")
+        return harvest_clearance(driver, REFRESH_PAGE_URL)
+
+    return ClearanceManager(refresh, harvest_clearance(driver, REFRESH_PAGE_URL))
+
+
+def pass_cloudflare(driver: webdriver.Edge):
+    """首次访问列表页，等待 Cloudflare 验证以获取初始 Cookies"""
+    print(f"\n🌐 首次访问列表页以通过 Cloudflare 验证...")
+    driver.get(REFRESH_PAGE_URL)
+    metrics.sleep(COOKIE_REFRESH_WAIT, reason="challenge_wait")
+    
+    if "Just a moment" in driver.page_source or "Checking your browser" in driver.page_source:
+        print("  ... 等待 Cloudflare 验证...")
+        metrics.inc("challenges_total", stage="browser")
+        metrics.sleep(COOKIE_REFRESH_WAIT * 2, reason="challenge_wait")
+    
+    print("✅ 初始化完成")
+
+
 # --- 主程序执行 ---
 def main():
     # 确保下载目录存在
@@ -289,18 +369,13 @@ def main():
     # 2. 启动浏览器
     print("\n🚀 正在启动浏览器...")
     driver = setup_edge_driver(DOWNLOAD_DIRECTORY)
+    watcher = start_download_watcher(DOWNLOAD_DIRECTORY)
+    postprocessor = start_postprocessor(DOWNLOAD_DIRECTORY)
     
     try:
         # 3. 首次访问列表页，获取初始 Cookies
-        print(f"\n🌐 首次访问列表页以通过 Cloudflare 验证...")
-        driver.get(REFRESH_PAGE_URL)
-        time.sleep(COOKIE_REFRESH_WAIT)
-        
-        if "Just a moment" in driver.page_source or "Checking your browser" in driver.page_source:
-            print("  ... 等待 Cloudflare 验证...")
-            time.sleep(COOKIE_REFRESH_WAIT * 2)
-        
-        print("✅ 初始化完成")
+        pass_cloudflare(driver)
+        clearance = create_clearance_manager(driver)
         print(f"\n{'='*60}")
         print(f"开始批量下载到目录: {DOWNLOAD_DIRECTORY}")
         print(f"总共 {len(urls)} 个文件")
@@ -310,6 +385,8 @@ def main():
         success_count = 0
         skip_count = 0
         fail_count = 0
+        pending = []  # http 模式下待下载的 (url, post_id)
+        pool = None
         
         for i, target_url in enumerate(urls, 1):
             # 提取 ID
@@ -328,6 +405,10 @@ def main():
                 skip_count += 1
                 continue
             
+            if DOWNLOAD_MODE == "http":
+                pending.append((target_url, post_id))
+                continue
+            
             # 下载图片（带重试）
             if download_image_with_retry(
                 driver, 
@@ -336,12 +417,52 @@ def main():
                 DOWNLOAD_DIRECTORY,
                 i,
                 len(urls),
-                MAX_RETRY
+                MAX_RETRY,
+                watcher=watcher,
+                clearance=clearance,
+                postprocessor=postprocessor
             ):
                 success_count += 1
             else:
                 fail_count += 1
         
+        if pending:
+            # 浏览器已通过验证，把 Cookies 和 User-Agent 交给 HTTP 线程池
+            print(f"\n⚡ 使用 {HTTP_WORKERS} 个 HTTP 线程并行下载 {len(pending)} 张图片...")
+            pool = HttpDownloadPool(
+                clearance,
+                DOWNLOAD_DIRECTORY,
+                workers=HTTP_WORKERS,
+                max_retry=MAX_RETRY,
+                postprocessor=postprocessor
+            )
+            on_success = lambda post_id: mark_as_downloaded(DOWNLOAD_DIRECTORY, post_id)
+            if size_scheduler.SIZE_LANES:
+                # 超大原图单独走并发数少的一道，不挡住后面的小图
+                ok, failed = size_scheduler.download_by_size(pool, pending, on_success=on_success)
+            else:
+                ok, failed = pool.download_all(pending, on_success=on_success)
+            success_count += ok
+            fail_count += failed
+
+        # 后处理发现不完整的图片：等校验全部结束后重新下载一次
+        if postprocessor is not None:
+            if pool is not None:
+                def redownload_fn(url, post_id):
+                    ok = pool.download(url, post_id)
+                    if ok:
+                        on_success(post_id)
+                    return ok
+            else:
+                def redownload_fn(url, post_id):
+                    return download_image_with_retry(
+                        driver, url, post_id, DOWNLOAD_DIRECTORY, 1, 1, MAX_RETRY,
+                        watcher=watcher, clearance=clearance, postprocessor=postprocessor
+                    )
+            _, failed = postprocessor.redownload(redownload_fn)
+            success_count -= failed
+            fail_count += failed
+        
         # 5. 输出统计信息
         print(f"\n{'='*60}")
         print(f"📊 下载统计:")
@@ -360,7 +481,12 @@ def main():
     finally:
         # 6. 清理和退出
         print("\n🧹 正在清理资源...")
+        if watcher is not None:
+            watcher.stop()
         driver.quit()
+        if postprocessor is not None:
+            postprocessor.close()
+        metrics.export()
         print("✅ 所有下载任务已处理完毕。")
 
 
@@ -1,6 +1,20 @@
 import cloudscraper
+import asyncio
 import re
 import os
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+from aimd import THROTTLE, AimdController, classify_response
+from clearance import is_challenge_response
+from session_pool import SessionPool, tune_session
+from http_cache import HttpCache
+from bulk_resolver import API_BASE, BulkResolver
+from crawl_state import CrawlState, is_date_ordered, query_key
+from download_watcher import post_id_from_filename
+from downloaded_index import get_downloaded_index
+from journal import CrawlJournal, journal_path
+import stream_extract
 
 # 检查并安装 cloudscraper 库（如果尚未安装）
 # try:
@@ -11,10 +25,27 @@ import os
 #     import cloudscraper
 #     print("cloudscraper 安装完成。")
 
-scraper = cloudscraper.create_scraper()  # 能绕过 Cloudflare 5s challenge
+# 列表页 / 详情页的磁盘缓存，重复爬取同一范围时几乎不再请求详情页（第一次请求时才创建缓存目录）
+USE_HTTP_CACHE = True
+http_cache = HttpCache() if USE_HTTP_CACHE else None
 
 # 定义文件路径
 OUTPUT_FILENAME = "download_urls.txt"
+# 帖子详情页 URL 模板
+DETAIL_URL_TEMPLATE = "https://anime-pictures.net/posts/{id}?by_tag=21508&lang=zh-cn"
+# 同时请求的详情页数量上限（即 Session 池大小）
+DETAIL_CONCURRENCY = 8
+# 预热连接时请求的地址
+PREWARM_URL = "https://anime-pictures.net/"
+# 优先从列表页内嵌数据和 JSON API 批量解析下载链接，只有解析不到的才访问详情页
+USE_BULK_RESOLVER = True
+# 增量模式：跳过已下载的帖子，按日期排序的查询遇到整页都是已知帖子时停止翻页
+INCREMENTAL = False
+DOWNLOAD_DIRECTORY = r"D:\VsCodeProjects\Dataset\2Dimages"  # 读取其中的下载索引以跳过已下载的帖子
+# 断点日志：每解析完一个帖子 / 一页就记录下来，中断后重新运行不再重复请求已完成的部分
+USE_JOURNAL = True
+# 详情页只读到原图链接出现为止，不下载和解码整页（缓存中保存的也是这段前缀）
+STREAM_EXTRACT = True
 
 def extract_post_ids(html: str) -> list[int]:
     """从列表页HTML中提取所有帖子的ID。"""
@@ -29,77 +60,323 @@ def extract_download_url(html: str) -> str | None:
     match = re.search(pattern, html)
     return match.group(0) if match else None
 
-def get_download_url_for_page(page_url: str) -> list[str]:
+def create_scraper_session():
+    """能绕过 Cloudflare 5s challenge 的 Session，每个只同时处理一个请求"""
+    return tune_session(cloudscraper.create_scraper())
+
+# 每个并发请求借用一个保持连接的 scraper，连续遇到验证页的会被重建
+scraper_pool = SessionPool(create_scraper_session, DETAIL_CONCURRENCY)
+
+# 自适应并发：实际同时进行的请求数在 1 到 DETAIL_CONCURRENCY 之间随服务器响应调整
+request_controller = AimdController(initial=2, maximum=DETAIL_CONCURRENCY)
+
+def has_download_url(resp) -> bool:
+    """详情页响应中能否解析出原图下载链接"""
+    return stream_extract.extract_download_url(resp.content) is not None
+
+def fetch_page(url: str, kind: str, stop_at=None):
     """
-    获取单个列表页中所有图片的下载链接。
-    
-    Args:
-        page_url: 列表页的URL。
-        
-    Returns:
-        一个包含所有下载链接的列表。
+    通过缓存访问页面（kind 为 "listing" 或 "detail"，决定缓存有效期）。
+
+    stop_at 为预编译的字节正则时以流式读取，第一次匹配后就停止，返回的响应只包含已读的前缀。
+    """
+    outcomes = []  # get() 中对网络响应的判断，供下面统计时复用
+
+    def get(u: str, headers: dict | None = None):
+        # 只有真正发请求时才占用自适应并发的名额，缓存命中不经过这里，也不用排队
+        with request_controller.slot() as slot, scraper_pool.session() as session:
+            if stop_at is None:
+                resp = session.get(u, headers=headers)
+            else:
+                resp = stream_extract.read_until_match(session.get(u, headers=headers, stream=True), stop_at)
+            scraper_pool.report(session, ok=not is_challenge_response(resp))
+            outcome = classify_response(resp)
+            outcomes.append(outcome)
+            slot.report(outcome)
+            return resp
+
+    with metrics.stage(kind):
+        if http_cache is None:
+            resp = get(url)
+        else:
+            # 没有解析出下载链接的详情页（验证页、临时错误页）不缓存，否则会在有效期内一直被当作"没有链接"
+            cacheable = has_download_url if kind == "detail" else None
+            resp = http_cache.get(get, url, kind, cacheable=cacheable)
+        # 缓存命中（包括 304 重验证后沿用缓存）不反映服务器状态
+        outcome = None if getattr(resp, "from_cache", False) or not outcomes else outcomes[-1]
+        if outcome is None:
+            metrics.inc("cache_hits_total", stage=kind)
+        else:
+            metrics.inc("bytes_total", len(resp.content), stage=kind)
+        if outcome == THROTTLE:
+            metrics.inc("throttled_total", stage=kind)
+        return resp
+
+def fetch_listing(page_url: str, strict: bool = False) -> tuple[list[int], str]:
+    """
+    访问列表页，返回 (帖子ID列表, 列表页文本)，失败时返回空列表。
+
+    strict 为 True 时请求失败抛出 RuntimeError，调用方可以区分"请求失败"和"这一页没有帖子"。
     """
-    print(f"\n--- 正在处理列表页: {page_url} ---")
-    
-    # 1. 访问列表页
     try:
-        resp = scraper.get(page_url)
+        resp = fetch_page(page_url, "listing")
         print(f"列表页状态码: {resp.status_code}")
         if resp.status_code != 200:
+            if strict:
+                raise RuntimeError(f"列表页状态码 {resp.status_code}")
             print(f"访问列表页失败，跳过。")
-            return []
+            return [], ""
+    except RuntimeError:
+        raise
     except Exception as e:
+        if strict:
+            raise RuntimeError(f"访问列表页时发生错误: {e}") from e
         print(f"访问列表页时发生错误: {e}")
-        return []
+        return [], ""
 
-    # 2. 提取帖子ID
-    ids = extract_post_ids(resp.text)
+    # 提取帖子ID（直接扫描原始字节，不解码整页）
+    ids = stream_extract.extract_post_ids(resp.content)
     ids = ids[:80] # 根据原代码逻辑，这里可以限制数量，但如果想获取全部，可以去掉或调整
     print(f"提取到 {len(ids)} 个帖子ID。")
+    # 列表页文本只有批量解析时才用得到
+    return ids, resp.text if USE_BULK_RESOLVER else ""
+
+def fetch_listing_ids(page_url: str) -> list[int]:
+    """访问列表页并提取帖子ID，失败时返回空列表。"""
+    return fetch_listing(page_url)[0]
+
+def fetch_download_url(post_id: int) -> str | None:
+    """访问单个帖子详情页并提取原图下载链接，失败时返回 None。"""
+    # 构造详情页URL
+    pic_url = DETAIL_URL_TEMPLATE.format(id=post_id)
+
+    try:
+        stop_at = stream_extract.DOWNLOAD_URL_BYTES if STREAM_EXTRACT else None
+        resp_pic = fetch_page(pic_url, "detail", stop_at=stop_at)
+        if resp_pic.status_code == 200:
+            return stream_extract.extract_download_url(resp_pic.content)
+    except Exception as e:
+        print(f"访问帖子 {post_id} 时发生错误: {e}")
+
+    return None
+
+async def resolve_download_urls_async(ids: list[int], concurrency: int = DETAIL_CONCURRENCY, on_resolved=None) -> list[str | None]:
+    """
+    以有限并发批量解析帖子详情页的下载链接。
     
-    final_urls = []
-    
-    # 3. 遍历帖子ID，访问详情页并提取下载链接
-    for i, id in enumerate(ids):
-        # 构造详情页URL
-        pic_url = f"https://anime-pictures.net/posts/{id}?by_tag=21508&lang=zh-cn"
+    Args:
+        ids: 帖子ID列表。
+        concurrency: 同时进行的详情页请求数量上限。
+        on_resolved: 每解析出一个链接就调用 on_resolved(post_id, url)（例如写入断点日志）。
         
-        try:
-            resp_pic = scraper.get(pic_url)
-            # print(f"  - 帖子 {id} 状态码: {resp_pic.status_code}")
-            
-            if resp_pic.status_code == 200:
-                download_url = extract_download_url(resp_pic.text)
-                if download_url:
-                    final_urls.append(download_url)
-                else:
-                    # print(f"  - 帖子 {id} 未找到下载链接。")
-                    pass
-            
-        except Exception as e:
-            print(f"访问帖子 {id} 时发生错误: {e}")
-            
+    Returns:
+        与 ids 一一对应的下载链接列表，未找到或请求失败的位置为 None。
+    """
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(concurrency)
+    processed = 0
+    collected = 0
+
+    async def resolve_one(executor: ThreadPoolExecutor, post_id: int) -> str | None:
+        nonlocal processed, collected
+        async with semaphore:
+            download_url = await loop.run_in_executor(executor, fetch_download_url, post_id)
+
+        processed += 1
+        if download_url:
+            collected += 1
+            if on_resolved is not None:
+                on_resolved(post_id, download_url)
         # 打印进度
-        if (i + 1) % 10 == 0 or (i + 1) == len(ids):
-            print(f"  -> 已处理 {i + 1}/{len(ids)} 个帖子，已收集 {len(final_urls)} 个链接。")
+        if processed % 10 == 0 or processed == len(ids):
+            print(f"  -> 已处理 {processed}/{len(ids)} 个帖子，已收集 {collected} 个链接。")
+        return download_url
+
+    # cloudscraper 是同步库，请求放到专用线程池中执行，线程数与并发数一致
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        return await asyncio.gather(*(resolve_one(executor, post_id) for post_id in ids))
+
+def get_download_url_for_page(page_url: str, concurrency: int = DETAIL_CONCURRENCY) -> list[str]:
+    """
+    获取单个列表页中所有图片的下载链接。
+    
+    Args:
+        page_url: 列表页的URL。
+        concurrency: 详情页并发请求数量。
+        
+    Returns:
+        一个包含所有下载链接的列表。
+    """
+    print(f"\n--- 正在处理列表页: {page_url} ---")
+    
+    # 1. 访问列表页并提取帖子ID
+    ids, listing_text = fetch_listing(page_url)
+    if not ids:
+        return []
+    
+    # 2. 解析下载链接
+    return resolve_page_urls(ids, page_url, listing_text, concurrency=concurrency)
+
+def resolve_page_urls(
+    ids: list[int],
+    page_url: str,
+    listing_text: str,
+    concurrency: int = DETAIL_CONCURRENCY,
+    journal: CrawlJournal | None = None,
+    page: int | None = None,
+) -> list[str]:
+    """
+    把一个列表页中的帖子ID解析为下载链接（保持列表页顺序，去掉解析失败的）。
+
+    提供 journal 时，该页中已记录的帖子直接复用，新解析出的链接逐个写入日志。
+    """
+    known = journal.resolved_posts(page) if journal is not None else {}
+    pending = [post_id for post_id in ids if post_id not in known]
+    if known:
+        print(f"📒 其中 {len(ids) - len(pending)} 个帖子已在断点日志中，跳过。")
+
+    def on_resolved(post_id: int, url: str):
+        if journal is not None:
+            journal.record_post(page, post_id, url)
+
+    def detail_fallback(missing: list[int]) -> list[str | None]:
+        # 并发访问详情页并提取下载链接（结果保持列表页顺序）
+        return asyncio.run(resolve_download_urls_async(missing, concurrency=concurrency, on_resolved=on_resolved))
+
+    if not pending:
+        results = []
+    elif USE_BULK_RESOLVER:
+        resolver = BulkResolver(lambda url: fetch_page(url, "listing"), detail_fallback, API_BASE)
+        results = resolver.resolve(pending, page_url, listing_text)
+    else:
+        results = detail_fallback(pending)
+
+    resolved = dict(known)
+    for post_id, url in zip(pending, results):
+        if url:
+            on_resolved(post_id, url)
+            resolved[post_id] = url
+    final_urls = [resolved[post_id] for post_id in ids if post_id in resolved]
 
     return final_urls
 
-def run_scraper_and_save(start_page: int, end_page: int, base_url_template: str):
+def run_scraper_and_save(
+    start_page: int,
+    end_page: int,
+    base_url_template: str,
+    concurrency: int = DETAIL_CONCURRENCY,
+    incremental: bool = False,
+    download_dir: str | None = None,
+):
     """
     循环遍历指定页码范围，获取所有下载链接并保存到文件。
+
+    增量模式下会在访问详情页之前去掉已下载（download_dir 的下载索引中）的帖子；
+    对按日期排序的查询，还会跳过不超过上次高水位的帖子，并在整页都是已知帖子时停止翻页。
+    高水位只在从 start_page 起处理过的页都完整解析时前移：接上了已知的帖子（或列表末尾），
+    或者从第 1 页开始（例如每晚固定爬取前 N 页），都记录见到的最新帖子；
+    中途有页失败或有帖子没解析出链接时保持不变。
+
+    启用断点日志（USE_JOURNAL）时，中断后用相同参数重新运行会跳过已完成的页，
+    并只解析未完成页中还没有记录的帖子。
     """
     all_download_urls = []
+    journal = CrawlJournal(journal_path(base_url_template)) if USE_JOURNAL else None
+    scraper_pool.prewarm(PREWARM_URL)
+
+    if incremental:
+        state = CrawlState()
+        key = query_key(base_url_template)
+        # 只有按日期排序时，“比上次最新的帖子更旧”才意味着已经处理过
+        use_high_water = is_date_ordered(base_url_template)
+        high_water = state.high_water(key) if use_high_water else 0
+        index = get_downloaded_index(download_dir) if download_dir and os.path.isdir(download_dir) else None
+        newest_seen = high_water
+        covered = True  # 从 start_page 起到当前页为止都完整处理了
+        reached = False  # 连续处理的页已经接上了已知的帖子或列表末尾
+        print(f"🔁 增量模式：高水位 {high_water}，下载索引 {'已加载' if index is not None else '未使用'}")
+
+        def is_known(post_id: int) -> bool:
+            return post_id <= high_water or (index is not None and str(post_id) in index)
+
+        def track(page: int, ids: list[int], urls: list[str]):
+            """连续完整的页才推进 newest_seen，有帖子没解析出链接时之后的页都不再推进"""
+            nonlocal newest_seen, covered, reached
+            if not covered:
+                return
+            resolved = {post_id_from_filename(url) for url in urls}
+            missing = [post_id for post_id in ids if not is_known(post_id) and str(post_id) not in resolved]
+            if missing:
+                print(f"⚠️ 第 {page} 页有 {len(missing)} 个帖子未解析出链接，本次不更新高水位。")
+                covered = False
+                return
+            newest_seen = max(newest_seen, max(ids))
+            if min(ids) <= high_water:
+                reached = True
     
-    for page in range(start_page, end_page + 1):
-        # 构造当前页的URL
-        current_url = base_url_template.format(page=page)
-        
-        # 获取当前页的所有下载链接
-        urls_for_page = get_download_url_for_page(current_url)
-        
-        # 将结果添加到总列表中
-        all_download_urls.extend(urls_for_page)
+    try:
+        for page in range(start_page, end_page + 1):
+            # 构造当前页的URL
+            current_url = base_url_template.format(page=page)
+
+            done = journal.page_done(page) if journal is not None else None
+            if done is not None:
+                ids, urls_for_page = done
+                print(f"\n📒 第 {page} 页已在断点日志中完成，跳过（{len(urls_for_page)} 个链接）。")
+                if incremental and ids:
+                    track(page, ids, urls_for_page)
+                all_download_urls.extend(urls_for_page)
+                continue
+
+            print(f"\n--- 正在处理列表页: {current_url} ---")
+            try:
+                ids, listing_text = fetch_listing(current_url, strict=True)
+            except RuntimeError as e:
+                print(f"{e}，跳过。")
+                if incremental:
+                    covered = False
+                continue
+            if not ids:
+                # 请求成功但没有帖子：已经翻过了列表末尾
+                if incremental:
+                    reached = reached or covered
+                continue
+
+            if not incremental:
+                new_ids = ids
+            else:
+                new_ids = [post_id for post_id in ids if not is_known(post_id)]
+                print(f"其中新帖子 {len(new_ids)} 个。")
+                if not new_ids:
+                    track(page, ids, [])
+                    if use_high_water:
+                        reached = reached or covered
+                        print(f"⏹️ 整页都是已知帖子，停止翻页。")
+                        break
+                    continue
+
+            # 获取当前页的所有下载链接
+            urls_for_page = resolve_page_urls(
+                new_ids, current_url, listing_text, concurrency=concurrency, journal=journal, page=page
+            )
+            if journal is not None:
+                journal.record_page(page, ids, urls_for_page)
+            if incremental:
+                track(page, ids, urls_for_page)
+
+            # 将结果添加到总列表中
+            all_download_urls.extend(urls_for_page)
+    finally:
+        # 中断时也把缓冲区中的记录写到磁盘
+        if journal is not None:
+            journal.close()
+
+    if incremental and use_high_water:
+        # 从第 1 页开始时，最新的帖子都在处理过的页里，没接上旧高水位也可以记录
+        if reached or (covered and start_page == 1):
+            state.update(key, newest_seen)
+        else:
+            print(f"ℹ️ 处理过的页不完整或没有从第 1 页开始，高水位 {high_water} 保持不变。")
         
     print(f"\n==========================================")
     print(f"✅ 所有页面处理完成。")
@@ -116,10 +393,22 @@ def run_scraper_and_save(start_page: int, end_page: int, base_url_template: str)
     print(f"🔗 所有唯一的下载链接已保存到文件: **{OUTPUT_FILENAME}**")
     print(f"文件中共有 {len(unique_urls)} 个唯一的链接。")
 
+    # 结果已经完整保存，断点日志不再需要
+    if journal is not None:
+        journal.remove()
+
 
 # --- 运行主程序 ---
 # 列表页的基础URL模板，{page} 会被替换
 BASE_URL_TEMPLATE = "https://anime-pictures.net/posts?page={page}&search_tag=girl&order_by=rating&ldate=4&lang=zh-cn"
 
-# 运行循环从 page 12 到 20 (包含 20)
-run_scraper_and_save(start_page=21, end_page=50, base_url_template=BASE_URL_TEMPLATE)
\ No newline at end of file
+if __name__ == "__main__":
+    # 运行循环从 page 12 到 20 (包含 20)
+    run_scraper_and_save(
+        start_page=21,
+        end_page=50,
+        base_url_template=BASE_URL_TEMPLATE,
+        incremental=INCREMENTAL,
+        download_dir=DOWNLOAD_DIRECTORY,
+    )
+    metrics.export()
@@ -0,0 +1,253 @@
+"""
+流水线模式：边爬取边下载，不再等待 download_urls.txt 全部生成。
+
+列表页 -> 详情页解析 -> 下载 -> 记录，四个阶段之间用有界队列连接，
+下游变慢时上游会阻塞在 put() 上，内存占用不会无限增长。
+"""
+
+import os
+import queue
+import threading
+import time
+
+import metrics
+import new_crawler
+import my_operator_v2
+from http_downloader import HttpDownloadPool
+from download_watcher import start_download_watcher
+from postprocess import start_postprocessor
+
+# --- 配置参数 ---
+BASE_URL_TEMPLATE = new_crawler.BASE_URL_TEMPLATE
+START_PAGE = 21
+END_PAGE = 50
+RESOLVE_WORKERS = new_crawler.DETAIL_CONCURRENCY  # 详情页解析线程数
+DOWNLOAD_MODE = my_operator_v2.DOWNLOAD_MODE  # "browser" 或 "http"
+DOWNLOAD_WORKERS = 1  # browser 模式下的下载线程数（单个浏览器只能串行下载）
+QUEUE_SIZE = 100  # 每个阶段之间队列的最大长度
+
+# 队列结束标记
+_DONE = object()
+
+
+class PipelineStats:
+    """流水线各阶段计数（线程安全）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = {
+            "pages": 0,
+            "posts": 0,
+            "resolved": 0,
+            "started": 0,
+            "skipped": 0,
+            "success": 0,
+            "failed": 0,
+        }
+
+    def inc(self, name: str, n: int = 1) -> int:
+        with self._lock:
+            self.counts[name] += n
+            return self.counts[name]
+
+
+def _start_stage(name: str, func, in_queue: queue.Queue, out_queue: queue.Queue | None, workers: int) -> list[threading.Thread]:
+    """
+    启动一个由 workers 个线程组成的阶段。
+
+    Args:
+        name: 阶段名称（用于线程名和日志）
+        func: 处理函数，接收一个输入并返回要送往下游的结果列表
+        in_queue: 输入队列
+        out_queue: 输出队列，最后一个阶段为 None
+        workers: 线程数
+
+    Returns:
+        已启动的线程列表
+    """
+    remaining = [workers]
+    lock = threading.Lock()
+
+    def worker():
+        while True:
+            item = in_queue.get()
+            if item is _DONE:
+                # 放回结束标记，让同阶段的其他线程也能退出
+                in_queue.put(_DONE)
+                break
+            try:
+                with metrics.stage(f"pipeline_{name}"):
+                    results = func(item)
+                for result in results:
+                    if out_queue is not None:
+                        out_queue.put(result)
+            except Exception as e:
+                print(f"⚠️ [{name}] 处理 {item} 时发生错误: {e}")
+
+        # 最后一个退出的线程负责通知下游
+        with lock:
+            remaining[0] -= 1
+            is_last = remaining[0] == 0
+        if is_last and out_queue is not None:
+            out_queue.put(_DONE)
+
+    threads = [
+        threading.Thread(target=worker, name=f"{name}-{i}", daemon=True)
+        for i in range(max(1, workers))
+    ]
+    remaining[0] = len(threads)
+    for t in threads:
+        t.start()
+    return threads
+
+
+def run_pipeline(
+    start_page: int,
+    end_page: int,
+    base_url_template: str,
+    download_fn,
+    download_dir: str = my_operator_v2.DOWNLOAD_DIRECTORY,
+    resolve_workers: int = RESOLVE_WORKERS,
+    download_workers: int = DOWNLOAD_WORKERS,
+    queue_size: int = QUEUE_SIZE,
+) -> dict:
+    """
+    以流水线方式爬取并下载指定页码范围内的所有图片。
+
+    Args:
+        start_page: 起始页（包含）
+        end_page: 结束页（包含）
+        base_url_template: 列表页 URL 模板，{page} 会被替换
+        download_fn: 下载函数 download_fn(url, post_id, index, total) -> bool
+        download_dir: 下载目录（用于跳过已下载的图片和记录）
+        resolve_workers: 详情页解析线程数
+        download_workers: 下载线程数
+        queue_size: 阶段间队列的最大长度
+
+    Returns:
+        各阶段计数
+    """
+    stats = PipelineStats()
+    new_crawler.scraper_pool.prewarm(new_crawler.PREWARM_URL)
+    id_queue = queue.Queue(maxsize=queue_size)
+    url_queue = queue.Queue(maxsize=queue_size)
+    record_queue = queue.Queue(maxsize=queue_size)
+
+    def resolve(post_id: int) -> list[tuple[str, str]]:
+        # 已下载的帖子在访问详情页之前就跳过
+        exists, _ = my_operator_v2.check_file_exists(download_dir, str(post_id))
+        if exists:
+            stats.inc("skipped")
+            return []
+        download_url = new_crawler.fetch_download_url(post_id)
+        if not download_url:
+            return []
+        stats.inc("resolved")
+        return [(download_url, str(post_id))]
+
+    def download(item: tuple[str, str]) -> list[str]:
+        url, post_id = item
+        index = stats.inc("started")
+        if download_fn(url, post_id, index, stats.counts["resolved"]):
+            stats.inc("success")
+            return [post_id]
+        stats.inc("failed")
+        return []
+
+    def record(post_id: str) -> list:
+        my_operator_v2.mark_as_downloaded(download_dir, post_id)
+        return []
+
+    start_time = time.time()
+    threads = []
+    threads += _start_stage("resolve", resolve, id_queue, url_queue, resolve_workers)
+    threads += _start_stage("download", download, url_queue, record_queue, download_workers)
+    threads += _start_stage("record", record, record_queue, None, 1)
+
+    # 列表页阶段在当前线程运行，队列满时自然阻塞
+    for page in range(start_page, end_page + 1):
+        page_url = base_url_template.format(page=page)
+        print(f"\n--- 正在处理列表页: {page_url} ---")
+        ids = new_crawler.fetch_listing_ids(page_url)
+        stats.inc("pages")
+        stats.inc("posts", len(ids))
+        for post_id in ids:
+            id_queue.put(post_id)
+
+    id_queue.put(_DONE)
+    for t in threads:
+        t.join()
+
+    elapsed = time.time() - start_time
+    print(f"\n{'='*60}")
+    print(f"📊 流水线统计 (耗时 {elapsed:.1f}s):")
+    print(f"   📄 列表页: {stats.counts['pages']} 页, 帖子: {stats.counts['posts']} 个")
+    print(f"   🔗 解析到链接: {stats.counts['resolved']} 个")
+    print(f"   ✅ 成功: {stats.counts['success']} 个")
+    print(f"   🟢 跳过: {stats.counts['skipped']} 个")
+    print(f"   ❌ 失败: {stats.counts['failed']} 个")
+    print(f"{'='*60}")
+    return stats.counts
+
+
+def main():
+    download_dir = my_operator_v2.DOWNLOAD_DIRECTORY
+    if not os.path.exists(download_dir):
+        os.makedirs(download_dir)
+        print(f"📁 创建下载目录: {download_dir}")
+
+    print("\n🚀 正在启动浏览器...")
+    driver = my_operator_v2.setup_edge_driver(download_dir)
+    watcher = start_download_watcher(download_dir)
+    stop_exporter = metrics.start_exporter()
+    postprocessor = start_postprocessor(download_dir)
+
+    try:
+        my_operator_v2.pass_cloudflare(driver)
+        clearance = my_operator_v2.create_clearance_manager(driver)
+
+        def browser_download(url: str, post_id: str, index: int, total: int) -> bool:
+            return my_operator_v2.download_image_with_retry(
+                driver, url, post_id, download_dir, index, total,
+                record=False, watcher=watcher, clearance=clearance, postprocessor=postprocessor
+            )
+
+        if DOWNLOAD_MODE == "http":
+            # 浏览器只负责通过验证，下载阶段由多个 HTTP 线程完成
+            pool = HttpDownloadPool(
+                clearance,
+                download_dir,
+                max_retry=my_operator_v2.MAX_RETRY,
+                postprocessor=postprocessor
+            )
+            download_fn = lambda url, post_id, index, total: pool.download(url, post_id)
+            run_pipeline(START_PAGE, END_PAGE, BASE_URL_TEMPLATE, download_fn, download_dir,
+                         download_workers=pool.workers)
+        else:
+            download_fn = browser_download
+            run_pipeline(START_PAGE, END_PAGE, BASE_URL_TEMPLATE, download_fn, download_dir)
+
+        # 后处理发现不完整的图片：流水线结束后重新下载一次
+        if postprocessor is not None:
+            def redownload_fn(url, post_id):
+                ok = download_fn(url, post_id, 1, 1)
+                if ok:
+                    my_operator_v2.mark_as_downloaded(download_dir, post_id)
+                return ok
+
+            postprocessor.redownload(redownload_fn)
+    except KeyboardInterrupt:
+        print("\n\n⚠️ 用户中断下载")
+    finally:
+        print("\n🧹 正在清理资源...")
+        if watcher is not None:
+            watcher.stop()
+        driver.quit()
+        if postprocessor is not None:
+            postprocessor.close()
+        if stop_exporter is not None:
+            stop_exporter()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,264 @@
+"""
+下载后处理：在独立的进程池中校验图片并生成预览图，下载循环只负责提交任务，从不等待。
+
+- 先看文件头的魔数，再用 Pillow 完整解码一次判断是否完整；
+  未安装 Pillow 时退而检查文件尾附近有没有结束标记（JPEG 的 FFD9、PNG 的 IEND、GIF 的 3B）；
+- 不完整的文件先保留，下载结束后 redownload() 重新下载：下载期间旧文件移到 .suspect/，
+  成功后删除旧文件，失败时放回原处；
+- 可解码的图片在同目录的 .thumbs/ 下生成缩小的 WebP 预览，下游只读预览即可，不必再解码原图。
+
+未安装 Pillow 时只做魔数和结束标记检查，不生成预览。默认关闭（POSTPROCESS = False）。
+"""
+
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    from PIL import Image
+except ImportError:  # 未安装 Pillow 时只做文件头 / 文件尾检查
+    Image = None
+
+from downloaded_index import get_downloaded_index
+import storage_layout
+
+POSTPROCESS = False  # 是否在下载完成后校验图片并生成预览
+POSTPROCESS_WORKERS = max(1, (os.cpu_count() or 2) - 1)  # 进程数，留一个核心给下载循环
+THUMBNAIL_DIRECTORY = ".thumbs"  # 预览图所在的子目录（与原图同一目录下）
+SUSPECT_DIRECTORY = ".suspect"  # 重新下载期间存放旧文件的子目录（不会被当作已下载的文件）
+TAIL_BYTES = 4096  # 在文件最后多少字节中查找结束标记（结束标记后可能还有填充或附加数据）
+THUMBNAIL_SIZE = 512  # 预览图长边的像素数
+THUMBNAIL_QUALITY = 80  # WebP 质量
+MAX_IMAGE_PIXELS = 300_000_000  # Pillow 的解压炸弹保护阈值，高分辨率原图可能超过默认值
+
+OK = "ok"
+TRUNCATED = "truncated"
+INVALID = "invalid"
+MISSING = "missing"
+
+# 魔数 -> 格式
+MAGIC_NUMBERS = (
+    (b'\xff\xd8\xff', "jpeg"),
+    (b'\x89PNG\r\n\x1a\n', "png"),
+    (b'GIF87a', "gif"),
+    (b'GIF89a', "gif"),
+    (b'BM', "bmp"),
+    (b'II*\x00', "tiff"),
+    (b'MM\x00*', "tiff"),
+)
+# 格式 -> 完整文件末尾附近应有的结束标记
+TRAILERS = {
+    "jpeg": b'\xff\xd9',
+    "png": b'IEND\xaeB`\x82',
+    "gif": b'\x3b',
+}
+
+
+def sniff_format(head: bytes) -> str | None:
+    """按文件头判断图片格式，不是图片时返回 None"""
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return "webp"
+    for magic, name in MAGIC_NUMBERS:
+        if head.startswith(magic):
+            return name
+    return None
+
+
+def check_structure(path: str) -> tuple[str, str]:
+    """
+    只读文件头尾检查是否为完整图片（未安装 Pillow 时的判断依据）。
+
+    结束标记之后常有换行、填充或附加数据，所以只要求它出现在文件尾部，而不要求是最后几个字节。
+
+    Returns:
+        (状态, 说明)
+    """
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        head = f.read(16)
+        kind = sniff_format(head)
+        if kind is None:
+            return INVALID, f"未知的文件头 {head[:8].hex()}"
+        if kind == "webp":
+            # RIFF 头中记录了正文长度
+            declared = int.from_bytes(head[4:8], "little") + 8
+            if size < declared:
+                return TRUNCATED, f"webp {size}/{declared} bytes"
+            return OK, kind
+        trailer = TRAILERS.get(kind)
+        if trailer:
+            f.seek(max(0, size - TAIL_BYTES))
+            if trailer not in f.read():
+                return TRUNCATED, f"{kind} 缺少结束标记"
+    return OK, kind
+
+
+def thumbnail_path(path: str) -> str:
+    directory, filename = os.path.split(path)
+    return os.path.join(directory, THUMBNAIL_DIRECTORY, os.path.splitext(filename)[0] + ".webp")
+
+
+def process_image(download_dir: str, post_id: str, filename: str | None) -> tuple[str, str | None, str]:
+    """
+    在工作进程中运行：找到文件、校验并生成预览。
+
+    Returns:
+        (状态, 文件路径, 说明)
+    """
+    path = storage_layout.find_post(download_dir, post_id, filename)
+    if path is None:
+        return MISSING, None, "找不到下载的文件"
+    try:
+        status, detail = check_structure(path)
+    except OSError as e:
+        return MISSING, path, str(e)
+    # 有 Pillow 时以完整解码的结果为准，文件尾检查只在没有 Pillow 时决定结果
+    if status == INVALID or Image is None:
+        return status, path, detail
+
+    Image.MAX_IMAGE_PIXELS = MAX_IMAGE_PIXELS
+    try:
+        with Image.open(path) as img:
+            img.load()  # 完整解码，数据不完整时抛出 OSError
+            img.thumbnail((THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+            if img.mode not in ("RGB", "RGBA"):
+                img = img.convert("RGBA" if "A" in img.getbands() or "transparency" in img.info else "RGB")
+            target = thumbnail_path(path)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            img.save(target, "WEBP", quality=THUMBNAIL_QUALITY)
+    except Image.DecompressionBombError as e:
+        return OK, path, f"图片过大，未生成预览: {e}"
+    except (OSError, SyntaxError, ValueError) as e:
+        # Pillow 对截断和损坏的数据分别抛出 OSError / SyntaxError
+        return (TRUNCATED if "truncated" in str(e).lower() else INVALID), path, str(e)
+    return OK, path, detail
+
+
+class PostProcessor:
+    """把下载完成的图片交给进程池处理，submit() 立即返回"""
+
+    def __init__(self, download_dir: str, workers: int = POSTPROCESS_WORKERS):
+        """
+        Args:
+            download_dir: 下载目录
+            workers: 进程数
+        """
+        self.download_dir = download_dir
+        self._executor = ProcessPoolExecutor(max_workers=workers)
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)  # 所有任务的回调都执行完时通知
+        self._futures = set()
+        self._requeued = []  # 不完整、需要重新下载的 (url, post_id, 文件路径)
+        self.counts = {OK: 0, TRUNCATED: 0, INVALID: 0, MISSING: 0}
+
+    def submit(self, post_id: str, url: str):
+        """
+        提交一张下载完成的图片（不阻塞）。
+
+        Args:
+            post_id: 帖子 ID
+            url: 下载 URL，用于推出文件名和重新下载
+        """
+        # 延迟导入：http_downloader 依赖 requests，进程池本身不需要
+        from http_downloader import filename_from_url
+
+        future = self._executor.submit(process_image, self.download_dir, str(post_id), filename_from_url(url))
+        with self._lock:
+            self._futures.add(future)
+        future.add_done_callback(lambda f: self._done(f, url, str(post_id)))
+
+    def _done(self, future, url: str, post_id: str):
+        try:
+            self._handle(future, url, post_id)
+        finally:
+            # 处理完结果后才移除，drain() 看到集合为空时所有需要重新下载的图片都已登记
+            with self._lock:
+                self._futures.discard(future)
+                if not self._futures:
+                    self._idle.notify_all()
+
+    def _handle(self, future, url: str, post_id: str):
+        try:
+            status, path, detail = future.result()
+        except Exception as e:
+            print(f"⚠️ 后处理出错 [ID: {post_id}]: {e}")
+            return
+        with self._lock:
+            self.counts[status] += 1
+        if status == TRUNCATED:
+            print(f"🧩 文件不完整，稍后重新下载 [ID: {post_id}]: {detail}")
+            with self._lock:
+                self._requeued.append((url, post_id, path))
+        elif status == INVALID:
+            print(f"⚠️ 不是有效的图片 [ID: {post_id}]: {detail}")
+
+    def drain(self) -> list[tuple[str, str, str]]:
+        """
+        等待已提交的任务全部完成，取出需要重新下载的图片。
+
+        Returns:
+            (url, post_id, 文件路径) 列表
+        """
+        with self._lock:
+            while self._futures:
+                self._idle.wait()
+            requeued, self._requeued = self._requeued, []
+        return requeued
+
+    def redownload(self, download_fn) -> tuple[int, int]:
+        """
+        等待校验全部结束，重新下载不完整的图片。
+
+        下载期间旧文件移到同目录的 .suspect/ 下（浏览器不会因为同名文件另存为 "(1)"），
+        下载成功后删除旧文件；失败时把旧文件放回原处，并从下载索引中移除该 ID，下次运行时再试。
+
+        Args:
+            download_fn: 下载函数 download_fn(url, post_id) -> bool，成功时应自行记录到下载索引
+
+        Returns:
+            (成功数, 失败数)
+        """
+        requeued = self.drain()
+        if not requeued:
+            return 0, 0
+        print(f"\n🔁 重新下载 {len(requeued)} 张不完整的图片...")
+        success = 0
+        failed_ids = []
+        for url, post_id, path in requeued:
+            aside = os.path.join(os.path.dirname(path), SUSPECT_DIRECTORY, os.path.basename(path))
+            try:
+                os.makedirs(os.path.dirname(aside), exist_ok=True)
+                os.replace(path, aside)
+            except OSError:
+                aside = None  # 旧文件已不在原处
+            ok = False
+            try:
+                ok = download_fn(url, post_id)
+            finally:
+                if aside is not None:
+                    if ok:
+                        os.remove(aside)
+                    elif not os.path.exists(path):
+                        os.replace(aside, path)
+            if ok:
+                success += 1
+            else:
+                failed_ids.append(post_id)
+        if failed_ids:
+            get_downloaded_index(self.download_dir).discard(failed_ids)
+        return success, len(failed_ids)
+
+    def close(self):
+        """等待剩余任务并关闭进程池"""
+        self._executor.shutdown(wait=True)
+        print(f"🖼️ 后处理: 正常 {self.counts[OK]}，不完整 {self.counts[TRUNCATED]}，"
+              f"无效 {self.counts[INVALID]}，未找到 {self.counts[MISSING]}")
+
+
+def start_postprocessor(download_dir: str) -> PostProcessor | None:
+    """启用后处理时创建 PostProcessor，否则返回 None"""
+    if not POSTPROCESS:
+        return None
+    if Image is None:
+        print("ℹ️ 未安装 Pillow，后处理只检查文件头尾，不生成预览（pip install pillow）")
+    return PostProcessor(download_dir)
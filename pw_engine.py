@@ -0,0 +1,248 @@
+"""
+基于 Playwright 的异步浏览器引擎：一个浏览器进程内运行多个相互隔离的上下文（context），
+各上下文的页面在同一个事件循环里并发执行。
+
+提供与 Selenium 流程相同的操作：通过 Cloudflare 验证、登录、设置每页数量、触发下载。
+验证只需在一个上下文中通过一次，其余上下文复制它的 Cookies（storage_state）。
+
+用法：
+    python pw_engine.py
+"""
+
+import asyncio
+import os
+
+try:
+    from playwright.async_api import Error as PlaywrightError, async_playwright
+except ImportError:  # 未安装 playwright 时其他模块仍可正常导入
+    PlaywrightError = Exception
+    async_playwright = None
+
+from aimd import is_challenge_text
+from login import LOGIN_URL
+from my_operator_v2 import (
+    DOWNLOAD_DIRECTORY,
+    FILENAME,
+    MAX_RETRY,
+    REFRESH_PAGE_URL,
+    TIMEOUT,
+    check_file_exists,
+    extract_post_id_from_url,
+    mark_as_downloaded,
+    read_download_urls,
+)
+from set_maxpage import SETTINGS_URL
+import storage_layout
+
+PW_CONTEXTS = 4  # 同一浏览器内的上下文数量（即并发下载的页面数）
+HEADLESS = False  # 无头模式更容易被 Cloudflare 拦截，默认显示窗口
+CHALLENGE_TIMEOUT = 30  # 等待 Cloudflare 验证通过的最长时间（秒）
+
+LOGIN_USERNAME_XPATH = '//*[@id="svelte"]/div/div[1]/div[1]/div/div/form/table/tbody/tr[1]/td[2]/input'
+LOGIN_PASSWORD_XPATH = '//*[@id="svelte"]/div/div[1]/div[1]/div/div/form/table/tbody/tr[2]/td[2]/input'
+LOGIN_SUBMIT_XPATH = '//*[@id="svelte"]/div/div[1]/div[1]/div/div/form/table/tbody/tr[3]/td[2]/input'
+PER_PAGE_XPATH = '//*[@id="svelte"]/div/div[1]/div[1]/div/div[2]/div[2]/table/tbody/tr[6]/td[2]/input'
+SETTINGS_SUBMIT_XPATH = '//*[@id="svelte"]/div/div[1]/div[1]/div/div[2]/div[2]/input'
+
+
+async def pass_cloudflare(page, url: str = REFRESH_PAGE_URL, timeout: float = CHALLENGE_TIMEOUT) -> bool:
+    """
+    打开 url 并等待 Cloudflare 验证页消失。
+
+    Returns:
+        是否在超时前通过验证
+    """
+    await page.goto(url, wait_until="domcontentloaded")
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while is_challenge_text(await page.content()):
+        if loop.time() > deadline:
+            print("⚠️ 等待 Cloudflare 验证超时")
+            return False
+        await page.wait_for_timeout(500)
+    return True
+
+
+async def login(page, username: str, password: str):
+    """登录账号（与 login.login 相同的流程）"""
+    await page.goto(LOGIN_URL)
+    await page.fill(f"xpath={LOGIN_USERNAME_XPATH}", username)
+    await page.fill(f"xpath={LOGIN_PASSWORD_XPATH}", password)
+    async with page.expect_navigation(wait_until="networkidle"):
+        await page.click(f"xpath={LOGIN_SUBMIT_XPATH}")
+
+
+async def set_per_page(page, number: int):
+    """设置每页显示的帖子数量（与 set_maxpage.set 相同的流程）"""
+    await page.goto(SETTINGS_URL)
+    await page.fill(f"xpath={PER_PAGE_XPATH}", str(number))
+    await page.click(f"xpath={SETTINGS_SUBMIT_XPATH}")
+    await page.wait_for_load_state("networkidle")
+
+
+async def download(page, url: str, download_dir: str, timeout: float = TIMEOUT) -> str:
+    """
+    在页面中打开下载链接并保存下载的文件。
+
+    Returns:
+        保存后的文件路径
+    """
+    async with page.expect_download(timeout=timeout * 1000) as download_info:
+        try:
+            await page.goto(url)
+        except PlaywrightError as e:
+            # 直接打开下载链接时导航会被中断（"Download is starting"），属于正常情况
+            if "Download is starting" not in str(e) and "net::ERR_ABORTED" not in str(e):
+                raise
+    downloaded = await download_info.value
+    save_path = storage_layout.stored_path(download_dir, downloaded.suggested_filename)
+    os.makedirs(os.path.dirname(save_path), exist_ok=True)
+    await downloaded.save_as(save_path)
+    return save_path
+
+
+class PlaywrightEngine:
+    """一个浏览器进程 + 多个上下文，作为异步上下文管理器使用"""
+
+    def __init__(self, contexts: int = PW_CONTEXTS, headless: bool = HEADLESS):
+        """
+        Args:
+            contexts: 上下文数量
+            headless: 是否使用无头模式
+        """
+        if async_playwright is None:
+            raise RuntimeError("未安装 playwright，请先 pip install playwright 并执行 playwright install")
+        self.context_count = contexts
+        self.headless = headless
+        self.playwright = None
+        self.browser = None
+        self.contexts = []
+
+    async def __aenter__(self):
+        self.playwright = await async_playwright().start()
+        self.browser = await self.playwright.chromium.launch(headless=self.headless)
+        return self
+
+    async def __aexit__(self, *exc):
+        for context in self.contexts:
+            await context.close()
+        if self.browser is not None:
+            await self.browser.close()
+        if self.playwright is not None:
+            await self.playwright.stop()
+
+    async def open_contexts(self, username: str | None = None, password: str | None = None,
+                            per_page: int | None = None) -> list:
+        """
+        创建所有上下文：在第一个上下文中通过验证（并登录、设置每页数量），
+        其余上下文复制它的 Cookies。
+
+        Returns:
+            每个上下文各一个页面
+        """
+        first = await self.browser.new_context(accept_downloads=True)
+        self.contexts.append(first)
+        page = await first.new_page()
+        await pass_cloudflare(page)
+        if username:
+            await login(page, username, password)
+        if per_page:
+            await set_per_page(page, per_page)
+        state = await first.storage_state()
+
+        pages = [page]
+        for _ in range(self.context_count - 1):
+            context = await self.browser.new_context(accept_downloads=True, storage_state=state)
+            self.contexts.append(context)
+            pages.append(await context.new_page())
+        print(f"✅ 已创建 {len(pages)} 个浏览器上下文")
+        return pages
+
+    async def download_all(self, pages: list, items: list[tuple[str, str]], download_dir: str,
+                           max_retry: int = MAX_RETRY) -> tuple[int, int]:
+        """
+        每个页面一个协程，从同一个队列领取任务并发下载。
+
+        Args:
+            pages: open_contexts 返回的页面
+            items: (url, post_id) 列表
+            download_dir: 下载目录
+            max_retry: 每张图片的最大重试次数
+
+        Returns:
+            (成功数, 失败数)
+        """
+        tasks = asyncio.Queue()
+        for index, (url, post_id) in enumerate(items, 1):
+            tasks.put_nowait((url, post_id, index))
+        counts = {"success": 0, "failed": 0}
+        total = len(items)
+
+        async def worker(page):
+            while not tasks.empty():
+                url, post_id, index = tasks.get_nowait()
+                for attempt in range(1, max_retry + 1):
+                    try:
+                        if attempt > 1:
+                            # 重试前重新通过验证，Cookies 只影响当前上下文
+                            await pass_cloudflare(page)
+                        save_path = await download(page, url, download_dir)
+                        mark_as_downloaded(download_dir, post_id)
+                        counts["success"] += 1
+                        print(f"✅ [{index}/{total}] 下载完成: {os.path.basename(save_path)}")
+                        break
+                    except Exception as e:
+                        print(f"❌ [{index}/{total}] 下载失败 (尝试 {attempt}/{max_retry}): {str(e)[:80]}")
+                else:
+                    counts["failed"] += 1
+
+        await asyncio.gather(*(worker(page) for page in pages))
+        return counts["success"], counts["failed"]
+
+
+async def run(items: list[tuple[str, str]], download_dir: str, contexts: int = PW_CONTEXTS) -> tuple[int, int]:
+    async with PlaywrightEngine(contexts) as engine:
+        pages = await engine.open_contexts()
+        return await engine.download_all(pages, items, download_dir)
+
+
+def main():
+    if not os.path.exists(DOWNLOAD_DIRECTORY):
+        os.makedirs(DOWNLOAD_DIRECTORY)
+        print(f"📁 创建下载目录: {DOWNLOAD_DIRECTORY}")
+
+    urls = read_download_urls(FILENAME)
+    pending = []
+    skip_count = 0
+    for target_url in urls:
+        post_id = extract_post_id_from_url(target_url)
+        if not post_id or check_file_exists(DOWNLOAD_DIRECTORY, post_id)[0]:
+            skip_count += 1
+            continue
+        pending.append((target_url, post_id))
+
+    if not pending:
+        print("❌ 没有需要下载的 URL，程序结束。")
+        return
+
+    print(f"\n{'='*60}")
+    print(f"使用 {PW_CONTEXTS} 个 Playwright 上下文下载 {len(pending)} 个文件到: {DOWNLOAD_DIRECTORY}")
+    print(f"{'='*60}")
+
+    try:
+        success_count, fail_count = asyncio.run(run(pending, DOWNLOAD_DIRECTORY))
+    except KeyboardInterrupt:
+        print("\n\n⚠️ 用户中断下载")
+        return
+
+    print(f"\n{'='*60}")
+    print(f"📊 下载统计:")
+    print(f"   ✅ 成功: {success_count} 个")
+    print(f"   🟢 跳过: {skip_count} 个")
+    print(f"   ❌ 失败: {fail_count} 个")
+    print(f"   📝 总计: {len(urls)} 个")
+    print(f"{'='*60}")
+
+
+if __name__ == "__main__":
+    main()
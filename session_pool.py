@@ -0,0 +1,149 @@
+"""
+线程安全的 Session 池：每个并发任务借出一个保持连接的 Session，用完归还。
+
+- 池大小与并发数一致，每个 Session 在同一时间只被一个线程使用；
+- prewarm() 预先建立所有 Session 并打开到站点的连接，第一批请求不必等握手；
+- 凭据刷新后（ClearanceManager.subscribe）新的 Cookies / 请求头在下次借出时同步到每个 Session；
+- 连续多次遇到验证页的 Session 视为已失效，归还时关闭并重建。
+
+用法：
+    with pool.session() as session:
+        resp = session.get(url)
+        pool.report(session, ok=not is_challenge_response(resp))
+"""
+
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import requests
+from requests.adapters import HTTPAdapter
+
+POISON_THRESHOLD = 3  # 连续多少次遇到验证页后重建 Session
+HOSTS_PER_SESSION = 4  # 每个 Session 可能访问的域名数（站点、API、图片服务器等）
+CONNECTIONS_PER_HOST = 2  # 每个域名保持的连接数（Session 同一时间只有一个请求，留一个余量给重定向）
+PREWARM_TIMEOUT = 10  # 预热请求的超时（秒）
+
+
+def tune_session(session: requests.Session) -> requests.Session:
+    """
+    按池的用法调整 Session 的连接池大小。
+
+    直接重建已挂载适配器的连接池，而不是换成新的 HTTPAdapter，
+    这样 cloudscraper 自带的 TLS 设置（CipherSuiteAdapter）不会丢失。
+    """
+    for adapter in session.adapters.values():
+        if isinstance(adapter, HTTPAdapter):
+            adapter.init_poolmanager(HOSTS_PER_SESSION, CONNECTIONS_PER_HOST)
+    return session
+
+
+def apply_clearance(session: requests.Session, clearance: dict):
+    """把凭据（Cookies + 请求头）写入 Session"""
+    for cookie in clearance["cookies"]:
+        session.cookies.set(cookie['name'], cookie['value'], domain=cookie.get('domain', ''))
+    session.headers.update(clearance["headers"])
+
+
+class SessionPool:
+    """固定大小、按需创建的 Session 池"""
+
+    def __init__(self, factory, size: int, poison_threshold: int = POISON_THRESHOLD):
+        """
+        Args:
+            factory: 创建新 Session 的函数 factory() -> requests.Session
+            size: 池大小，应与使用它的并发数一致
+            poison_threshold: 连续遇到验证页多少次后重建 Session
+        """
+        self.factory = factory
+        self.size = max(1, size)
+        self.poison_threshold = poison_threshold
+        self._idle = queue.LifoQueue()  # 后进先出，优先复用连接仍然热的 Session
+        self._lock = threading.Lock()
+        self._created = 0
+        self._strikes = {}  # id(session) -> 连续失败次数
+        self._generations = {}  # id(session) -> 已同步的凭据版本
+        self._clearance = None
+        self._generation = 0
+        self.retired = 0
+
+    def _new_session(self) -> requests.Session:
+        session = self.factory()
+        self._strikes[id(session)] = 0
+        self._generations[id(session)] = 0
+        return session
+
+    def checkout(self) -> requests.Session:
+        """借出一个 Session；池中没有空闲且已达上限时阻塞等待归还"""
+        try:
+            session = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                create = self._created < self.size
+                if create:
+                    self._created += 1
+            session = self._new_session() if create else self._idle.get()
+
+        with self._lock:
+            clearance, generation = self._clearance, self._generation
+        if clearance is not None and self._generations.get(id(session)) != generation:
+            apply_clearance(session, clearance)
+            self._generations[id(session)] = generation
+        return session
+
+    def checkin(self, session: requests.Session):
+        """归还 Session；已失效的 Session 关闭后换成新的"""
+        if self._strikes.get(id(session), 0) >= self.poison_threshold:
+            print(f"♻️ Session 连续 {self._strikes[id(session)]} 次遇到验证页，重建")
+            self._strikes.pop(id(session), None)
+            self._generations.pop(id(session), None)
+            session.close()
+            self.retired += 1
+            session = self._new_session()
+        self._idle.put(session)
+
+    @contextmanager
+    def session(self):
+        """借出一个 Session，退出时归还"""
+        session = self.checkout()
+        try:
+            yield session
+        finally:
+            self.checkin(session)
+
+    def report(self, session: requests.Session, ok: bool):
+        """报告本次请求是否正常（False 表示遇到了验证页）"""
+        if ok:
+            self._strikes[id(session)] = 0
+        else:
+            self._strikes[id(session)] = self._strikes.get(id(session), 0) + 1
+
+    def set_clearance(self, clearance: dict):
+        """更新凭据，各 Session 在下次借出时同步（可直接作为 ClearanceManager.subscribe 的回调）"""
+        with self._lock:
+            self._clearance = clearance
+            self._generation += 1
+
+    def prewarm(self, url: str):
+        """创建全部 Session 并各自请求一次 url，提前建立连接"""
+        sessions = [self.checkout() for _ in range(self.size)]
+
+        def warm(session: requests.Session):
+            try:
+                session.head(url, timeout=PREWARM_TIMEOUT)
+            except Exception as e:
+                print(f"⚠️ 预热连接失败: {e}")
+
+        with ThreadPoolExecutor(max_workers=self.size) as executor:
+            list(executor.map(warm, sessions))
+        for session in sessions:
+            self.checkin(session)
+
+    def close(self):
+        """关闭所有空闲的 Session"""
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
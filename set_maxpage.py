@@ -1,17 +1,17 @@
-import time
-import random
 from selenium.webdriver.common.by import By
+import waits
+
+SETTINGS_URL = "https://anime-pictures.net/settings"
 
 def set(driver,number):
-    time.sleep(random.uniform(1, 2))
-    driver.get("https://anime-pictures.net/settings")
-    time.sleep(random.uniform(1,2))
-    input = driver.find_element(By.XPATH,"//*[@id=\"svelte\"]/div/div[1]/div[1]/div/div[2]/div[2]/table/tbody/tr[6]/td[2]/input")
-    time.sleep(random.uniform(1, 2))
+    # 礼貌间隔只加在页面跳转前，填写表单的各步之间只等元素就绪
+    waits.pace()
+    driver.get(SETTINGS_URL)
+    input = waits.wait_for_element(driver,(By.XPATH,"//*[@id=\"svelte\"]/div/div[1]/div[1]/div/div[2]/div[2]/table/tbody/tr[6]/td[2]/input"))
     input.clear()
-    time.sleep(random.uniform(1, 2))
     input.send_keys(number)
-    time.sleep(random.uniform(1,2))
-    target = driver.find_element(By.XPATH,"//*[@id=\"svelte\"]/div/div[1]/div[1]/div/div[2]/div[2]/input")
+    target = waits.wait_for_element(driver,(By.XPATH,"//*[@id=\"svelte\"]/div/div[1]/div[1]/div/div[2]/div[2]/input"),clickable=True)
     target.location_once_scrolled_into_view
-    target.click()
\ No newline at end of file
+    target.click()
+    # 等待设置保存请求完成
+    waits.wait_for_network_idle(driver)
\ No newline at end of file
@@ -0,0 +1,114 @@
+"""
+按图片大小分道下载：超大原图走并发数很少的“大图道”，其余图片走宽的“小图道”，
+一张 60 MB 的原图不会挡住后面一串小图，同时限制同时进行的大文件传输数（连接数和磁盘写入）。
+
+图片大小按 URL 中的尺寸估计（如 888175-5403x7641-...jpg）；URL 中没有尺寸时用 HEAD 请求的 Content-Length。
+大图道按估计大小从大到小下载，最大的文件最先开始，整体完成时间最短。
+"""
+
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import unquote, urlparse
+
+SIZE_LANES = True  # http 模式下是否按大小分道下载
+LARGE_BYTES = 24 * 1024 * 1024  # 估计大小超过该值视为大图（约 2000 万像素）
+BYTES_PER_PIXEL = 1.2  # 由像素数估计文件大小时使用（原图多为高质量 JPEG / PNG）
+LARGE_LANE_WORKERS = 2  # 大图道的并发数
+HEAD_TIMEOUT = 10  # HEAD 请求的超时（秒）
+
+DIMENSION_PATTERN = re.compile(r'\d+-(\d+)x(\d+)')
+
+
+def dimensions_from_url(url: str) -> tuple[int, int] | None:
+    """从下载 URL 的文件名中取出 (宽, 高)"""
+    match = DIMENSION_PATTERN.search(unquote(os.path.basename(urlparse(url).path)))
+    if match:
+        return int(match.group(1)), int(match.group(2))
+    return None
+
+
+def head_size(pool, url: str) -> int | None:
+    """用 HEAD 请求取得文件大小，失败时返回 None"""
+    try:
+        with pool.sessions.session() as session:
+            response = session.head(url, allow_redirects=True, timeout=HEAD_TIMEOUT)
+        length = response.headers.get('Content-Length')
+        return int(length) if response.ok and length else None
+    except Exception as e:
+        print(f"⚠️ HEAD 请求失败: {e}")
+        return None
+
+
+def estimate_sizes(pool, items: list[tuple[str, str]]) -> list[int | None]:
+    """估计每张图片的字节数（URL 中的尺寸优先，没有时并行发 HEAD 请求）"""
+    sizes = []
+    missing = []
+    for i, (url, _) in enumerate(items):
+        dimensions = dimensions_from_url(url)
+        if dimensions:
+            sizes.append(int(dimensions[0] * dimensions[1] * BYTES_PER_PIXEL))
+        else:
+            sizes.append(None)
+            missing.append(i)
+    if missing:
+        print(f"📏 {len(missing)} 个链接中没有尺寸，使用 HEAD 请求获取大小...")
+        with ThreadPoolExecutor(max_workers=pool.workers) as executor:
+            for i, size in zip(missing, executor.map(lambda i: head_size(pool, items[i][0]), missing)):
+                sizes[i] = size
+    return sizes
+
+
+def split_lanes(pool, items: list[tuple[str, str]]) -> tuple[list[tuple[str, str]], list[tuple[str, str]]]:
+    """
+    把下载任务分成大图道和小图道。
+
+    Returns:
+        (大图列表（从大到小）, 小图列表（保持原顺序）)
+    """
+    large = []
+    small = []
+    for item, size in zip(items, estimate_sizes(pool, items)):
+        if size is not None and size > LARGE_BYTES:
+            large.append((size, item))
+        else:
+            small.append(item)
+    large.sort(key=lambda pair: pair[0], reverse=True)
+    return [item for _, item in large], small
+
+
+def download_by_size(pool, items: list[tuple[str, str]], on_success=None,
+                     large_workers: int = LARGE_LANE_WORKERS) -> tuple[int, int]:
+    """
+    用 HttpDownloadPool 分两道并行下载，接口与 HttpDownloadPool.download_all 相同。
+
+    两道共用 pool 的 Session 池和自适应并发控制器，总并发数不超过 pool.workers。
+
+    Args:
+        pool: HttpDownloadPool
+        items: (url, post_id) 列表
+        on_success: 每张下载成功后的回调 on_success(post_id)，在工作线程中调用
+        large_workers: 大图道的并发数
+
+    Returns:
+        (成功数, 失败数)
+    """
+    large, small = split_lanes(pool, items)
+    large_workers = max(1, min(large_workers, pool.workers - 1))
+    small_workers = max(1, pool.workers - large_workers)
+    print(f"🚦 分道下载: 大图 {len(large)} 张（{large_workers} 路），小图 {len(small)} 张（{small_workers} 路）")
+
+    def task(item: tuple[str, str]) -> bool:
+        url, post_id = item
+        ok = pool.download(url, post_id)
+        if ok and on_success:
+            on_success(post_id)
+        return ok
+
+    with ThreadPoolExecutor(max_workers=large_workers, thread_name_prefix="lane-large") as large_lane, \
+            ThreadPoolExecutor(max_workers=small_workers, thread_name_prefix="lane-small") as small_lane:
+        futures = [large_lane.submit(task, item) for item in large]
+        futures += [small_lane.submit(task, item) for item in small]
+        results = [future.result() for future in futures]
+    success = sum(results)
+    return success, len(results) - success
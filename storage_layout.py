@@ -0,0 +1,143 @@
+"""
+下载目录的分片布局：图片按帖子 ID 的哈希存放到两级子目录，例如 3f/a2/ANIME-PICTURES.NET_-_885356-...jpg。
+
+单个目录超过十万个文件后，列目录、查找和创建文件都会明显变慢。
+分片后每个子目录只有少量文件，查找某个帖子只需访问它所在的那一个子目录；
+下载目录的根目录只作为浏览器的落地目录，里面只有正在下载或刚下载完的文件。
+
+默认仍为平铺布局（SHARDED_LAYOUT = False），两种布局可以共存：
+查找时先看分片位置，再看根目录。已有的平铺目录可以用 migrate() 原地迁移：
+    python storage_layout.py [下载目录]
+"""
+
+import hashlib
+import os
+import re
+import sys
+
+from download_watcher import post_id_from_filename
+
+SHARDED_LAYOUT = False  # 是否把下载完成的图片放到分片子目录
+SHARD_LEVELS = 2  # 子目录层数
+SHARD_WIDTH = 2  # 每层目录名的十六进制位数（2 位即每层 256 个目录）
+MIGRATE_DIRECTORY = r"D:\VsCodeProjects\Dataset\2Dimages"  # 未指定参数时迁移的目录
+
+_SHARD_NAME = re.compile(rf'[0-9a-f]{{{SHARD_WIDTH}}}')
+
+
+def shard_of(post_id: str) -> str:
+    """帖子 ID 对应的分片子目录（相对路径），例如 3f/a2"""
+    digest = hashlib.md5(str(post_id).encode("ascii")).hexdigest()
+    return os.path.join(*(digest[i * SHARD_WIDTH:(i + 1) * SHARD_WIDTH] for i in range(SHARD_LEVELS)))
+
+
+def stored_path(download_dir: str, filename: str, sharded: bool | None = None) -> str:
+    """
+    文件在当前布局下应当存放的位置。
+
+    Args:
+        download_dir: 下载目录
+        filename: 文件名
+        sharded: 是否使用分片布局，默认为 SHARDED_LAYOUT
+    """
+    sharded = SHARDED_LAYOUT if sharded is None else sharded
+    post_id = post_id_from_filename(filename)
+    if sharded and post_id:
+        return os.path.join(download_dir, shard_of(post_id), filename)
+    return os.path.join(download_dir, filename)
+
+
+def find_post(download_dir: str, post_id: str, filename: str | None = None) -> str | None:
+    """
+    查找帖子已下载的文件。
+
+    知道文件名时直接检查分片位置和根目录两个路径；否则只列出帖子所在的那个分片子目录。
+    平铺布局下找不到确切文件名时才退回扫描根目录。
+
+    Returns:
+        文件路径，不存在时返回 None
+    """
+    if filename:
+        for path in (stored_path(download_dir, filename, True), os.path.join(download_dir, filename)):
+            if os.path.exists(path):
+                return path
+
+    shard_dir = os.path.join(download_dir, shard_of(post_id))
+    directories = [shard_dir] if SHARDED_LAYOUT else [shard_dir, download_dir]
+    for directory in directories:
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if post_id_from_filename(entry.name) == post_id:
+                        return entry.path
+        except FileNotFoundError:
+            continue
+    return None
+
+
+def place(download_dir: str, path: str) -> str:
+    """
+    把下载完成的文件移动到它在 download_dir 中应在的位置（同一磁盘上只是重命名）。
+
+    Returns:
+        移动后的路径
+    """
+    target = stored_path(download_dir, os.path.basename(path))
+    if os.path.abspath(target) != os.path.abspath(path):
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.replace(path, target)
+    return target
+
+
+def iter_files(download_dir: str):
+    """遍历两种布局下的所有文件（根目录和分片子目录），产出 os.DirEntry"""
+    def walk(directory: str, depth: int):
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.is_file():
+                    if depth == 0 or depth == SHARD_LEVELS:
+                        yield entry
+                elif depth < SHARD_LEVELS and _SHARD_NAME.fullmatch(entry.name) and entry.is_dir():
+                    yield from walk(entry.path, depth + 1)
+
+    yield from walk(download_dir, 0)
+
+
+def migrate(download_dir: str) -> int:
+    """
+    把平铺目录中的图片原地移动到分片子目录，可中断后重新运行。
+
+    Returns:
+        移动的文件数
+    """
+    moved = 0
+    skipped = 0
+    # 先列出再移动，避免边遍历边修改目录
+    with os.scandir(download_dir) as entries:
+        files = [(entry.name, entry.path) for entry in entries if entry.is_file()]
+    for name, path in files:
+        if not post_id_from_filename(name):
+            skipped += 1
+            continue
+        target = stored_path(download_dir, name, True)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.replace(path, target)
+        moved += 1
+        if moved % 1000 == 0:
+            print(f"  -> 已迁移 {moved} 个文件...")
+    print(f"✅ 迁移完成：移动 {moved} 个文件，{skipped} 个条目保留在根目录")
+    return moved
+
+
+def main():
+    download_dir = sys.argv[1] if len(sys.argv) > 1 else MIGRATE_DIRECTORY
+    if not os.path.isdir(download_dir):
+        print(f"❌ 错误: 目录 '{download_dir}' 不存在。")
+        return
+    print(f"📦 正在把 {download_dir} 迁移为分片布局（{SHARD_LEVELS} 层 × {SHARD_WIDTH} 位）...")
+    migrate(download_dir)
+    print("提示: 迁移后请把 storage_layout.SHARDED_LAYOUT 设为 True")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+字节级流式提取：直接在响应体的字节流上用预编译的字节正则查找，不先把整页解码成 str。
+
+- 跨块边界的匹配：每块扫描后保留末尾 OVERLAP 字节与下一块拼接，
+  碰到缓冲区末尾的匹配（可能还没结束）留到下一块再判断；
+- 只需要一个结果时（详情页的原图链接），找到后立即停止读取：
+  剩余内容不多时读完以便复用连接，否则直接关闭连接。
+"""
+
+import re
+
+DOWNLOAD_URL_BYTES = re.compile(rb'https://api\.anime-pictures\.net/pictures/download_image/[^"]+')
+POST_ID_BYTES = re.compile(rb'href=["\'](?:\.?/)?posts/(\d+)')
+CHUNK_SIZE = 8 * 1024  # 每次从连接读取的字节数
+OVERLAP = 1024  # 块之间保留的字节数，应不小于单个匹配的最大长度
+DRAIN_LIMIT = 16 * 1024  # 找到匹配后剩余内容不超过这么多字节时读完，以便连接放回连接池
+
+
+def iter_matches(chunks, pattern: re.Pattern, overlap: int = OVERLAP):
+    """
+    在字节块序列上逐个产出完整的匹配（re.Match，基于内部缓冲区）。
+
+    Args:
+        chunks: 字节块的可迭代对象
+        pattern: 预编译的字节正则
+        overlap: 块之间保留的字节数
+    """
+    buffer = b""
+    for chunk in chunks:
+        if not chunk:
+            continue
+        buffer += chunk
+        keep_from = max(0, len(buffer) - overlap)
+        for match in pattern.finditer(buffer):
+            if match.end() == len(buffer):
+                # 匹配一直延伸到缓冲区末尾，下一块可能还有后续，从匹配开头保留
+                keep_from = min(keep_from, match.start())
+                break
+            yield match
+            keep_from = max(keep_from, match.end())
+        buffer = buffer[keep_from:]
+    # 数据读完，剩下的匹配都是完整的
+    yield from pattern.finditer(buffer)
+
+
+def find_first(chunks, pattern: re.Pattern, overlap: int = OVERLAP) -> re.Match | None:
+    """返回第一个完整匹配，找到后不再消费 chunks"""
+    return next(iter_matches(chunks, pattern, overlap), None)
+
+
+def extract_download_url(content: bytes) -> str | None:
+    """从详情页（或其前缀）的原始字节中提取原图下载链接"""
+    match = DOWNLOAD_URL_BYTES.search(content)
+    return match.group(0).decode("ascii", errors="replace") if match else None
+
+
+def extract_post_ids(content: bytes) -> list[int]:
+    """从列表页的原始字节中提取所有帖子 ID（与 new_crawler.extract_post_ids 结果相同）"""
+    return [int(post_id) for post_id in POST_ID_BYTES.findall(content)]
+
+
+class PartialResponse:
+    """只读取了前缀的响应，提供 http_cache 和 aimd 用到的 requests.Response 属性"""
+
+    def __init__(self, response, content: bytes, complete: bool):
+        self.url = response.url
+        self.status_code = response.status_code
+        self.headers = response.headers
+        self.encoding = response.encoding
+        self.content = content
+        self.complete = complete  # 是否读到了响应末尾
+        self.from_cache = False
+
+    @property
+    def text(self) -> str:
+        return self.content.decode(self.encoding or "utf-8", errors="replace")
+
+
+def read_until_match(response, pattern: re.Pattern, chunk_size: int = CHUNK_SIZE) -> PartialResponse:
+    """
+    从流式响应（stream=True）中读取，直到 pattern 第一次完整匹配为止。
+
+    非 200 响应（例如验证页）照常读完，供调用方判断状态。
+
+    Returns:
+        内容为已读前缀的 PartialResponse；没有匹配时内容为完整响应体
+    """
+    if response.status_code != 200:
+        content = response.content
+        response.close()
+        return PartialResponse(response, content, True)
+
+    received = []
+    size = 0
+
+    def chunks():
+        nonlocal size
+        for chunk in response.iter_content(chunk_size=chunk_size):
+            received.append(chunk)
+            size += len(chunk)
+            yield chunk
+
+    match = find_first(chunks(), pattern)
+    content = b"".join(received)
+    complete = match is None
+    if match is not None:
+        length = response.headers.get("Content-Length")
+        remaining = int(length) - size if length and "Content-Encoding" not in response.headers else None
+        if remaining is not None and remaining <= DRAIN_LIMIT:
+            # 剩余不多，读完后连接可以复用
+            for _ in response.iter_content(chunk_size=chunk_size):
+                pass
+            complete = True
+    response.close()
+    return PartialResponse(response, content, complete)
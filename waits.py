@@ -0,0 +1,102 @@
+"""
+基于条件的等待：等待 DOM 元素、页面网络空闲或下载完成事件，各自带超时，
+取代浏览器流程中固定的 time.sleep(random.uniform(...))。
+
+另外提供可单独配置的礼貌间隔 PACING_FLOOR：两次页面跳转（打开页面、点进详情页、返回等）之间至少间隔这么久，
+如果等待条件本身已经花了更长时间，就不再额外 sleep。填写表单、点击输入框这类页面内的操作只等元素就绪，不加间隔。
+默认 0.5~1.5 秒；把 PACING_FLOOR 设为 (0, 0) 即可关闭，此时所有等待只取决于页面何时就绪。
+"""
+
+import random
+import threading
+import time
+
+from selenium.common.exceptions import TimeoutException
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.webdriver.support.wait import WebDriverWait
+
+import metrics
+
+DEFAULT_TIMEOUT = 20  # 等待 DOM 条件的默认超时（秒）
+POLL_INTERVAL = 0.1  # 检查条件的间隔（秒）
+NETWORK_IDLE_TIME = 0.5  # 多长时间内没有新请求视为网络空闲（秒）
+NETWORK_IDLE_TIMEOUT = 10  # 等待网络空闲的默认超时（秒）
+PACING_FLOOR = (0.5, 1.5)  # 礼貌间隔的随机范围（秒），模拟人工浏览的节奏；(0, 0) 表示不限制
+
+
+class Pacer:
+    """保证两次操作之间至少间隔一个随机的最短时间"""
+
+    def __init__(self, floor: tuple[float, float] = PACING_FLOOR):
+        self.floor = floor
+        self._last = 0.0
+        self._lock = threading.Lock()
+
+    def pace(self):
+        with self._lock:
+            low, high = self.floor
+            if high > 0:
+                remaining = self._last + random.uniform(low, high) - time.time()
+                if remaining > 0:
+                    metrics.sleep(remaining, reason="pacing")
+            self._last = time.time()
+
+
+pacer = Pacer()
+
+
+def pace():
+    """在每次页面跳转之前调用一次，只补足礼貌间隔中尚未经过的部分（PACING_FLOOR 为 (0, 0) 时不等待）"""
+    pacer.pace()
+
+
+def wait_for(driver, condition, timeout: float = DEFAULT_TIMEOUT):
+    """等待任意 Selenium 条件成立，返回条件的结果；超时抛出 TimeoutException"""
+    return WebDriverWait(driver, timeout, POLL_INTERVAL).until(condition)
+
+
+def wait_for_element(driver, locator: tuple[str, str], timeout: float = DEFAULT_TIMEOUT, clickable: bool = False):
+    """等待元素出现（或可点击）并返回它"""
+    condition = EC.element_to_be_clickable(locator) if clickable else EC.presence_of_element_located(locator)
+    return wait_for(driver, condition, timeout)
+
+
+def wait_for_page_ready(driver, timeout: float = DEFAULT_TIMEOUT):
+    """等待 document.readyState 变为 complete"""
+    wait_for(driver, lambda d: d.execute_script("return document.readyState") == "complete", timeout)
+
+
+def wait_for_network_idle(driver, idle_time: float = NETWORK_IDLE_TIME, timeout: float = NETWORK_IDLE_TIMEOUT) -> bool:
+    """
+    等待页面在 idle_time 秒内没有发起新的资源请求（根据 Performance API 统计）。
+
+    Returns:
+        是否在超时前达到空闲；超时不抛异常，由调用方决定是否继续
+    """
+    script = "return performance.getEntriesByType('resource').length"
+    deadline = time.time() + timeout
+    last_count = driver.execute_script(script)
+    last_change = time.time()
+    while time.time() < deadline:
+        time.sleep(POLL_INTERVAL)
+        count = driver.execute_script(script)
+        if count != last_count:
+            last_count = count
+            last_change = time.time()
+        elif time.time() - last_change >= idle_time:
+            return True
+    return False
+
+
+def wait_for_url_change(driver, old_url: str, timeout: float = DEFAULT_TIMEOUT) -> bool:
+    """等待页面跳转离开 old_url，超时返回 False"""
+    try:
+        wait_for(driver, lambda d: d.current_url != old_url, timeout)
+        return True
+    except TimeoutException:
+        return False
+
+
+def wait_for_download(watcher, post_id: str, timeout: float) -> str | None:
+    """等待下载完成事件（见 download_watcher.DownloadWatcher），返回文件路径，超时返回 None"""
+    return watcher.wait(post_id, timeout)
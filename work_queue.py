@@ -0,0 +1,565 @@
+"""
+分布式爬取的任务队列：把页码范围和下载链接拆成带租约的任务，多个进程 / 多台机器各自领取。
+
+- 任务保存在共享的 SQLite 文件（work_queue.db）中，同一台机器上的多个进程可以直接共用；
+  多台机器时由一台运行 `serve` 提供 HTTP 协调服务，其他机器用 --coordinator 连接
+  （SQLite 不适合放在网络共享盘上）；
+- 领取任务时获得一段时间的租约，工作进程定期续约；进程崩溃后租约过期，任务自动回到队列；
+- 每个任务有唯一的键（列表页为页码、帖子和下载为帖子 ID），重复添加会被忽略；
+- 列表页中没解析出下载链接的帖子单独成为帖子任务，由 crawl 进程逐个重试，不影响同页其他帖子的下载任务；
+  租约过期后被两个进程先后完成的任务只有第一次完成生效，产生的子任务不会重复。
+
+用法：
+    python work_queue.py seed 21 500            # 把第 21~500 页加入队列
+    python work_queue.py crawl                  # 领取列表页 / 帖子任务，解析出的下载链接作为下载任务入队
+    python work_queue.py download               # 领取下载任务并下载（需要浏览器通过验证）
+    python work_queue.py status                 # 查看各类任务的数量
+    python work_queue.py export                 # 把已解析的下载链接写到 download_urls.txt
+    python work_queue.py serve                  # 作为协调服务运行（默认只监听本机）
+    python work_queue.py --token <口令> serve --host 0.0.0.0
+                                                # 供其他机器访问，它们加 --coordinator http://<主机>:8766 --token <口令>
+
+协调服务默认只监听 127.0.0.1；监听其他地址时必须设置共享口令（--token 或环境变量 WORK_QUEUE_TOKEN），
+每个请求都要在 X-Queue-Token 头中带上该口令，否则返回 403。
+"""
+
+import argparse
+import hmac
+import ipaddress
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from download_watcher import post_id_from_filename
+
+QUEUE_FILENAME = "work_queue.db"
+LEASE_SECONDS = 300  # 租约时长（秒），超过后任务可被其他进程领取
+MAX_ATTEMPTS = 5  # 每个任务最多领取几次，超过后标记为失败
+IDLE_WAIT = 10  # 没有可领取的任务时等待多久再试（秒）
+COORDINATOR_HOST = "127.0.0.1"  # 默认只接受本机连接
+COORDINATOR_TOKEN = os.environ.get("WORK_QUEUE_TOKEN") or None  # 协调服务的共享口令
+TOKEN_HEADER = "X-Queue-Token"
+COORDINATOR_PORT = 8766
+COORDINATOR_TIMEOUT = 30  # 访问协调服务的超时（秒）
+
+PAGE = "page"
+POST = "post"  # 列表页中没解析出下载链接、需要单独访问详情页的帖子
+DOWNLOAD = "download"
+
+PENDING = "pending"
+LEASED = "leased"
+DONE = "done"
+FAILED = "failed"
+
+
+def worker_id() -> str:
+    """工作进程的唯一标识：主机名 + 进程号 + 随机后缀"""
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+
+class WorkQueue:
+    """基于 SQLite 的租约任务队列（多进程、多线程安全）"""
+
+    def __init__(self, path: str = QUEUE_FILENAME, lease_seconds: float = LEASE_SECONDS,
+                 max_attempts: int = MAX_ATTEMPTS):
+        """
+        Args:
+            path: SQLite 数据库文件路径
+            lease_seconds: 租约时长（秒）
+            max_attempts: 每个任务最多领取几次
+        """
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        # 自动提交模式，需要原子性的地方显式 BEGIN IMMEDIATE
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS tasks ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, kind TEXT NOT NULL, key TEXT NOT NULL, payload TEXT NOT NULL, "
+            "state TEXT NOT NULL DEFAULT 'pending', attempts INTEGER NOT NULL DEFAULT 0, "
+            "owner TEXT, lease_expires REAL, error TEXT, updated_at REAL, UNIQUE (kind, key))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS tasks_state ON tasks (kind, state, lease_expires)")
+
+    def _transaction(self):
+        """获取写锁的事务（其他进程的写入会等待，不会领到同一个任务）"""
+        return _Transaction(self._conn, self._lock)
+
+    def add(self, kind: str, items: list[tuple[str, dict]]) -> int:
+        """
+        添加任务，键已存在的忽略。
+
+        Args:
+            kind: 任务类型（PAGE / DOWNLOAD）
+            items: (键, 任务内容) 列表
+
+        Returns:
+            新添加的任务数
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            before = conn.total_changes
+            conn.executemany(
+                "INSERT OR IGNORE INTO tasks (kind, key, payload, updated_at) VALUES (?, ?, ?, ?)",
+                [(kind, str(key), json.dumps(payload, ensure_ascii=False), now) for key, payload in items],
+            )
+            return conn.total_changes - before
+
+    def add_pages(self, base_url_template: str, start_page: int, end_page: int) -> int:
+        """把页码范围拆成列表页任务"""
+        return self.add(PAGE, [
+            (f"{base_url_template}#{page}", {"template": base_url_template, "page": page})
+            for page in range(start_page, end_page + 1)
+        ])
+
+    def lease(self, owner: str, kind: str, limit: int = 1) -> list[dict]:
+        """
+        领取最多 limit 个待处理或租约已过期的任务。
+
+        Returns:
+            [{"id", "key", "payload", "attempts"}, ...]
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            rows = conn.execute(
+                "SELECT id, key, payload, attempts FROM tasks WHERE kind = ? AND "
+                "(state = 'pending' OR (state = 'leased' AND lease_expires < ?)) ORDER BY id LIMIT ?",
+                (kind, now, limit),
+            ).fetchall()
+            tasks = []
+            for task_id, key, payload, attempts in rows:
+                if attempts >= self.max_attempts:
+                    conn.execute(
+                        "UPDATE tasks SET state = 'failed', owner = NULL, updated_at = ? WHERE id = ?", (now, task_id)
+                    )
+                    continue
+                conn.execute(
+                    "UPDATE tasks SET state = 'leased', owner = ?, lease_expires = ?, attempts = attempts + 1, "
+                    "updated_at = ? WHERE id = ?",
+                    (owner, now + self.lease_seconds, now, task_id),
+                )
+                tasks.append({"id": task_id, "key": key, "payload": json.loads(payload), "attempts": attempts + 1})
+            return tasks
+
+    def renew(self, owner: str, task_ids: list[int]) -> int:
+        """为仍由自己持有的任务续约，返回续约成功的数量"""
+        if not task_ids:
+            return 0
+        expires = time.time() + self.lease_seconds
+        with self._transaction() as conn:
+            before = conn.total_changes
+            conn.executemany(
+                "UPDATE tasks SET lease_expires = ? WHERE id = ? AND owner = ? AND state = 'leased'",
+                [(expires, task_id, owner) for task_id in task_ids],
+            )
+            return conn.total_changes - before
+
+    def complete(self, owner: str, task_id: int, children: list[tuple[str, str, dict]] = ()) -> bool:
+        """
+        标记任务完成，并在同一事务中添加它产生的子任务。
+
+        租约过期后被其他进程重新领取的任务仍然可以完成，但只有第一次完成生效。
+
+        Args:
+            owner: 工作进程标识
+            task_id: 任务 ID
+            children: 子任务 (类型, 键, 内容) 列表
+
+        Returns:
+            是否为第一次完成（False 表示重复结果，已被忽略）
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            updated = conn.execute(
+                "UPDATE tasks SET state = 'done', owner = ?, error = NULL, updated_at = ? "
+                "WHERE id = ? AND state != 'done'",
+                (owner, now, task_id),
+            ).rowcount
+            if not updated:
+                return False
+            conn.executemany(
+                "INSERT OR IGNORE INTO tasks (kind, key, payload, updated_at) VALUES (?, ?, ?, ?)",
+                [(kind, str(key), json.dumps(payload, ensure_ascii=False), now) for kind, key, payload in children],
+            )
+            return True
+
+    def fail(self, owner: str, task_id: int, error: str):
+        """放弃任务：次数未用完时立即回到队列，否则标记为失败"""
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE tasks SET state = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+                "owner = NULL, lease_expires = NULL, error = ?, updated_at = ? "
+                "WHERE id = ? AND owner = ? AND state = 'leased'",
+                (self.max_attempts, str(error)[:500], time.time(), task_id, owner),
+            )
+
+    def stats(self) -> dict:
+        """{类型: {状态: 数量}}，租约已过期的任务计入 pending"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT kind, CASE WHEN state = 'leased' AND lease_expires < ? THEN 'pending' ELSE state END, "
+                "COUNT(*) FROM tasks GROUP BY 1, 2",
+                (time.time(),),
+            ).fetchall()
+        result = {}
+        for kind, state, count in rows:
+            result.setdefault(kind, {})[state] = count
+        return result
+
+    def payloads(self, kind: str) -> list[dict]:
+        """某类任务的全部内容（按添加顺序）"""
+        with self._lock:
+            rows = self._conn.execute("SELECT payload FROM tasks WHERE kind = ? ORDER BY id", (kind,)).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class _Transaction:
+    def __init__(self, conn: sqlite3.Connection, lock: threading.Lock):
+        self.conn = conn
+        self.lock = lock
+
+    def __enter__(self) -> sqlite3.Connection:
+        self.lock.acquire()
+        try:
+            self.conn.execute("BEGIN IMMEDIATE")
+        except BaseException:
+            self.lock.release()
+            raise
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+        finally:
+            self.lock.release()
+
+
+class RemoteQueue:
+    """通过 HTTP 访问协调服务，接口与 WorkQueue 相同"""
+
+    def __init__(self, base_url: str, token: str | None = COORDINATOR_TOKEN):
+        self.base_url = base_url.rstrip("/")
+        self.session = requests.Session()
+        if token:
+            self.session.headers[TOKEN_HEADER] = token
+
+    def _call(self, method: str, **kwargs):
+        response = self.session.post(f"{self.base_url}/{method}", json=kwargs, timeout=COORDINATOR_TIMEOUT)
+        response.raise_for_status()
+        return response.json()["result"]
+
+    def add(self, kind, items):
+        return self._call("add", kind=kind, items=items)
+
+    def add_pages(self, base_url_template, start_page, end_page):
+        return self._call("add_pages", base_url_template=base_url_template, start_page=start_page, end_page=end_page)
+
+    def lease(self, owner, kind, limit=1):
+        return self._call("lease", owner=owner, kind=kind, limit=limit)
+
+    def renew(self, owner, task_ids):
+        return self._call("renew", owner=owner, task_ids=task_ids)
+
+    def complete(self, owner, task_id, children=()):
+        return self._call("complete", owner=owner, task_id=task_id, children=list(children))
+
+    def fail(self, owner, task_id, error):
+        return self._call("fail", owner=owner, task_id=task_id, error=error)
+
+    def stats(self):
+        return self._call("stats")
+
+    def payloads(self, kind):
+        return self._call("payloads", kind=kind)
+
+    def close(self):
+        self.session.close()
+
+
+REMOTE_METHODS = {"add", "add_pages", "lease", "renew", "complete", "fail", "stats", "payloads"}
+
+
+class CoordinatorHandler(BaseHTTPRequestHandler):
+    queue: WorkQueue = None
+    token: str | None = None
+    protocol_version = "HTTP/1.1"
+    wbufsize = -1
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        method = self.path.strip("/")
+        try:
+            # 先读完请求体，拒绝请求时连接仍可复用
+            data = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            if self.token and not hmac.compare_digest(
+                self.headers.get(TOKEN_HEADER, "").encode("utf-8"), self.token.encode("utf-8")
+            ):
+                raise PermissionError("口令错误")
+            if method not in REMOTE_METHODS:
+                raise ValueError(f"未知方法: {method}")
+            kwargs = json.loads(data or b"{}")
+            body = json.dumps({"result": getattr(self.queue, method)(**kwargs)}).encode("utf-8")
+            status = 200
+        except Exception as e:
+            body = json.dumps({"error": str(e)}, ensure_ascii=False).encode("utf-8")
+            status = 403 if isinstance(e, PermissionError) else 400
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def is_loopback(host: str) -> bool:
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def serve(queue: WorkQueue, host: str = COORDINATOR_HOST, port: int = COORDINATOR_PORT,
+          token: str | None = COORDINATOR_TOKEN):
+    """
+    运行协调服务（阻塞）。
+
+    Args:
+        queue: 本机的 WorkQueue
+        host: 监听地址，不是本机回环地址时必须提供 token
+        port: 端口
+        token: 共享口令，请求头 X-Queue-Token 不一致时返回 403
+    """
+    if not token and not is_loopback(host):
+        raise ValueError(f"监听 {host} 时必须设置共享口令（--token 或环境变量 WORK_QUEUE_TOKEN）")
+    handler = type("Handler", (CoordinatorHandler,), {"queue": queue, "token": token})
+    server = ThreadingHTTPServer((host, port), handler)
+    print(f"🛰️ 协调服务已启动: http://{host}:{port}（Ctrl-C 退出）")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+class LeaseKeeper:
+    """后台线程：定期为当前持有的任务续约"""
+
+    def __init__(self, queue, owner: str, interval: float = LEASE_SECONDS / 3):
+        self.queue = queue
+        self.owner = owner
+        self.interval = interval
+        self.held = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="lease-keeper", daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+    def hold(self, task_ids):
+        with self._lock:
+            self.held.update(task_ids)
+
+    def release(self, task_id: int):
+        with self._lock:
+            self.held.discard(task_id)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            with self._lock:
+                task_ids = list(self.held)
+            try:
+                self.queue.renew(self.owner, task_ids)
+            except Exception as e:
+                print(f"⚠️ 续约失败: {e}")
+
+
+def run_worker(queue, kind: str, handle, batch: int = 1, once: bool = False, more: dict | None = None):
+    """
+    循环领取并处理任务，直到队列中没有该类任务（once=True）或被中断。
+
+    Args:
+        queue: WorkQueue 或 RemoteQueue
+        kind: 任务类型
+        handle: 处理函数 handle(payload) -> 子任务列表，抛出异常表示失败
+        batch: 每次领取的任务数（并行处理）
+        once: 队列暂时为空时是否直接退出，否则等待其他进程产生新任务
+        more: 其他任务类型 -> 处理函数，kind 类任务领完后按顺序领取
+    """
+    handlers = {kind: handle, **(more or {})}
+    owner = worker_id()
+    processed = 0
+    print(f"👷 工作进程 {owner} 开始处理 {kind} 任务")
+
+    def process(task: dict, handle):
+        try:
+            children = handle(task["payload"])
+        except Exception as e:
+            print(f"❌ 任务失败 [{task['key']}] (第 {task['attempts']} 次): {e}")
+            queue.fail(owner, task["id"], str(e))
+            return
+        finally:
+            keeper.release(task["id"])
+        if not queue.complete(owner, task["id"], children or []):
+            print(f"🔁 任务 [{task['key']}] 已由其他进程完成，忽略本次结果")
+
+    with LeaseKeeper(queue, owner) as keeper, ThreadPoolExecutor(max_workers=batch) as executor:
+        while True:
+            for task_kind, task_handle in handlers.items():
+                tasks = queue.lease(owner, task_kind, batch)
+                if tasks:
+                    break
+            if not tasks:
+                if once:
+                    break
+                time.sleep(IDLE_WAIT)
+                continue
+            keeper.hold(task["id"] for task in tasks)
+            list(executor.map(lambda task: process(task, task_handle), tasks))
+            processed += len(tasks)
+    print(f"✅ 工作进程 {owner} 完成 {processed} 个任务")
+
+
+def crawl_page(payload: dict) -> list[tuple[str, str, dict]]:
+    """
+    列表页任务：解析整页的下载链接，每个链接成为一个下载任务（以帖子 ID 去重）。
+
+    列表页请求失败时抛出 RuntimeError，任务回到队列稍后整页重试；
+    没解析出链接的帖子各自成为一个帖子任务（见 resolve_post），已解析的链接照常入队。
+    """
+    import new_crawler
+
+    page_url = payload["template"].format(page=payload["page"])
+    print(f"\n--- 正在处理列表页: {page_url} ---")
+    ids, listing_text = new_crawler.fetch_listing(page_url, strict=True)
+    if not ids:
+        return []
+    urls = new_crawler.resolve_page_urls(ids, page_url, listing_text)
+    children = {}
+    for url in urls:
+        post_id = post_id_from_filename(url)
+        if post_id:
+            children[post_id] = (DOWNLOAD, post_id, {"url": url, "post_id": post_id})
+    missing = [str(post_id) for post_id in ids if str(post_id) not in children]
+    if missing:
+        print(f"⚠️ {len(missing)} 个帖子未解析出下载链接，作为帖子任务单独重试: {', '.join(missing[:10])}")
+    return list(children.values()) + [(POST, post_id, {"post_id": post_id}) for post_id in missing]
+
+
+def resolve_post(payload: dict) -> list[tuple[str, str, dict]]:
+    """帖子任务：访问详情页取得下载链接，取不到时抛出 RuntimeError（次数用完后只有这个帖子标记为失败）"""
+    import new_crawler
+
+    post_id = payload["post_id"]
+    url = new_crawler.fetch_download_url(int(post_id))
+    if not url:
+        raise RuntimeError("详情页中没有下载链接")
+    return [(DOWNLOAD, post_id, {"url": url, "post_id": post_id})]
+
+
+def download_worker(queue, once: bool):
+    """下载任务：浏览器通过验证后用 HTTP 线程池下载"""
+    import my_operator_v2
+    from http_downloader import HttpDownloadPool
+
+    download_dir = my_operator_v2.DOWNLOAD_DIRECTORY
+    os.makedirs(download_dir, exist_ok=True)
+    driver = my_operator_v2.setup_edge_driver(download_dir)
+    try:
+        my_operator_v2.pass_cloudflare(driver)
+        clearance = my_operator_v2.create_clearance_manager(driver)
+        pool = HttpDownloadPool(clearance, download_dir, workers=my_operator_v2.HTTP_WORKERS,
+                                max_retry=my_operator_v2.MAX_RETRY)
+
+        def handle(payload: dict) -> list:
+            post_id = payload["post_id"]
+            if my_operator_v2.check_file_exists(download_dir, post_id)[0]:
+                return []
+            if not pool.download(payload["url"], post_id):
+                raise RuntimeError("下载失败")
+            my_operator_v2.mark_as_downloaded(download_dir, post_id)
+            return []
+
+        run_worker(queue, DOWNLOAD, handle, batch=pool.workers, once=once)
+    finally:
+        driver.quit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="分布式爬取任务队列")
+    parser.add_argument("--db", default=QUEUE_FILENAME, help="SQLite 队列文件（本机共享）")
+    parser.add_argument("--coordinator", help="协调服务地址，例如 http://192.168.1.10:8766")
+    parser.add_argument("--token", default=COORDINATOR_TOKEN, help="协调服务的共享口令（默认取环境变量 WORK_QUEUE_TOKEN）")
+    commands = parser.add_subparsers(dest="command", required=True)
+    seed = commands.add_parser("seed", help="把页码范围加入队列")
+    seed.add_argument("start_page", type=int)
+    seed.add_argument("end_page", type=int)
+    seed.add_argument("--template", help="列表页 URL 模板，默认为 new_crawler.BASE_URL_TEMPLATE")
+    for name in ("crawl", "download"):
+        worker = commands.add_parser(name, help=f"领取 {name} 任务")
+        worker.add_argument("--once", action="store_true", help="队列为空时退出，而不是等待新任务")
+    commands.add_parser("status", help="查看任务数量")
+    commands.add_parser("export", help="把下载链接写到 download_urls.txt")
+    serve_parser = commands.add_parser("serve", help="运行协调服务")
+    serve_parser.add_argument("--host", default=COORDINATOR_HOST, help="监听地址，供其他机器访问时用 0.0.0.0（需要 --token）")
+    serve_parser.add_argument("--port", type=int, default=COORDINATOR_PORT)
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        if not args.token and not is_loopback(args.host):
+            parser.error(f"监听 {args.host} 时必须设置 --token（或环境变量 WORK_QUEUE_TOKEN）")
+        serve(WorkQueue(args.db), host=args.host, port=args.port, token=args.token)
+        return
+
+    queue = RemoteQueue(args.coordinator, token=args.token) if args.coordinator else WorkQueue(args.db)
+    try:
+        if args.command == "seed":
+            if args.template is None:
+                import new_crawler
+                args.template = new_crawler.BASE_URL_TEMPLATE
+            added = queue.add_pages(args.template, args.start_page, args.end_page)
+            print(f"✅ 已加入 {added} 个列表页任务（重复的页已忽略）")
+        elif args.command == "crawl":
+            run_worker(queue, PAGE, crawl_page, once=args.once, more={POST: resolve_post})
+        elif args.command == "download":
+            download_worker(queue, args.once)
+        elif args.command == "status":
+            for kind, states in sorted(queue.stats().items()):
+                print(f"{kind:<10}" + "  ".join(f"{state}: {count}" for state, count in sorted(states.items())))
+        elif args.command == "export":
+            from new_crawler import OUTPUT_FILENAME
+            urls = [payload["url"] for payload in queue.payloads(DOWNLOAD)]
+            with open(OUTPUT_FILENAME, 'w', encoding='utf-8') as f:
+                f.writelines(url + '\n' for url in urls)
+            print(f"🔗 已把 {len(urls)} 个下载链接写到 {OUTPUT_FILENAME}")
+    except KeyboardInterrupt:
+        print("\n⚠️ 用户中断，未完成的任务会在租约过期后由其他进程领取")
+    finally:
+        queue.close()
+
+
+if __name__ == "__main__":
+    main()